@@ -0,0 +1,24 @@
+import timeit
+
+from mongoengine import connect
+
+from util.summaries import build_summaries
+
+loc = {'host': '127.0.0.1',
+       'port': 27017,
+       'db': 'smartshark',
+       'username': 'root',
+       'password': '',
+       'authentication_source': 'smartshark',
+       'connect': False}
+connect(**loc)
+
+
+def main():
+    start = timeit.default_timer()
+    done = build_summaries()
+    end = timeit.default_timer() - start
+    print('finished {} summaries in {:.5f}'.format(done, end))
+
+if __name__ == '__main__':
+    main()
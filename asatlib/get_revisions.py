@@ -6,8 +6,10 @@ from mongoengine import connect
 
 from pycoshark.mongomodels import Project, VCSSystem
 
-from util.path import get_commit_path
-from util.asat_extraction import buildfile_changes
+from util.path import get_commit_path, get_commit_path_git
+from util.asat_extraction import buildfile_changes, buildfile_changes_git, compare_buildfile_changes
+from util.projects import PROJECTS
+from util.runner import run_projects
 
 loc = {'host': '127.0.0.1',
        'port': 27017,
@@ -18,80 +20,46 @@ loc = {'host': '127.0.0.1',
        'connect': False}
 connect(**loc)
 
+# number of projects extracted in parallel, every project runs in its own process with its own MongoDB connection
+PROCESSES = 1
 
-def main():
-    full = [
-        ('commons-bcel', None),
-        ('commons-vfs', None),
-        ('commons-jcs', None),
-        ('commons-beanutils', None),
-        ('commons-codec', None),
-        ('commons-collections', None),
-        ('commons-compress', None),
-        ('commons-configuration', None),
-        ('commons-dbcp', None),
-        ('commons-digester', None),
-        ('commons-imaging', None),
-        ('commons-io', None),
-        ('commons-jexl', None),
-        ('commons-lang', None),
-        ('commons-math', 'c4218b83851c8dba1f275e3095913d9636aa5000'),
-        ('commons-net', None),
-        ('commons-rdf', None),
-        ('commons-scxml', None),
-        ('commons-validator', None),
-        ('falcon', None),
-        ('jspwiki', None),
-        ('kylin', None),
-        ('mahout', None),
-        ('pdfbox', None),
-        ('ranger', None),
-        ('struts', None),
-        ('systemml', None),
-        ('tez', None),
-        ('tika', None),
-        ('wss4j', None),
-        ('eagle', None),
-        ('cayenne', None),
-        ('opennlp', None),
-        ('calcite', None),
-        ('zeppelin', None),
-        ('flume', None),
-        ('parquet-mr', None),
-        ('storm', None),
-        ('lens', None),
-        ('knox', None),
-        ('giraph', None),
-        ('gora', None),
-        ('helix', None),
-        ('archiva', None),
-        ('santuario-java', None),
-        ('phoenix', None),
-        ('manifoldcf', None),
-        ('httpcomponents-client', None),
-        ('httpcomponents-core', None),
-        ('streams', None),
-        ('mina-sshd', None),
-        ('roller', None),
-        ('jena', None),
-        ('nifi', None),
-    ]
-
-    for project_name, last_commit in full:
-        start = timeit.default_timer()
-        print(project_name, end=' ')
-
-        project = Project.objects.get(name=project_name)
-        vcs_system = VCSSystem.objects.get(project_id=project.id)
+# 'mongodb' derives the commit path from the SmartSHARK commits, 'git' reads it from the repositories in ../repos
+COMMIT_PATH_BACKEND = 'mongodb'
+
+# same for the buildfile changes, 'verify' runs both and reports differences
+BUILDFILE_CHANGES_BACKEND = 'mongodb'
+
+
+def extract(project_name, last_commit):
+    """Extract the commit path and the buildfile changes of the project."""
+    start = timeit.default_timer()
+    print(project_name, end=' ')
+
+    project = Project.objects.get(name=project_name)
+    vcs_system = VCSSystem.objects.get(project_id=project.id)
+    if COMMIT_PATH_BACKEND == 'git':
+        revisions = get_commit_path_git('../repos/{}'.format(project_name), last_commit=last_commit)
+    else:
         revisions = get_commit_path(vcs_system.id, last_commit=last_commit)
 
+    if BUILDFILE_CHANGES_BACKEND == 'git':
+        changed_revisions = buildfile_changes_git('../repos/{}'.format(project_name), revisions)
+    else:
         changed_revisions = buildfile_changes(vcs_system, revisions)
 
-        pickle.dump(revisions, open('./data/{}_revisions.pickle'.format(project_name), 'wb'))
-        pickle.dump(changed_revisions, open('./data/{}_buildfile_changes.pickle'.format(project_name), 'wb'))
+    if BUILDFILE_CHANGES_BACKEND == 'verify':
+        for difference in compare_buildfile_changes(changed_revisions, buildfile_changes_git('../repos/{}'.format(project_name), revisions)):
+            print('[{}] buildfile changes git: {}'.format(project_name, difference))
 
-        end = timeit.default_timer() - start
-        print('finished {} in {:.5f}'.format(project_name, end))
+    pickle.dump(revisions, open('./data/{}_revisions.pickle'.format(project_name), 'wb'))
+    pickle.dump(changed_revisions, open('./data/{}_buildfile_changes.pickle'.format(project_name), 'wb'))
+
+    end = timeit.default_timer() - start
+    print('finished {} in {:.5f}'.format(project_name, end))
+
+
+def main():
+    run_projects(extract, PROJECTS, processes=PROCESSES, connection=loc, stage='revisions')
 
 if __name__ == '__main__':
     main()
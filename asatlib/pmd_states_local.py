@@ -5,155 +5,396 @@ import subprocess
 import copy
 import timeit
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
 from util.buildfile import PomPom, MavenError
+from util import pom_resolver
+from util.projects import PROJECTS
+from util.runner import run_projects, split_contiguous
+from util.pom_cache import EffectivePomCache
+from util.maven_repository import project_repository, is_seeded, seed_digest, seed_repository
+from util.worktrees import ensure_worktrees, worktree_repository, PathRewrite
+from util.materialize import BuildfileTree, scratch_path
+from util.git import GitError
+from util.path_index import PathIndex
+from util.parent_fixups import ParentFixups, print_run_stats
 
-def get_states(project_name, revisions):
-    path = '../repos/{}'.format(project_name)
+# number of projects extracted in parallel, every project uses its own repository in ../repos
+PROCESSES = 1
 
-    old_states = {}
+# number of git worktrees per project (../worktrees) whose effective POMs are created concurrently
+POM_WORKTREES = 1
 
-    final_states = []
-    error_states = []
-    debug_output = []
-    for (revision_hash, buildfiles) in revisions:
+# reuse effective POM results of identical buildfiles from ./data/effective_pom_cache
+USE_POM_CACHE = False
+POM_CACHE = EffectivePomCache()
+
+# write only the buildfiles of each revision into a scratch directory (../materialized) instead of git checkout -f of the repository
+MATERIALIZE_BUILDFILES = False
+
+# replace the parent of the main pom.xml before the first Maven run if the same parent needed a replacement before (./data/parent_fixups.json)
+USE_PARENT_FIXUPS = False
+PARENT_FIXUPS = ParentFixups()
+
+# seed the project local Maven repositories (../maven_repositories) before the extraction, this needs network access
+SEED_MAVEN_REPOSITORY = False
+
+# run Maven offline (-o) against the seeded project local repository instead of updating from remote repositories (-U)
+MAVEN_OFFLINE = False
+
+# how the effective POM is created: 'maven' (mvn help:effective-pom), 'python' (util.pom_resolver, Maven only if the POM is
+# not supported) or 'compare' (both, the states that differ are written to ./data/{project}_pom_resolver_diff.csv)
+EFFECTIVE_POM_BACKEND = 'maven'
+RESOLVER_STATS = {'resolved': 0, 'fallback': 0, 'differences': 0}
+RESOLVER_STATS_LOCK = threading.Lock()
+
+
+def count_resolver(counter):
+    """Count a resolver outcome, the worktrees of a project create effective POMs from multiple threads."""
+    with RESOLVER_STATS_LOCK:
+        RESOLVER_STATS[counter] += 1
+
+
+def local_repository(p):
+    """Return the Maven repository the effective POM of the PomPom is created with."""
+    if p.local_repository:
+        return p.local_repository
+    return pom_resolver.LOCAL_REPOSITORY
+
+
+def create_pompom(path, project_name, revision_hash, repository=None):
+    """Return the PomPom of the revision, repository is the local Maven repository if Maven runs online (None for ~/.m2)."""
+    if MAVEN_OFFLINE:
+        p = PomPom(path, project_name, revision_hash, local_repository=project_repository(project_name), offline=True)
+    else:
+        p = PomPom(path, project_name, revision_hash, local_repository=repository)
+    if USE_PARENT_FIXUPS:
+        p.parent_fixups = PARENT_FIXUPS
+    return p
+
+
+def cache_variant(p):
+    """Return the variant of the effective POM cache entries of the PomPom.
+
+    Offline results depend on the seeded repository, an error of an incompletely seeded repository must not be replayed after
+    seeding it again or in online runs.
+    """
+    variant = None if EFFECTIVE_POM_BACKEND == 'maven' else EFFECTIVE_POM_BACKEND
+    if MAVEN_OFFLINE:
+        variant = {'backend': variant, 'offline': True, 'repository': p.local_repository, 'seeded': seed_digest(p.project_name)}
+    return variant
 
+
+def create_effective_pom(p):
+    """Return the effective POM output and replacements of the PomPom with the configured backend."""
+    if EFFECTIVE_POM_BACKEND == 'python':
         try:
-            # if this fails it is critical
+            result = pom_resolver.create_effective_pom(p.basedir, local_repository=local_repository(p))
+            count_resolver('resolved')
+            return result
+        except pom_resolver.ResolutionError as e:
+            print('[{}] fallback to maven ({})'.format(p.revision_hash, e))
+            count_resolver('fallback')
+    return p.create_effective_pom()
+
+
+def compare_backends(p, states, rewrite=None):
+    """Return one row per state key of the effective POMs of the PomPom that differs between the resolver and Maven."""
+    revision_hash = p.revision_hash
+    try:
+        output, _ = pom_resolver.create_effective_pom(p.basedir, local_repository=local_repository(p))
+    except pom_resolver.ResolutionError as e:
+        count_resolver('fallback')
+        return [{'revision': revision_hash, 'pom': None, 'key': 'unsupported', 'maven': None, 'python': str(e)}]
+    count_resolver('resolved')
+    if rewrite:
+        output = rewrite(output)
+    # a copy because the constructor would add the custom POM path to the basedir again
+    resolver_pom = copy.copy(p)
+    resolver_pom.poms = {}
+    resolver_pom.ruleset_files = {}
+    resolved = resolver_pom.parse_effective_pom(output)
+
+    rows = []
+    for name in sorted(set(states.keys()) | set(resolved.keys())):
+        maven_state = states.get(name, {})
+        python_state = resolved.get(name, {})
+        for key in sorted(set(maven_state.keys()) | set(python_state.keys())):
+            if maven_state.get(key) != python_state.get(key):
+                rows.append({'revision': revision_hash, 'pom': name, 'key': key, 'maven': maven_state.get(key), 'python': python_state.get(key)})
+    if rows:
+        count_resolver('differences')
+    return rows
+
+
+def evaluate_revision(path, project_name, revision_hash, rewrite=None, tree=None, repository=None):
+    """Checkout the revision in path and return the outcome of its effective POM as dict.
+
+    With a BuildfileTree only the buildfiles of the revision are written to the path of the tree instead.
+    repository is the local Maven repository of online runs, None for ~/.m2.
+    rewrite is applied to the Maven output before it is parsed, the worktrees use it to report the paths of the repository.
+    With USE_POM_CACHE Maven is skipped for buildfiles that were evaluated before, the output of the debug data is None then.
+    With the 'compare' backend the outcome has the differences of the resolver to Maven.
+    """
+    try:
+        # if this fails it is critical
+        if tree is not None:
+            try:
+                tree.checkout(revision_hash)
+            except GitError as e:
+                return {'revision': revision_hash, 'checkout_error': subprocess.CompletedProcess(e.command, 1, b'', e.output.encode('utf-8'))}
+            path = tree.path
+        else:
             r = subprocess.run(['git', 'checkout', revision_hash, '-f'], cwd=path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             if r.returncode != 0:
-                print('error')
-                print(r.stderr)
-                print(r.stdout)
-                break
+                return {'revision': revision_hash, 'checkout_error': r}
+
+        p = create_pompom(path, project_name, revision_hash, repository=repository)
+        if tree is not None:
+            # find_file only sees the materialized files
+            p.path_index = PathIndex(p.checkout_path, tree.blobs.keys())
+        p.preflight_check()
+
+        key = None
+        # a cache hit would skip the comparison
+        if USE_POM_CACHE and EFFECTIVE_POM_BACKEND != 'compare':
+            key = POM_CACHE.fingerprint(path, p, variant=cache_variant(p), repo_path=tree.repo_path if tree is not None else None)
+            entry = POM_CACHE.get(key, p)
+            if entry is not None and 'maven_error' in entry.keys():
+                raise MavenError(entry['maven_error'])
+            if entry is not None:
+                return {'revision': revision_hash, 'output': None, 'replacements': entry['replacements'], 'states': entry['states']}
 
-            p = PomPom(path, project_name, revision_hash)
-            p.preflight_check()
-            output, replacements = p.create_effective_pom()
-            states = p.parse_effective_pom(output)
-
-            if replacements:
-                print('replacements needed: ', replacements)
-
-            if not states:
-                print('[{}] no data in pom'.format(revision_hash))
-
-            if states != old_states:
-                for name, state in states.items():
-                    tmp = copy.deepcopy(state)
-                    tmp['pom'] = name
-                    tmp['revision'] = revision_hash
-
-                    tmp['effective_rules'] = ','.join(tmp['rules'])
-                    tmp['custom_rule_files'] = ','.join(tmp['custom_rule_files'])
-
-                    tmp['file_excludes'] = ','.join(tmp['excludes'])
-                    tmp['file_includes'] = ','.join(tmp['includes'])
-
-                    tmp['root_excludes'] = ','.join(tmp['exclude_roots'])
-
-                    final_states.append(tmp)
-                # print('[{}] changes OK'.format(revision_hash))
-                old_states = states
-            else:
-                pass
-                # print('[{}] no changes OK'.format(revision_hash))
-            debug_output.append((revision_hash, output, states))
-        except OSError as e:
-            print('[{}] OSError ({})'.format(revision_hash, e))
-            error_states.append({'revision': revision_hash, 'error_type': 'OSError', 'line': 'pom.xml not found', 'output': ''})
-        except lxml.etree.XMLSyntaxError as e:
-            print('[{}] XMLSyntax Error'.format(revision_hash))
-            error_states.append({'revision': revision_hash, 'error_type': 'XMLSyntaxError', 'line': str(e), 'output': ''})
+        try:
+            output, replacements = create_effective_pom(p)
         except MavenError as e:
-            print('[{}] Maven Error ({}) "{}"'.format(revision_hash, e.type, e.line))
-            if e.type == 'unknown':
-                print(e.output)
-            error_states.append({'revision': revision_hash, 'error_type': 'MavenError: ' + e.type, 'line': e.line, 'output': e.output})
-        except Exception as e:
-            print('[{}] {}'.format(revision_hash, e))
+            if key is not None:
+                POM_CACHE.put(key, p, maven_error=e)
             raise
-    return final_states, error_states, debug_output
+
+        if rewrite:
+            output = rewrite(output)
+        states = p.parse_effective_pom(output)
+        if key is not None:
+            POM_CACHE.put(key, p, states=states, replacements=replacements)
+        outcome = {'revision': revision_hash, 'output': output, 'replacements': replacements, 'states': states}
+        if EFFECTIVE_POM_BACKEND == 'compare':
+            outcome['differences'] = compare_backends(p, states, rewrite=rewrite)
+        return outcome
+    except OSError as e:
+        return {'revision': revision_hash, 'error': e, 'message': '[{}] OSError ({})'.format(revision_hash, e),
+                'error_state': {'revision': revision_hash, 'error_type': 'OSError', 'line': 'pom.xml not found', 'output': ''}}
+    except lxml.etree.XMLSyntaxError as e:
+        return {'revision': revision_hash, 'error': e, 'message': '[{}] XMLSyntax Error'.format(revision_hash),
+                'error_state': {'revision': revision_hash, 'error_type': 'XMLSyntaxError', 'line': str(e), 'output': ''}}
+    except MavenError as e:
+        return {'revision': revision_hash, 'error': e, 'message': '[{}] Maven Error ({}) "{}"'.format(revision_hash, e.type, e.line),
+                'error_state': {'revision': revision_hash, 'error_type': 'MavenError: ' + e.type, 'line': e.line, 'output': e.output}}
+    except Exception as e:
+        return {'revision': revision_hash, 'exception': e}
+
+
+def collect_states(outcomes):
+    """Return final states, error states, debug output and backend differences of the revision outcomes in revision order.
+
+    The states of a revision are only added if they differ from the states of the previous successful revision.
+    """
+    old_states = {}
+
+    final_states = []
+    error_states = []
+    debug_output = []
+    differences = []
+    for outcome in outcomes:
+        revision_hash = outcome['revision']
+
+        if 'checkout_error' in outcome.keys():
+            print('error')
+            print(outcome['checkout_error'].stderr)
+            print(outcome['checkout_error'].stdout)
+            break
+
+        if 'exception' in outcome.keys():
+            print('[{}] {}'.format(revision_hash, outcome['exception']))
+            raise outcome['exception']
+
+        if 'error' in outcome.keys():
+            print(outcome['message'])
+            if isinstance(outcome['error'], MavenError) and outcome['error'].type == 'unknown':
+                print(outcome['error'].output)
+            error_states.append(outcome['error_state'])
+            continue
+
+        states = outcome['states']
+        differences += outcome.get('differences', [])
+
+        if outcome['replacements']:
+            print('replacements needed: ', outcome['replacements'])
+
+        if not states:
+            print('[{}] no data in pom'.format(revision_hash))
+
+        if states != old_states:
+            for name, state in states.items():
+                tmp = copy.deepcopy(state)
+                tmp['pom'] = name
+                tmp['revision'] = revision_hash
+
+                tmp['effective_rules'] = ','.join(tmp['rules'])
+                tmp['custom_rule_files'] = ','.join(tmp['custom_rule_files'])
+
+                tmp['file_excludes'] = ','.join(tmp['excludes'])
+                tmp['file_includes'] = ','.join(tmp['includes'])
+
+                tmp['root_excludes'] = ','.join(tmp['exclude_roots'])
+
+                final_states.append(tmp)
+            # print('[{}] changes OK'.format(revision_hash))
+            old_states = states
+        else:
+            pass
+            # print('[{}] no changes OK'.format(revision_hash))
+        debug_output.append((revision_hash, outcome['output'], states))
+    return final_states, error_states, debug_output, differences
+
+
+def print_materialized(project_name, tree):
+    print('[{}] materialized buildfiles in {}: {} written, {} removed, {} revisions with file activations written completely'.format(project_name, tree.path, tree.written, tree.removed, tree.full_revisions))
+
+
+def get_states(project_name, revisions):
+    path = '../repos/{}'.format(project_name)
+    if MATERIALIZE_BUILDFILES:
+        with BuildfileTree(path, scratch_path(project_name), project_name) as tree:
+            rewrite = PathRewrite(tree.path, path)
+            result = collect_states(evaluate_revision(tree.path, project_name, revision_hash, rewrite=rewrite, tree=tree) for (revision_hash, buildfiles) in revisions)
+            print_materialized(project_name, tree)
+            return result
+    return collect_states(evaluate_revision(path, project_name, revision_hash) for (revision_hash, buildfiles) in revisions)
+
+
+def _evaluate_chunk(worktree, path, project_name, chunk, repository):
+    start = timeit.default_timer()
+    rewrite = PathRewrite(worktree, path)
+    tree = BuildfileTree(path, worktree, project_name) if MATERIALIZE_BUILDFILES else None
+    outcomes = []
+    try:
+        for (revision_hash, buildfiles) in chunk:
+            outcome = evaluate_revision(worktree, project_name, revision_hash, rewrite=rewrite, tree=tree, repository=repository)
+            outcomes.append(outcome)
+            # the revisions after this one are discarded by collect_states
+            if 'checkout_error' in outcome.keys() or 'exception' in outcome.keys():
+                break
+    finally:
+        if tree is not None:
+            tree.close()
+    if tree is not None:
+        print_materialized(project_name, tree)
+    return outcomes, timeit.default_timer() - start
+
+
+def get_states_worktrees(project_name, revisions, worktrees):
+    """
+    Same as get_states but with the revisions split into one contiguous chunk per worktree, the chunks are evaluated concurrently.
+
+    The outcomes are collected in revision order. Untracked files a revision leaves in the checkout (e.g., a pom.xml copied from a custom
+    POM name) are only seen by the following revisions of the same chunk.
+    Online every worktree downloads into its own local Maven repository (../worktrees/maven_repositories), concurrent downloads of
+    the same parent POM or plugin into one repository can leave partial files that fail the other run. Offline runs only read the
+    seeded project repository.
+    """
+    path = '../repos/{}'.format(project_name)
+    count = min(worktrees, max(1, len(revisions)))
+    if MATERIALIZE_BUILDFILES:
+        paths = [scratch_path('{}.{}'.format(project_name, i)) for i in range(count)]
+    else:
+        paths = ensure_worktrees(path, project_name, count)
+
+    repositories = [None if MAVEN_OFFLINE else worktree_repository(project_name, i) for i in range(len(paths))]
+
+    chunks = split_contiguous(revisions, len(paths))
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        futures = [executor.submit(_evaluate_chunk, worktree, path, project_name, chunk, repository) for worktree, chunk, repository in zip(paths, chunks, repositories)]
+        results = [f.result() for f in futures]
+
+    outcomes = []
+    for worktree, chunk, (chunk_outcomes, seconds) in zip(paths, chunks, results):
+        print('[{}] worktree {}: {} of {} revisions in {:.5f}s'.format(project_name, worktree, len(chunk_outcomes), len(chunk), seconds))
+        outcomes += chunk_outcomes
+        # a revision that stops the collection also stops the following chunks
+        if len(chunk_outcomes) < len(chunk):
+            break
+    return collect_states(outcomes)
+
+
+def extract(project_name, last_commit):
+    """Extract the PMD states of the buildfile changes of the project, each project has its own repository in ../repos."""
+    print('extracting: {}'.format(project_name))
+    start = timeit.default_timer()
+
+    changed_revisions = pickle.load(open('./data/{}_buildfile_changes.pickle'.format(project_name), 'rb'))
+
+    # the table may have been extended by the projects before
+    if USE_PARENT_FIXUPS:
+        PARENT_FIXUPS.load()
+    if USE_POM_CACHE:
+        POM_CACHE.reset_stats()
+    with RESOLVER_STATS_LOCK:
+        RESOLVER_STATS.update(resolved=0, fallback=0, differences=0)
+
+    if POM_WORKTREES > 1:
+        states, error_states, debug, differences = get_states_worktrees(project_name, changed_revisions, POM_WORKTREES)
+    else:
+        states, error_states, debug, differences = get_states(project_name, changed_revisions)
+
+    dfs = pd.DataFrame(states)
+    dfs['project'] = project_name
+    dfs.to_csv('./data/{}_pmd_states6.csv'.format(project_name), index=False)
+
+    dfe = pd.DataFrame(error_states)
+    dfe['project'] = project_name
+    dfe.to_csv('./data/{}_pmd_error_states6.csv'.format(project_name), index=False)
+
+    if EFFECTIVE_POM_BACKEND == 'compare':
+        dfd = pd.DataFrame(differences, columns=['revision', 'pom', 'key', 'maven', 'python'])
+        dfd['project'] = project_name
+        dfd.to_csv('./data/{}_pom_resolver_diff.csv'.format(project_name), index=False)
+    if EFFECTIVE_POM_BACKEND != 'maven':
+        print('pom resolver: {resolved} resolved, {fallback} unsupported, {differences} revisions with differences'.format(**RESOLVER_STATS))
+
+    if USE_POM_CACHE:
+        POM_CACHE.print_stats()
+
+    fixup_stats = None
+    if USE_PARENT_FIXUPS:
+        PARENT_FIXUPS.print_stats()
+        fixup_stats = PARENT_FIXUPS.stats()
+        PARENT_FIXUPS.save()
+
+    end = timeit.default_timer() - start
+    print("Finished pompom for {} in {:.5f}s".format(project_name, end))
+    return fixup_stats
+
+
+def seed(project_name, last_commit):
+    """Seed the local Maven repository of the project with everything the effective POMs of its buildfile changes need."""
+    changed_revisions = pickle.load(open('./data/{}_buildfile_changes.pickle'.format(project_name), 'rb'))
+    seed_repository('../repos/{}'.format(project_name), project_name, changed_revisions)
 
 
 def main():
-    full = [
-        ('commons-bcel', None),
-        ('commons-vfs', None),
-        ('commons-jcs', None),
-        ('commons-beanutils', None),
-        ('commons-codec', None),
-        ('commons-collections', None),
-        ('commons-compress', None),
-        ('commons-configuration', None),
-        ('commons-dbcp', None),
-        ('commons-digester', None),
-        ('commons-imaging', None),
-        ('commons-io', None),
-        ('commons-jexl', None),
-        ('commons-lang', None),
-        ('commons-math', 'c4218b83851c8dba1f275e3095913d9636aa5000'),
-        ('commons-net', None),
-        ('commons-rdf', None),
-        ('commons-scxml', None),
-        ('commons-validator', None),
-        ('falcon', None),
-        ('jspwiki', None),
-        ('kylin', None),
-        ('mahout', None),
-        ('pdfbox', None),
-        ('ranger', None),
-        ('struts', None),
-        ('systemml', None),
-        ('tez', None),
-        ('tika', None),
-        ('wss4j', None),
-        ('eagle', None),
-        ('cayenne', None),
-        ('opennlp', None),
-        ('calcite', None),
-        ('zeppelin', None),
-        ('flume', None),
-        ('parquet-mr', None),
-        ('storm', None),
-        ('lens', None),
-        ('knox', None),
-        ('giraph', None),
-        ('gora', None),
-        ('helix', None),
-        ('archiva', None),
-        ('santuario-java', None),
-        ('phoenix', None),
-        ('manifoldcf', None),
-        ('httpcomponents-client', None),
-        ('httpcomponents-core', None),
-        ('streams', None),
-        ('mina-sshd', None),
-        ('roller', None),
-        ('jena', None),
-        ('nifi', None),
-    ]
-
-    for project_name, last_commit in full:
-        print('extracting: {}'.format(project_name))
-        start = timeit.default_timer()
-
-        changed_revisions = pickle.load(open('./data/{}_buildfile_changes.pickle'.format(project_name), 'rb'))
-
-        states, error_states, debug = get_states(project_name, changed_revisions)
-
-        dfs = pd.DataFrame(states)
-        dfs['project'] = project_name
-        dfs.to_csv('./data/{}_pmd_states6.csv'.format(project_name), index=False)
-
-        dfe = pd.DataFrame(error_states)
-        dfe['project'] = project_name
-        dfe.to_csv('./data/{}_pmd_error_states6.csv'.format(project_name), index=False)
-
-        end = timeit.default_timer() - start
-        print("Finished pompom for {} in {:.5f}s".format(project_name, end))
+    if SEED_MAVEN_REPOSITORY:
+        run_projects(seed, PROJECTS, processes=PROCESSES)
+    if MAVEN_OFFLINE:
+        missing = [project_name for project_name, _ in PROJECTS if not is_seeded(project_name)]
+        if missing:
+            print('not seeded, Maven will fail offline for: {}'.format(', '.join(missing)))
+    results = run_projects(extract, PROJECTS, processes=PROCESSES, stage='pmd_states')
+    if USE_PARENT_FIXUPS:
+        print_run_stats([r['value'] for r in results if r['value']])
 
 if __name__ == '__main__':
     main()
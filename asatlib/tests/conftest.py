@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules import each other as util.* from the asatlib directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+"""levenshtein compared with the cell by cell levenshtein_reference on random warning type sequences."""
+import random
+from collections import Counter
+
+import pytest
+
+from util import distance
+from util.distance import levenshtein, levenshtein_reference, WarningDiffCache
+
+
+SEEDS = range(300)
+
+
+def random_sequences(seed, max_len=40):
+    """Return two random warning type sequences, the alphabet is small so that the sequences share runs of warnings."""
+    rnd = random.Random(seed)
+    types = ['PMD_{}'.format(i) for i in range(rnd.randint(1, 6))]
+    prevs = [rnd.choice(types) for _ in range(rnd.randint(0, max_len))]
+    currs = [rnd.choice(types) for _ in range(rnd.randint(0, max_len))]
+    return prevs, currs
+
+
+def structured_ops(ops):
+    return [tuple(o.split(':', 1)) for o in ops]
+
+
+def net_change(ops):
+    net = Counter(warning_type for kind, warning_type in ops if kind == 'add')
+    net.subtract(warning_type for kind, warning_type in ops if kind == 'del')
+    return net
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_matrix_mode_equals_reference(seed):
+    prevs, currs = random_sequences(seed)
+    assert levenshtein(prevs, currs, linear_space=False) == levenshtein_reference(prevs, currs)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_structured_equals_reference(seed):
+    prevs, currs = random_sequences(seed)
+    expected_distance, expected_ops = levenshtein_reference(prevs, currs)
+    assert levenshtein(prevs, currs, linear_space=False, structured=True) == (expected_distance, structured_ops(expected_ops))
+
+
+@pytest.mark.parametrize('structured', [False, True])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_linear_space_equals_reference(seed, structured):
+    """Hirschberg returns the same distance, of several minimal edit scripts it may choose another one than the reference.
+
+    The edit script is checked against the sequences instead, the backtracking of the reference does not always produce the net
+    change between them.
+    """
+    prevs, currs = random_sequences(seed)
+    expected_distance, expected_ops = levenshtein_reference(prevs, currs)
+    actual_distance, actual_ops = levenshtein(prevs, currs, linear_space=True, structured=structured)
+    if not structured:
+        actual_ops = structured_ops(actual_ops)
+
+    assert actual_distance == expected_distance
+    expected_net = Counter(currs)
+    expected_net.subtract(prevs)
+    assert net_change(actual_ops) == expected_net
+    # every deleted warning is in the previous and every added warning in the current sequence
+    assert not Counter(t for kind, t in actual_ops if kind == 'del') - Counter(prevs)
+    assert not Counter(t for kind, t in actual_ops if kind == 'add') - Counter(currs)
+
+
+def test_linear_space_above_matrix_limit(monkeypatch):
+    prevs, currs = random_sequences(1, max_len=200)
+    monkeypatch.setattr(distance, 'MAX_MATRIX_CELLS', 10)
+    assert levenshtein(prevs, currs)[0] == levenshtein_reference(prevs, currs)[0]
+
+
+def test_warning_diff_cache():
+    cache = WarningDiffCache(max_entries=2)
+    for seed in [1, 2, 1]:
+        prevs, currs = random_sequences(seed)
+        expected_distance, expected_ops = levenshtein(prevs, currs, structured=True)
+        assert cache.diff(prevs, currs) == (expected_distance, tuple(expected_ops))
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,122 @@
+"""Learned parent replacements are only applied if the original parent can not be resolved."""
+import multiprocessing
+import os
+import subprocess
+
+import pytest
+
+from util import buildfile
+from util.buildfile import PomPom
+from util.parent_fixups import ParentFixups, fixup_key
+
+
+POM = '''<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <modelVersion>4.0.0</modelVersion>
+  {parent}
+  <groupId>{group_id}</groupId>
+  <artifactId>{artifact_id}</artifactId>
+  <version>{version}</version>
+</project>
+'''
+
+PARENT = '<parent><groupId>org.example</groupId><artifactId>example-parent</artifactId><version>1.0-SNAPSHOT</version>{relative_path}</parent>'
+
+OUTPUT = b'<?xml version="1.0"?>\n<project xmlns="http://maven.apache.org/POM/4.0.0"></project>\n'
+
+
+def write_pom(path, parent='', group_id='org.example', artifact_id='example', version='1.0-SNAPSHOT'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(POM.format(parent=parent, group_id=group_id, artifact_id=artifact_id, version=version))
+
+
+@pytest.fixture
+def maven_runs(monkeypatch):
+    """Replaces Maven, the snapshot parent is only found as ../pom.xml. Returns the parent version each run saw."""
+    runs = []
+
+    def run(command, cwd, stdout, stderr):
+        with open(os.path.join(cwd, 'pom.xml')) as f:
+            snapshot = '<version>1.0-SNAPSHOT</version>' in f.read().split('</parent>')[0]
+        runs.append('snapshot' if snapshot else 'fixed')
+        if snapshot and not os.path.isfile(os.path.join(cwd, '..', 'pom.xml')):
+            return subprocess.CompletedProcess(command, 1, b'[ERROR] Non-resolvable parent POM for x', b'')
+        return subprocess.CompletedProcess(command, 0, OUTPUT, b'')
+    monkeypatch.setattr(buildfile.subprocess, 'run', run)
+    return runs
+
+
+@pytest.fixture
+def fixups(tmp_path):
+    fixups = ParentFixups(str(tmp_path / 'parent_fixups.json'))
+    fixups.learn(fixup_key('org.example', 'example-parent', '1.0-SNAPSHOT', False), 'a' * 40, [{'old': '1.0-SNAPSHOT', 'new': '1.0'}])
+    return fixups
+
+
+def create(basedir, fixups, local_repository):
+    p = PomPom(str(basedir), 'example', 'b' * 40, local_repository=str(local_repository))
+    p.parent_fixups = fixups
+    return p.create_effective_pom()
+
+
+def test_unresolvable_parent_is_fixed_before_the_first_run(tmp_path, maven_runs, fixups):
+    write_pom(str(tmp_path / 'checkout' / 'pom.xml'), parent=PARENT.format(relative_path=''))
+
+    output, replacements = create(tmp_path / 'checkout', fixups, tmp_path / 'm2')
+    assert maven_runs == ['fixed']
+    assert replacements == [{'old': '1.0-SNAPSHOT', 'new': '1.0'}]
+    assert fixups.stats()['hits'] == 1
+
+
+def test_relative_parent_is_not_replaced(tmp_path, maven_runs, fixups):
+    """The default ../pom.xml is the parent in this revision, Maven uses it like without the learned replacement."""
+    write_pom(str(tmp_path / 'checkout' / 'pom.xml'), artifact_id='example-parent')
+    write_pom(str(tmp_path / 'checkout' / 'module' / 'pom.xml'), parent=PARENT.format(relative_path=''))
+
+    output, replacements = create(tmp_path / 'checkout' / 'module', fixups, tmp_path / 'm2')
+    assert maven_runs == ['snapshot']
+    assert replacements == []
+    assert fixups.stats() == {'hits': 0, 'saved': 0, 'failed': 0, 'learned': 1, 'known': 1}
+
+
+def test_relative_parent_with_other_coordinates_does_not_resolve(tmp_path):
+    write_pom(str(tmp_path / 'checkout' / 'parent' / 'pom.xml'), artifact_id='example-parent', version='0.9')
+    write_pom(str(tmp_path / 'checkout' / 'module' / 'pom.xml'), parent=PARENT.format(relative_path='<relativePath>../parent</relativePath>'))
+
+    p = PomPom(str(tmp_path / 'checkout' / 'module'), 'example', 'b' * 40, local_repository=str(tmp_path / 'm2'))
+    assert not p._parent_resolves(p.basedir + '/pom.xml')
+
+
+def test_parent_in_local_repository_resolves(tmp_path):
+    write_pom(str(tmp_path / 'checkout' / 'pom.xml'), parent=PARENT.format(relative_path='<relativePath/>'))
+    repository_pom = tmp_path / 'm2' / 'org' / 'example' / 'example-parent' / '1.0-SNAPSHOT' / 'example-parent-1.0-SNAPSHOT.pom'
+    write_pom(str(repository_pom), artifact_id='example-parent')
+
+    p = PomPom(str(tmp_path / 'checkout'), 'example', 'b' * 40, local_repository=str(tmp_path / 'm2'))
+    assert p._parent_resolves(p.basedir + '/pom.xml')
+
+
+def _save_learned(args):
+    fixup_file, i = args
+    fixups = ParentFixups(fixup_file)
+    fixups.load()
+    key = fixup_key('org.example', 'parent-{}'.format(i), '1', False)
+    fixups.learn(key, 'a' * 40, [{'old': str(i), 'new': '1'}])
+    fixups.hit(fixup_key('org.example', 'shared', '1', False))
+    fixups.save()
+
+
+def test_concurrent_saves_keep_all_entries(tmp_path):
+    fixup_file = str(tmp_path / 'parent_fixups.json')
+    shared = ParentFixups(fixup_file)
+    shared.learn(fixup_key('org.example', 'shared', '1', False), 'a' * 40, [])
+    shared.save()
+
+    with multiprocessing.Pool(8) as pool:
+        pool.map(_save_learned, [(fixup_file, i) for i in range(64)])
+
+    fixups = ParentFixups(fixup_file)
+    fixups.load()
+    assert len(fixups.table) == 65
+    assert fixups.table[fixup_key('org.example', 'shared', '1', False)]['hits'] == 64
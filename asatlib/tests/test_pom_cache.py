@@ -0,0 +1,55 @@
+"""Maven errors in the effective POM cache are only replayed if the next run would fail the same way."""
+import subprocess
+
+import pytest
+
+from util.buildfile import PomPom, MavenError
+from util.pom_cache import EffectivePomCache
+
+
+POM = '''<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>org.example</groupId>
+  <artifactId>example</artifactId>
+  <version>1.0</version>
+</project>
+'''
+
+TRANSIENT = '[ERROR] Non-resolvable parent POM for org.example:example:1.0: Could not transfer artifact: Connection timed out'
+PARSE = '[ERROR] Non-parseable POM /tmp/pom.xml: unexpected markup <!d (position: START_DOCUMENT seen <!d... @1:4)'
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    path = tmp_path / 'checkout'
+    path.mkdir()
+    (path / 'pom.xml').write_text(POM)
+    for command in [['init', '-q'], ['add', 'pom.xml'], ['-c', 'user.name=a', '-c', 'user.email=a@b', 'commit', '-q', '-m', 'pom']]:
+        subprocess.run(['git'] + command, cwd=str(path), check=True)
+    revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=str(path), stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+    return str(path), revision
+
+
+def put_error(tmp_path, checkout, output, offline=False):
+    """Store the MavenError of the revision and return what a second cache of the same directory finds for it."""
+    path, revision = checkout
+    p = PomPom(path, 'example', revision, offline=offline)
+    cache = EffectivePomCache(str(tmp_path / 'cache'))
+    key = cache.fingerprint(path, p)
+    cache.put(key, p, maven_error=MavenError(output))
+    return EffectivePomCache(str(tmp_path / 'cache')).get(key, p)
+
+
+def test_transient_error_is_not_replayed(tmp_path, checkout):
+    assert MavenError(TRANSIENT).type == 'parent'
+    assert put_error(tmp_path, checkout, TRANSIENT) is None
+
+
+def test_deterministic_error_is_replayed(tmp_path, checkout):
+    entry = put_error(tmp_path, checkout, PARSE)
+    assert MavenError(entry['maven_error']).type == 'parse'
+
+
+def test_offline_error_is_replayed(tmp_path, checkout):
+    assert put_error(tmp_path, checkout, TRANSIENT, offline=True)['maven_error'] == TRANSIENT
@@ -1,14 +1,20 @@
 
+import copy
+
 from bson.objectid import ObjectId
 
 from pycoshark.mongomodels import Commit, File, FileAction, Issue, Event, Hunk, CodeEntityState
 from pycoshark.utils import java_filename_filter
-from mongoengine.queryset.visitor import Q
-from functools import reduce
 
-from util.distance import levenshtein
-from util.metrics import get_metrics, get_warnings, hunk_lines, get_warning_list, get_file_metrics
+from util.ces_query import find_commit_ces, find_commit_ces_raw, get_commit, aggregate_commit_ces, startswith, endswith
+from util.distance import WARNING_DIFF_CACHE
+from util.excludes import EffectiveMatcher
+from util.file_cache import FILE_CACHE
+from util.git import log_name_status
+from util.metrics import get_metrics, get_warnings, get_warning_list, get_file_metrics
 from util.pmd import PMD_RULES, PMD_SEVERITIES, PMD_SEVERITY_MATCH, PMD_GROUP_MATCH
+from util.runner import ordered_map, split_contiguous
+from util import summaries
 
 # files extracted from previous run over extracted rule files
 CORPUS_RULE_FILES = {
@@ -31,39 +37,131 @@ CORPUS_RULE_FILES = {
 OLD_NAMES = {'project.xml'}
 
 
+# batch size for $in queries, keeps queries well below the BSON size limit
+BATCH_SIZE = 5000
+
+
+def chunks(items, size=BATCH_SIZE):
+    """Yield consecutive slices of items with at most size elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def is_buildfile_change(file_path, old_file_path, buildfile='pom.xml'):
+    """Return True if the (lower case) file path or old file path of a file action points to a build file."""
+    # only build files recognized
+    if file_path != buildfile and old_file_path != buildfile and not file_path.endswith('/{}'.format(buildfile)) and not old_file_path.endswith('/{}'.format(buildfile)):
+
+        # we also continue if no old name pom.xml has changed
+        if file_path not in OLD_NAMES and old_file_path not in OLD_NAMES:
+            return False
+
+        # we still continue if a rule file has not changed
+        if file_path not in CORPUS_RULE_FILES and old_file_path not in CORPUS_RULE_FILES:
+            return False
+    return True
+
+
+def get_file_action_paths(commit_ids):
+    """Yield file actions of the commits as dicts with commit_id, path and old_path, file paths are joined by the MongoDB."""
+    file_collection = File._get_collection_name()
+    for chunk in chunks(commit_ids):
+        for fa in FileAction.objects().aggregate(*[
+            {'$match': {'commit_id': {'$in': chunk}}},
+            {'$project': {'commit_id': 1, 'file_id': 1, 'old_file_id': 1}},
+            {'$lookup': {'from': file_collection, 'localField': 'file_id', 'foreignField': '_id', 'as': 'file'}},
+            {'$lookup': {'from': file_collection, 'localField': 'old_file_id', 'foreignField': '_id', 'as': 'old_file'}},
+            {'$project': {'commit_id': 1, 'file_id': 1, 'old_file_id': 1,
+                          'path': {'$arrayElemAt': ['$file.path', 0]},
+                          'old_path': {'$arrayElemAt': ['$old_file.path', 0]}}}
+        ], allowDiskUse=True):
+            if fa.get('path') is None or (fa.get('old_file_id') and fa.get('old_path') is None):
+                raise File.DoesNotExist('file of file action {} not found'.format(fa['_id']))
+            yield fa
+
+
 def buildfile_changes(vcs_system, revisions, buildfile='pom.xml'):
-    """Extract from each commit for the vcs_system if the buildfile was changed (added, deleted, moved, modified)."""
+    """Extract from each commit for the vcs_system if the buildfile was changed (added, deleted, moved, modified).
+
+    Commits, file actions and file paths are fetched in batches for the whole list of revisions, the matching is done in memory.
+    """
+    commit_ids = {}
+    for chunk in chunks(revisions):
+        for c in Commit.objects.filter(vcs_system_id=vcs_system.id, revision_hash__in=chunk).only('id', 'revision_hash').as_pymongo():
+            commit_ids[c['revision_hash']] = c['_id']
+
+    for commit_rev in revisions:
+        if commit_rev not in commit_ids.keys():
+            raise Commit.DoesNotExist('commit {} not found'.format(commit_rev))
+
+    changed_buildfiles = {}
+    for fa in get_file_action_paths(list(commit_ids.values())):
+        file_path = fa['path'].lower()
+        old_file_path = ''
+        if fa.get('old_file_id'):
+            old_file_path = fa['old_path'].lower()
+
+        if not is_buildfile_change(file_path, old_file_path, buildfile):
+            continue
+
+        changed_buildfiles.setdefault(fa['commit_id'], []).append(file_path)
+
     changed_revisions = []
     for commit_rev in revisions:
-        c = Commit.objects.get(revision_hash=commit_rev, vcs_system_id=vcs_system.id)
+        if commit_ids[commit_rev] in changed_buildfiles.keys():
+            changed_revisions.append((commit_rev, changed_buildfiles[commit_ids[commit_rev]]))
 
-        changed_buildfiles = []
-        for fa in FileAction.objects.filter(commit_id=c.id):
-            old_file_path = ''
-            file_path = File.objects.get(id=fa.file_id).path.lower()
+    return changed_revisions
 
-            if fa.old_file_id:
-                old_file_path = File.objects.get(id=fa.old_file_id).path.lower()
 
-            # only build files recognized
-            if file_path != buildfile and old_file_path != buildfile and not file_path.endswith('/{}'.format(buildfile)) and not old_file_path.endswith('/{}'.format(buildfile)):
+def buildfile_changes_git(repo_path, revisions, buildfile='pom.xml'):
+    """Extract from each revision if the buildfile was changed like buildfile_changes but from one git log stream over the local repository.
 
-                # we also continue if no old name pom.xml has changed
-                if file_path not in OLD_NAMES and old_file_path not in OLD_NAMES:
-                    continue
+    Renames are detected by git, merge commits are diffed against every parent like the file actions of vcsSHARK.
+    """
+    wanted = set(revisions)
+    changed_buildfiles = {}
+    for revision_hash, changes in log_name_status(repo_path, revisions[-1]):
+        if revision_hash not in wanted:
+            continue
 
-                # we still continue if a rule file has not changed
-                if file_path not in CORPUS_RULE_FILES and old_file_path not in CORPUS_RULE_FILES:
-                    continue
+        for _, path, old_path in changes:
+            file_path = path.lower()
+            old_file_path = ''
+            if old_path:
+                old_file_path = old_path.lower()
+
+            if not is_buildfile_change(file_path, old_file_path, buildfile):
+                continue
 
-            changed_buildfiles.append(file_path)
+            changed_buildfiles.setdefault(revision_hash, []).append(file_path)
 
-        if changed_buildfiles:
-            changed_revisions.append((commit_rev, changed_buildfiles))
+    changed_revisions = []
+    for commit_rev in revisions:
+        if commit_rev in changed_buildfiles.keys():
+            changed_revisions.append((commit_rev, changed_buildfiles[commit_rev]))
 
     return changed_revisions
 
 
+def compare_buildfile_changes(expected, actual):
+    """Return a list of differences between two buildfile_changes results, the order of the changed files within a revision is not compared."""
+    differences = []
+    expected_files = {rev: sorted(files) for rev, files in expected}
+    actual_files = {rev: sorted(files) for rev, files in actual}
+
+    if [rev for rev, _ in expected] != [rev for rev, _ in actual]:
+        for rev in expected_files.keys() - actual_files.keys():
+            differences.append('revision {} missing'.format(rev))
+        for rev in actual_files.keys() - expected_files.keys():
+            differences.append('revision {} unexpected'.format(rev))
+
+    for rev in expected_files.keys() & actual_files.keys():
+        if expected_files[rev] != actual_files[rev]:
+            differences.append('revision {} changed files differ: {} != {}'.format(rev, expected_files[rev], actual_files[rev]))
+    return differences
+
+
 def calculate_issues(revisions, its, vcs):
     """Die Issue.created_at und Event.created_at sind in UTC (Apache Jira default ist UTC, kann aber auch vom Benutzer abhängen!).
 
@@ -99,156 +197,320 @@ def calculate_issues(revisions, its, vcs):
     return results
 
 
-def warnings_coarse(revisions, vcs, poms=None):
+def _coarse_row(revision, commit):
+    """Return the initialized result row of warnings_coarse for the revision."""
+    tmp = {'revision': revision, 'date': commit.committer_date}
+    tmp.update(**{'code_' + r['abbrev']: 0 for r in PMD_RULES})
+    tmp.update(**{'test_' + r['abbrev']: 0 for r in PMD_RULES})
+    tmp.update(**{'effective_code_' + r['abbrev']: 0 for r in PMD_RULES})
+
+    # todo: include other metrics?
+    tmp['test_loc'] = 0
+    tmp['code_loc'] = 0
+    tmp['effective_code_loc'] = 0
+    tmp['effective_rules'] = []
+    return tmp
+
+
+def _pom_settings(poms, revision):
+    """Return effective rules, source directories, excludes and exclude roots of all POMs for the revision."""
+    effective_rules = []
+
+    # each modules (pom in poms) has its own source directory
+    source_dirs = []
+    excludes = []
+    exclude_roots = []
+
+    # the revision is not there if the project did not start with an pom.xml
+    if poms and revision in poms.keys():
+
+        # for each commit we have, source_directory, test_source_directory, excludes
+        for pom, state in poms[revision].items():
+
+            effective_rules += state['effective_rules']
+
+            # excludes need to be prefixed with source_directory
+            for ef in state['file_excludes']:
+                if ef.endswith('.java'):
+                    excludes.append((state['source_directory'] + '/' + ef))
+            for er in state['root_excludes']:
+                exclude_roots.append(er)
+
+            source_dirs.append(state['source_directory'])
+
+    return effective_rules, list(set(source_dirs)), excludes, exclude_roots
+
+
+def _effective_settings(poms, revision, compiled):
+    """Return effective rules and the EffectiveMatcher of the pom state of the revision.
+
+    compiled holds the settings by pom state identity for one warnings_coarse call, the pom state only changes on buildfile
+    change revisions.
+    """
+    state = None
+    if poms and revision in poms.keys():
+        state = poms[revision]
+
+    cached = compiled.get(id(state))
+    if cached and cached[0] is state:
+        return cached[1], cached[2]
+
+    effective_rules, source_dirs, excludes, exclude_roots = _pom_settings(poms, revision)
+    matcher = EffectiveMatcher(source_dirs, excludes, exclude_roots)
+    compiled[id(state)] = (state, effective_rules, matcher)
+    return effective_rules, matcher
+
+
+def _finish_row(tmp, code, test, effective):
+    """Add (warning list, file metrics, number of files) of code, test and effective code to the result row.
+
+    The warning lists and file metrics are in the format returned by get_warning_list and get_file_metrics.
+    """
+    classes = [('code_', code), ('test_', test), ('effective_code_', effective)]
+    for prefix, (warnings, _, _) in classes:
+        for w in warnings:
+            tmp[prefix + w['type']] += w['sum']
+
+    # general info
+    for prefix, (_, _, nr_files) in classes:
+        tmp[prefix + 'files'] = nr_files
+
+    for prefix, (_, metrics, _) in classes:
+        if 'file_loc_sum' in metrics.keys():
+            tmp[prefix + 'loc'] = metrics['file_loc_sum']
+            tmp[prefix + 'mccc'] = metrics['file_mccc_sum']
+            tmp[prefix + 'lloc'] = metrics['file_lloc_sum']
+
+    # rejoin to string because of saving in csv
+    tmp['effective_rules'] = ','.join(set(tmp['effective_rules']))
+    return tmp
+
+
+def get_file_summaries(commit):
+    """Return all java file CodeEntityStates of the commit with LOC, LLOC, McCC and their warnings grouped by type from one aggregation.
+
+    Each summary is a dict with _id, long_name, metrics and warnings as list of {'type', 'sum'}.
+    """
+    if summaries.USE_SUMMARIES:
+        return summaries.get_summaries([doc['_id'] for doc in find_commit_ces_raw(commit, {'ce_type': 'file', 'long_name': endswith('.java')}, ['_id'])])
+    return list(aggregate_commit_ces(commit, {'ce_type': 'file', 'long_name': endswith('.java')}, summaries.SUMMARY_STAGES))
+
+
+def get_file_summaries_by_id(ces_ids):
+    """Return the summaries (see get_file_summaries) of the given file CodeEntityStates."""
+    if summaries.USE_SUMMARIES:
+        return summaries.get_summaries(ces_ids)
+
+    ret = []
+    for chunk in chunks(ces_ids):
+        ret += list(CodeEntityState.objects().aggregate(*([{'$match': {'_id': {'$in': chunk}}}] + summaries.SUMMARY_STAGES), allowDiskUse=True))
+    return ret
+
+
+def _metric_value(summary, metric):
+    value = summary['metrics'].get(metric)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return 0
+
+
+class CoarseTotals:
+    """Running warning and metric sums over a changing set of file summaries."""
+
+    def __init__(self):
+        self.files = 0
+        self.warnings = {}
+        self.metrics = {'LOC': 0, 'LLOC': 0, 'McCC': 0}
+
+    def add(self, summary, sign=1):
+        self.files += sign
+        for w in summary['warnings']:
+            self.warnings[w['type']] = self.warnings.get(w['type'], 0) + sign * w['sum']
+        for metric in self.metrics.keys():
+            self.metrics[metric] += sign * _metric_value(summary, metric)
+
+    def remove(self, summary):
+        self.add(summary, sign=-1)
+
+    def result(self):
+        """Return warning list and file metrics in the format of get_warning_list and get_file_metrics together with the number of files."""
+        metrics = {}
+        if self.files:
+            metrics = {'file_loc_sum': self.metrics['LOC'], 'file_lloc_sum': self.metrics['LLOC'], 'file_mccc_sum': self.metrics['McCC']}
+        return [{'type': k, 'sum': v} for k, v in self.warnings.items() if v], metrics, self.files
+
+
+def _warnings_coarse_incremental(revisions, vcs, poms=None):
+    """warnings_coarse computing each revision as delta of its predecessor.
+
+    Only the ids of the java file CodeEntityStates are listed for each revision, summaries are fetched for added CodeEntityStates and
+    running totals are updated for added and removed ones. Effective membership of all files is only re-evaluated if the pom state changes,
+    revisions with the same files and pom state reuse the previous row. Sums are exact as long as the metrics are integral.
+    """
+    results = []
+    file_summaries = {}
+    code = CoarseTotals()
+    test = CoarseTotals()
+    effective = CoarseTotals()
+
+    previous_row = None
+    previous_state = None
+    compiled = {}
+    for revision in revisions:
+        commit = get_commit(revision_hash=revision, vcs_system_id=vcs.id)
+        ces_ids = {doc['_id'] for doc in find_commit_ces_raw(commit, {'ce_type': 'file', 'long_name': endswith('.java')}, ['_id'])}
+
+        state = None
+        if poms and revision in poms.keys():
+            state = poms[revision]
+        state_changed = previous_row is None or state is not previous_state
+
+        if not state_changed and ces_ids == file_summaries.keys():
+            tmp = copy.copy(previous_row)
+            tmp['revision'] = revision
+            tmp['date'] = commit.committer_date
+            results.append(tmp)
+            previous_row = tmp
+            continue
+
+        tmp = _coarse_row(revision, commit)
+        effective_rules, is_effective = _effective_settings(poms, revision, compiled)
+        tmp['effective_rules'] += effective_rules
+
+        for ces_id in file_summaries.keys() - ces_ids:
+            s = file_summaries.pop(ces_id)
+            s['_totals'].remove(s)
+            if s['_effective']:
+                effective.remove(s)
+
+        for s in get_file_summaries_by_id(list(ces_ids - file_summaries.keys())):
+            s['_totals'] = code if java_filename_filter(s['long_name'], production_only=True) else test
+            s['_totals'].add(s)
+            s['_effective'] = False
+            if not state_changed and is_effective(s['long_name']):
+                s['_effective'] = True
+                effective.add(s)
+            file_summaries[s['_id']] = s
+
+        if state_changed:
+            effective = CoarseTotals()
+            for s in file_summaries.values():
+                s['_effective'] = is_effective(s['long_name'])
+                if s['_effective']:
+                    effective.add(s)
+
+        previous_row = _finish_row(tmp, code.result(), test.result(), effective.result())
+        previous_state = state
+        results.append(previous_row)
+    return results
+
+
+def warnings_coarse(revisions, vcs, poms=None, mode='queries'):
     """Just get the sum of all ASAT warnings including added, deleted files.
 
     We are discerning between test code and production code.
+    With mode 'summaries' all java files of a revision are fetched with their warnings and metrics in one aggregation and classified here,
+    'queries' runs separate queries for the file lists, warnings and metrics of code, test and effective code.
+    'incremental' computes each revision as delta of its predecessor, see _warnings_coarse_incremental.
     """
+    if mode == 'incremental':
+        return _warnings_coarse_incremental(revisions, vcs, poms)
+
     results = []
+    compiled = {}
     for revision in revisions:
-        commit = Commit.objects.get(revision_hash=revision, vcs_system_id=vcs.id)
+        commit = get_commit(revision_hash=revision, vcs_system_id=vcs.id)
+
+        tmp = _coarse_row(revision, commit)
+        effective_rules, is_effective = _effective_settings(poms, revision, compiled)
+        tmp['effective_rules'] += effective_rules
+
+        if mode == 'summaries':
+            code = CoarseTotals()
+            test = CoarseTotals()
+            effective = CoarseTotals()
+            for s in get_file_summaries(commit):
+                if java_filename_filter(s['long_name'], production_only=True):
+                    code.add(s)
+                else:
+                    test.add(s)
+
+                if is_effective(s['long_name']):
+                    effective.add(s)
+
+            code_warnings, code_metrics, nr_code_files = code.result()
+            test_warnings, test_metrics, nr_test_files = test.result()
+            effective_code_warnings, effective_code_metrics, nr_effective_files = effective.result()
+
+        else:
+            # effective fiele ids given the projects pom.xml excludes, and source_directory
+            effective_file_ids = []
+
+            # this only is necessary if we have effective files (only if we can read the pom.xml)
+            if len(is_effective.source_dirs) > 0:
+                query = {'ce_type': 'file', '$and': [{'long_name': endswith('.java')}, {'$or': [{'long_name': startswith(source_dir)} for source_dir in is_effective.source_dirs]}]}
+
+                for ces in find_commit_ces(commit, query, ['long_name']):
+                    if is_effective.is_excluded(ces.long_name):
+                        continue
+                    effective_file_ids.append(ces.id)
+
+            # get all java files, check for test, documentation, generated or other exclusions
+            code_file_ids = []
+            test_file_ids = []
+            for ces in find_commit_ces(commit, {'ce_type': 'file', 'long_name': endswith('.java')}, ['long_name']):
+                if java_filename_filter(ces.long_name, production_only=True):
+                    code_file_ids.append(ces.id)
+                else:
+                    test_file_ids.append(ces.id)
+
+            # code_files = CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java', long_name__not__icontains='/test/').only('id', 'long_name')
+            # code_file_ids = [ObjectId(cesf.id) for cesf in code_files]
+
+            # test_files = CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java', long_name__icontains='/test/').only('id')
+            # test_file_ids = [ObjectId(cesf.id) for cesf in test_files]
+
+            # detailed warnings, grouped by type of the warning
+            code_warnings = get_warning_list(code_file_ids)
+            test_warnings = get_warning_list(test_file_ids)
+            effective_code_warnings = get_warning_list(effective_file_ids)
+
+            code_metrics = get_file_metrics(code_file_ids)
+            test_metrics = get_file_metrics(test_file_ids)
+            effective_code_metrics = get_file_metrics(effective_file_ids)
+            nr_code_files, nr_test_files, nr_effective_files = len(code_file_ids), len(test_file_ids), len(effective_file_ids)
+
+        results.append(_finish_row(tmp,
+                                   (code_warnings, code_metrics, nr_code_files),
+                                   (test_warnings, test_metrics, nr_test_files),
+                                   (effective_code_warnings, effective_code_metrics, nr_effective_files)))
+    return results
 
-        tmp = {'revision': revision, 'date': commit.committer_date}
-        tmp.update(**{'code_' + r['abbrev']: 0 for r in PMD_RULES})
-        tmp.update(**{'test_' + r['abbrev']: 0 for r in PMD_RULES})
-        tmp.update(**{'effective_code_' + r['abbrev']: 0 for r in PMD_RULES})
 
-        # todo: include other metrics?
-        tmp['test_loc'] = 0
-        tmp['code_loc'] = 0
-        tmp['effective_code_loc'] = 0
-        tmp['effective_rules'] = []
+def _warnings_coarse_shard(args):
+    return warnings_coarse(*args)
 
-        # effective fiele ids given the projects pom.xml excludes, and source_directory
-        effective_file_ids = []
 
-        # each modules (pom in poms) has its own source directory
-        source_dirs = []
-        excludes = []
-        exclude_roots = []
+def warnings_coarse_sharded(revisions, vcs, poms=None, mode='queries', processes=1, connection=None):
+    """warnings_coarse with the revisions split into one contiguous shard per process.
 
-        # the revision is not there if the project did not start with an pom.xml
-        if poms and revision in poms.keys():
+    Each shard gets the pom states of its revisions, the rows of the shards are concatenated in revision order and are the same as
+    the rows of warnings_coarse (the effective_rules set order needs the fork start method, it depends on the hash seed of the process).
+    In incremental mode every shard starts with a full revision.
+    """
+    if processes <= 1:
+        return warnings_coarse(revisions, vcs, poms=poms, mode=mode)
 
-            # for each commit we have, source_directory, test_source_directory, excludes
-            for pom, state in poms[revision].items():
-
-                tmp['effective_rules'] += state['effective_rules']
-
-                # excludes need to be prefixed with source_directory
-                for ef in state['file_excludes']:
-                    if ef.endswith('.java'):
-                        excludes.append((state['source_directory'] + '/' + ef))
-                for er in state['root_excludes']:
-                    exclude_roots.append(er)
-
-                source_dirs.append(state['source_directory'])
-
-        source_dirs = list(set(source_dirs))
-
-        # this only is necessary if we have effective files (only if we can read the pom.xml)
-        if len(source_dirs) > 0:
-            query = reduce(lambda q1, q2: q1.__or__(q2), map(lambda source_dir: Q(long_name__startswith=source_dir), source_dirs))
-            qry = CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java').filter(query)
-
-            # this is not very secure and will break if we get ** and * in one expression
-            full = []
-            prefix = []
-            suffix = []
-            suffix_only = []
-            prefix_only = []
-            for e in excludes:
-                if e.startswith('**'):
-                    suffix_only.append(e.split('**')[-1])
-                    continue
-                if e.endswith('*'):
-                    prefix_only.append(e.split('*')[-1])
-                    continue
-                if '**' in e:
-                    prefix.append(e.split('**')[0])
-                    suffix.append(e.split('**')[-1])
-                    continue
-                if '*' in e:
-                    prefix.append(e.split('*')[0])
-                    suffix.append(e.split('*')[-1])
-                    continue
-                full.append(e)
-
-            for ces in qry.only('id', 'long_name'):
-                if ces.long_name.startswith(tuple(exclude_roots)):
-                    # print('ignore {} because of root exclude {}'.format(ces.long_name, exclude_roots))
-                    continue
-                if ces.long_name.startswith(tuple(prefix_only)):
-                    # print('ignore {} because of prefix only exclude {}'.format(ces.long_name, prefix_only))
-                    continue
-                if ces.long_name.endswith(tuple(suffix_only)):
-                    # print('ignore {} because of suffix only exclude {}'.format(ces.long_name, suffix_only))
-                    continue
-                if ces.long_name in full:
-                    # print('ignore {} because of full exclude {}'.format(ces.long_name, full))
-                    continue
-                for p, s in zip(prefix, suffix):
-                    if ces.long_name.startswith(p) and ces.long_name.endswith(s):
-                        # print('ignore {} because of prefix {} - suffix {} exclude'.format(ces.long_name, p, s))
-                        continue
+    shards = []
+    for part in split_contiguous(revisions, processes):
+        shard_poms = None
+        if poms is not None:
+            shard_poms = {revision: poms[revision] for revision in part if revision in poms.keys()}
+        shards.append((part, vcs, shard_poms, mode))
 
-                effective_file_ids.append(ces.id)
-
-        # get all java files, check for test, documentation, generated or other exclusions
-        code_file_ids = []
-        test_file_ids = []
-        for ces in CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java').only('id', 'long_name'):
-            if java_filename_filter(ces.long_name, production_only=True):
-                code_file_ids.append(ces.id)
-            else:
-                test_file_ids.append(ces.id)
-
-        # code_files = CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java', long_name__not__icontains='/test/').only('id', 'long_name')
-        # code_file_ids = [ObjectId(cesf.id) for cesf in code_files]
-
-        # test_files = CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__endswith='.java', long_name__icontains='/test/').only('id')
-        # test_file_ids = [ObjectId(cesf.id) for cesf in test_files]
-
-        # detailed warnings, grouped by type of the warning
-        code_warnings = get_warning_list(code_file_ids)
-        test_warnings = get_warning_list(test_file_ids)
-        effective_code_warnings = get_warning_list(effective_file_ids)
-
-        code_metrics = get_file_metrics(code_file_ids)
-        test_metrics = get_file_metrics(test_file_ids)
-        effective_code_metrics = get_file_metrics(effective_file_ids)
-
-        for w in code_warnings:
-            tmp['code_' + w['type']] += w['sum']
-        for w in test_warnings:
-            tmp['test_' + w['type']] += w['sum']
-        for w in effective_code_warnings:
-            tmp['effective_code_' + w['type']] += w['sum']
-
-        # general info
-        tmp['code_files'] = len(code_file_ids)
-        tmp['test_files'] = len(test_file_ids)
-        tmp['effective_code_files'] = len(effective_file_ids)
-
-        if 'file_loc_sum' in code_metrics.keys():
-            tmp['code_loc'] = code_metrics['file_loc_sum']
-            tmp['code_mccc'] = code_metrics['file_mccc_sum']
-            tmp['code_lloc'] = code_metrics['file_lloc_sum']
-
-        if 'file_loc_sum' in test_metrics.keys():
-            tmp['test_loc'] = test_metrics['file_loc_sum']
-            tmp['test_mccc'] = test_metrics['file_mccc_sum']
-            tmp['test_lloc'] = test_metrics['file_lloc_sum']
-
-        if 'file_loc_sum' in effective_code_metrics.keys():
-            tmp['effective_code_loc'] = effective_code_metrics['file_loc_sum']
-            tmp['effective_code_mccc'] = effective_code_metrics['file_mccc_sum']
-            tmp['effective_code_lloc'] = effective_code_metrics['file_lloc_sum']
-
-        # rejoin to string because of saving in csv
-        tmp['effective_rules'] = ','.join(set(tmp['effective_rules']))
-
-        results.append(tmp)
+    results = []
+    for rows in ordered_map(_warnings_coarse_shard, shards, processes=processes, connection=connection):
+        results += rows
     return results
 
 
@@ -263,25 +525,28 @@ def find_warning_changes2(revisions):
         if not i:
             continue
 
-        commit = Commit.objects.get(revision_hash=revision)
-        previous_commit = Commit.objects.get(revision_hash=revisions[i - 1])
+        commit = get_commit(revision_hash=revision)
+        previous_commit = get_commit(revision_hash=revisions[i - 1])
+        # all file paths of the project in one query instead of one query per commit
+        FILE_CACHE.preload(commit.vcs_system_id)
 
         # for each file in the revision
-        for fa in FileAction.objects.filter(commit_id=commit.id):
+        file_actions, files = FILE_CACHE.get_file_actions(FileAction.objects.filter(commit_id=commit.id))
+        for fa in file_actions:
             cdata = {}
             cdata.update(**{r['abbrev']: 0 for r in PMD_RULES})  # init PMD counts
             cdata.update(**{'method_lloc_sum': 0, 'method_lloc_avg': 0, 'method_mccc_sum': 0, 'method_mccc_avg': 0, 'method_mims_sum': 0, 'method_mims_avg': 0, 'nr_methods': 0, 'file_path': None, 'change_location': None})  # init metrics and meta data
 
-            f1 = File.objects.get(id=fa.file_id)
+            f1 = files[fa.file_id]
             f2 = None
 
             old_file = f1
             if fa.old_file_id:
-                f2 = File.objects.get(id=fa.old_file_id)
+                f2 = files[fa.old_file_id]
                 old_file = f2
 
             # only java files
-            if not f1.path.lower().endswith('.java') or not old_file.path.lower().endswith('.java'):
+            if not f1.is_java or not old_file.is_java:
                 continue
 
             check_id = ObjectId(f1.id)
@@ -295,7 +560,7 @@ def find_warning_changes2(revisions):
                 continue
 
             # need to aggregate the quality metrics here
-            if f1.path.lower().endswith('.java') and old_file.path.lower().endswith('.java'):
+            if f1.is_java and old_file.is_java:
                 metrics = get_metrics(previous_commit, commit, f1, old_file)
                 for k, v in metrics.items():
                     cdata[k] += v
@@ -303,24 +568,13 @@ def find_warning_changes2(revisions):
             warnings_current = get_warnings(commit, f1.path)
             warnings_previous = get_warnings(previous_commit, old_file.path)
 
-            added_warnings = []
-            deleted_warnings = []
-
-            # find narrowest CES for each hunk line?
-            # find narrowest CES for each line
-            for hunk in Hunk.objects.filter(file_action_id=fa.id):
-                lines_added, lines_deleted = hunk_lines(hunk)
+            added_warnings = [k.split(':')[2] for k in warnings_current.keys()]
+            deleted_warnings = [k.split(':')[2] for k in warnings_previous.keys()]
 
-                added_warnings = []
-                deleted_warnings = []
-                for k, v in warnings_current.items():
-                    tmp = k.split(':')
-                    added_warnings.append(tmp[2])
-                for k2, v2 in warnings_previous.items():
-                    tmp2 = k2.split(':')
-                    deleted_warnings.append(tmp2[2])
-
-                distance, obs = levenshtein(deleted_warnings, added_warnings)
+            # the diff does not depend on the hunk, it is computed once per file action and counted once for each hunk
+            nr_hunks = Hunk.objects.filter(file_action_id=fa.id).count()
+            if nr_hunks:
+                distance, obs = WARNING_DIFF_CACHE.diff(deleted_warnings, added_warnings)
                 if distance > 0 and not obs:
                     print('error: distance > 0 and no ops')
                     print(deleted_warnings)
@@ -328,16 +582,17 @@ def find_warning_changes2(revisions):
                     print(obs)
                     print('--')
                 if distance > 0:
-                    for o in obs:
-                        tmp = o.split(':')
-                        if tmp[0] == 'add':
-                            cdata[tmp[1]] += 1
-                        elif tmp[0] == 'del':
-                            cdata[tmp[1]] -= 1
+                    for kind, warning_type in obs:
+                        if kind == 'add':
+                            cdata[warning_type] += nr_hunks
+                        elif kind == 'del':
+                            cdata[warning_type] -= nr_hunks
                         else:
                             print('error no such op')
             # each change to a file for each revision
             results.append(cdata)
+    FILE_CACHE.print_stats()
+    WARNING_DIFF_CACHE.print_stats()
     return results
 
 
@@ -352,8 +607,10 @@ def find_warning_changes(revisions):
     state.update(**{'global_method_lloc_sum': 0, 'global_method_lloc_avg': 0, 'global_method_mccc_sum': 0, 'global_method_mccc_avg': 0, 'global_method_mims_sum': 0, 'global_method_mims_avg': 0, 'global_nr_methods': 0})
 
     for i, revision in enumerate(log_progress(revisions, every=1)):
-        commit = Commit.objects.get(revision_hash=revision)
-        previous_commit = Commit.objects.get(revision_hash=revisions[i - 1])
+        commit = get_commit(revision_hash=revision)
+        previous_commit = get_commit(revision_hash=revisions[i - 1])
+        # all file paths of the project in one query instead of one query per commit
+        FILE_CACHE.preload(commit.vcs_system_id)
 
         # print(revision, commit.parents)
 
@@ -361,17 +618,18 @@ def find_warning_changes(revisions):
         cdata.update(**{r['abbrev']: 0 for r in PMD_RULES})
         cdata.update(**{'method_lloc_sum': 0, 'method_lloc_avg': 0, 'method_mccc_sum': 0, 'method_mccc_avg': 0, 'method_mims_sum': 0, 'method_mims_avg': 0, 'nr_methods': 0, 'file_path': None, 'change_location': None})
 
-        for fa in FileAction.objects.filter(commit_id=commit.id):
-            f1 = File.objects.get(id=fa.file_id)
+        file_actions, files = FILE_CACHE.get_file_actions(FileAction.objects.filter(commit_id=commit.id))
+        for fa in file_actions:
+            f1 = files[fa.file_id]
             f2 = None
 
             old_file = f1
             if fa.old_file_id:
-                f2 = File.objects.get(id=fa.old_file_id)
+                f2 = files[fa.old_file_id]
                 old_file = f2
 
             # only java files
-            if not f1.path.lower().endswith('.java') or not old_file.path.lower().endswith('.java'):
+            if not f1.is_java or not old_file.is_java:
                 continue
 
             check_id = ObjectId(f1.id)
@@ -385,7 +643,7 @@ def find_warning_changes(revisions):
                 continue
 
             # need to aggregate the quality metrics here
-            if f1.path.lower().endswith('.java') and old_file.path.lower().endswith('.java'):
+            if f1.is_java and old_file.is_java:
                 metrics = get_metrics(previous_commit, commit, f1, old_file)
                 for k, v in metrics.items():
                     cdata[k] += v
@@ -393,24 +651,13 @@ def find_warning_changes(revisions):
             warnings_current = get_warnings(commit, f1.path)
             warnings_previous = get_warnings(previous_commit, old_file.path)
 
-            added_warnings = []
-            deleted_warnings = []
-
-            # find narrowest CES for each hunk line?
-            # find narrowest CES for each line
-            for hunk in Hunk.objects.filter(file_action_id=fa.id):
-                lines_added, lines_deleted = hunk_lines(hunk)
-
-                added_warnings = []
-                deleted_warnings = []
-                for k, v in warnings_current.items():
-                    tmp = k.split(':')
-                    added_warnings.append(tmp[2])
-                for k2, v2 in warnings_previous.items():
-                    tmp2 = k2.split(':')
-                    deleted_warnings.append(tmp2[2])
+            added_warnings = [k.split(':')[2] for k in warnings_current.keys()]
+            deleted_warnings = [k.split(':')[2] for k in warnings_previous.keys()]
 
-                distance, obs = levenshtein(deleted_warnings, added_warnings)
+            # the diff does not depend on the hunk, it is computed once per file action and counted once for each hunk
+            nr_hunks = Hunk.objects.filter(file_action_id=fa.id).count()
+            if nr_hunks:
+                distance, obs = WARNING_DIFF_CACHE.diff(deleted_warnings, added_warnings)
                 if distance > 0 and not obs:
                     print('error: distance > 0 and no ops')
                     print(deleted_warnings)
@@ -418,12 +665,11 @@ def find_warning_changes(revisions):
                     print(obs)
                     print('--')
                 if distance > 0:
-                    for o in obs:
-                        tmp = o.split(':')
-                        if tmp[0] == 'add':
-                            cdata[tmp[1]] += 1
-                        elif tmp[0] == 'del':
-                            cdata[tmp[1]] -= 1
+                    for kind, warning_type in obs:
+                        if kind == 'add':
+                            cdata[warning_type] += nr_hunks
+                        elif kind == 'del':
+                            cdata[warning_type] -= nr_hunks
                         else:
                             print('error no such op')
         for k, v in cdata.items():
@@ -433,6 +679,8 @@ def find_warning_changes(revisions):
         cdata.update(**state)
 
         results.append(cdata)
+    FILE_CACHE.print_stats()
+    WARNING_DIFF_CACHE.print_stats()
     return results
 
 
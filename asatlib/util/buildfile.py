@@ -1,6 +1,7 @@
 
 import re
 import glob
+import hashlib
 import os
 import subprocess
 import shutil
@@ -8,7 +9,10 @@ import shutil
 from lxml import etree
 from shutil import copyfile
 
-from util.pmd import PMD_NAME_TO_SM, PMD_OLD_RULESETS, DEFAULT_RULES_MAVEN_CLEANED
+from util.pmd import PMD_NAME_TO_SM, PMD_OLD_RULESETS, PMD_OLD_RULESETS_SM, DEFAULT_RULES_MAVEN_CLEANED
+from util.path_index import PathIndex
+from util.parent_fixups import fixup_key
+from util.git import GitError
 
 
 class MavenError(Exception):
@@ -20,6 +24,7 @@ class MavenError(Exception):
 
         error_types = {
             'unknown': None,
+            'offline': 'in offline mode',
             'parse': 'Non-parseable POM',
             'parent': 'Non-resolvable parent POM for',
             'malformed': 'Malformed POM',
@@ -31,6 +36,10 @@ class MavenError(Exception):
             if v and v in output:
                 self.type = k
 
+        # an artifact missing offline is usually reported as "Non-resolvable parent POM ... in offline mode", the repository was not seeded
+        if error_types['offline'] in output:
+            self.type = 'offline'
+
         for line in output.split('\n'):
             if error_types[self.type] and error_types[self.type] in line:
                 self.line = line
@@ -168,6 +177,139 @@ CUSTOM_RULE_PROBLEMS = {'commons-digester': ['src/checkstyle/fileupload_basic.xm
                         'mahout': ['mahout-pmd-ruleset.xml']}
 
 
+def fix_parent_coordinates(group_id, artifact_id, version, has_relative_path):
+    """Return groupId, artifactId and version of a parent POM that can be resolved and the list of replacements."""
+    replacement = []
+    if group_id == 'org.apache.commons' and artifact_id == 'commons':
+        artifact_id = 'commons-parent'
+        replacement.append({'old': 'commons', 'new': artifact_id})
+
+    if group_id == 'org.apache.commons' and artifact_id == 'commons-sandbox':
+        artifact_id = 'commons-sandbox-parent'
+        replacement.append({'old': 'commons-sandbox', 'new': artifact_id})
+
+    if group_id == 'org.apache.commons' and artifact_id == 'commons-sandbox-parent' and version == '1.0-SNAPSHOT':
+        new_version = '1'
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    if group_id == 'org.apache.opennlp' and artifact_id == 'opennlp-reactor':
+        artifact_id = 'opennlp'
+        replacement.append({'old': 'opennlp-reactor', 'new': artifact_id})
+
+    # not working
+    # if pomfile.endswith('invertedindex/pom.xml') and group_id == 'org.apache.kylin' and artifact_id == 'kylin' and version == '0.7.1-SNAPSHOT':
+    #     new_version = version.replace('-SNAPSHOT', '-incubating-SNAPSHOT')
+    #     replacement.append({'old': version, 'new': new_version})
+    #     vnode.text = new_version
+    #     version = new_version
+
+    # snapshot is probably not available anymore but only if it does not refer to a local pom via relativePath
+    if '-SNAPSHOT' in version and not has_relative_path:
+        new_version = version.replace('-SNAPSHOT', '')
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    # mahout has parent pointing to 0.1 but only 0.2 is in maven repository
+    # Failure to find org.apache.mahout:mahout:pom:0.2-SNAPSHOT
+    # if group_id == 'org.apache.wss4j' and artifact_id == 'wss4j-parent'
+
+    # streams
+    if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.1-SNAPSHOT', '0.1']:
+        new_version = '0.1-incubating'
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.2-SNAPSHOT', '0.2']:
+        new_version = '0.2-incubating'
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.3-SNAPSHOT', '0.3']:
+        new_version = '0.3-incubating'
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    if group_id == 'org.apache.streams.osgi-components' and artifact_id == 'streams-osgi-components' and version in ['0.1-SNAPSHOT', '0.1']:
+        new_version = '0.1-incubating'
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    # 1.0 is invalid only 1 is valid in this case
+    if group_id == 'org.apache.commons' and artifact_id == 'commons-parent' and '.' in version:
+        new_version = version.split('.')[0]
+        replacement.append({'old': version, 'new': new_version})
+        version = new_version
+
+    return group_id, artifact_id, version, replacement
+
+
+def pom_coordinates(pomfile):
+    """Return groupId, artifactId and version of the POM file, groupId and version may be inherited from its parent."""
+    with open(pomfile, 'rb') as f:
+        data = f.read().decode('utf-8', 'ignore')
+    doc = etree.fromstring(data.encode('utf-8'))
+
+    def text(path):
+        node = doc.find(path)
+        if node is None or node.text is None:
+            return None
+        return node.text.strip()
+    return text('{*}groupId') or text('{*}parent/{*}groupId'), text('{*}artifactId'), text('{*}version') or text('{*}parent/{*}version')
+
+
+def effective_pom_command(local_repository=None, offline=False):
+    """Return the mvn help:effective-pom command, offline it only uses what is already in the local repository."""
+    command = ['mvn', 'help:effective-pom', '-B']
+    if offline:
+        command.append('-o')
+    else:
+        command.append('-U')
+    if local_repository:
+        command.append('-Dmaven.repo.local={}'.format(os.path.abspath(local_repository)))
+    return command
+
+
+LOCAL_REPOSITORY = os.path.expanduser('~/.m2/repository')
+
+# parsed ruleset files by sha1 of their content: (frozenset of sourcemeter rules, groups_expanded)
+RULESET_CACHE = {}
+
+POM_NS = 'http://maven.apache.org/POM/4.0.0'
+PROJECT_TAG = '{{{}}}project'.format(POM_NS)
+
+# //m:plugins/m:plugin[m:artifactId = ...] queries of the effective POM and the state they set
+DETECTED_PLUGINS = {'maven-checkstyle-plugin': 'use_checkstyle',
+                    'findbugs-maven-plugin': 'use_findbugs',
+                    'spotbugs-maven-plugin': 'use_spotbugs',
+                    'maven-pmd-plugin': 'pmd'}
+
+
+def _child_values(element, name):
+    return [''.join(c.itertext()) for c in element.iterchildren('{{{}}}{}'.format(POM_NS, name))]
+
+
+def _tool_usage(project):
+    """Return the tools the document wide queries of parse_effective_pom find in the subtree of the project, in one pass."""
+    found = set()
+    for element in project.iter('{{{}}}plugin'.format(POM_NS), '{{{}}}path'.format(POM_NS), '{{{}}}dependency'.format(POM_NS)):
+        if element.tag.endswith('}plugin'):
+            parent = element.getparent()
+            if parent is None or parent.tag != '{{{}}}plugins'.format(POM_NS):
+                continue
+            for artifact_id in _child_values(element, 'artifactId'):
+                if artifact_id in DETECTED_PLUGINS.keys():
+                    found.add(DETECTED_PLUGINS[artifact_id])
+            # detects sonar inclusion for maven-reporting
+            # taken from: https://github.com/apache/helix/blob/master/pom.xml#L814
+            if 'org.codehaus.sonar-plugins' in _child_values(element, 'groupId'):
+                found.add('use_sonarcube')
+        # taken from: https://github.com/apache/wss4j/blob/trunk/pom.xml#L248
+        elif 'com.google.errorprone' in _child_values(element, 'groupId'):
+            found.add('use_errorprone')
+    return found
+
+
 class PomPom:
     """
     Parses effective POM output from mvn help:effective-pom.
@@ -178,19 +320,35 @@ class PomPom:
     def find_file(self, needle):
         if '..' in needle:
             needle = needle.replace('..', '')
+
+        # the index of the revision is built on the first lookup, the checkout may not be a git repository
+        if self.path_index is None:
+            try:
+                self.path_index = PathIndex.from_git(self.checkout_path, self.checkout_path, self.revision_hash)
+            except (GitError, OSError):
+                self.path_index = False
+        if self.path_index:
+            return self.path_index.find(self.basedir, needle)
+
         for root, dirs, files in os.walk(self.basedir):
             for file in files:
                 filepath = os.path.join(root, file)
                 if filepath.endswith(needle):
                     return filepath
 
-    def __init__(self, basedir, project_name, revision_hash):
+    def __init__(self, basedir, project_name, revision_hash, local_repository=None, offline=False):
         self.basedir = basedir
         self.project_name = project_name
         self.revision_hash = revision_hash
+        self.local_repository = local_repository  # None for the default Maven repository
+        self.offline = offline
+        self.maven_command = effective_pom_command(local_repository, offline)
+        self.parent_fixups = None  # ParentFixups that skip the failing first Maven run
 
         if not self.basedir.endswith('/'):
             self.basedir += '/'
+        self.checkout_path = self.basedir
+        self.path_index = None  # PathIndex of the files of the revision for find_file
 
         if project_name in CUSTOM_POM_PATHS.keys():
             for custom_dir, revisions in CUSTOM_POM_PATHS[project_name].items():
@@ -200,6 +358,19 @@ class PomPom:
                         self.basedir += '/'
 
         self.poms = {}  # holds state for each POM of the repository
+        self.ruleset_files = {}  # ruleset files read while parsing, None if not found
+
+    def resolve_ruleset(self, rel_path_file, verbose=True):
+        """Return the path of the ruleset file, if it is not found relative to basedir the first file ending with it."""
+        file = self.basedir + rel_path_file
+
+        if not os.path.isfile(self.basedir + rel_path_file):
+            found = self.find_file(rel_path_file)
+            if found:
+                if verbose:
+                    print('replacing {} with {}'.format(file, found))
+                file = found
+        return file
 
     def _relative_path(self, path):
         if '${project.parent.basedir}' in path:
@@ -226,28 +397,17 @@ class PomPom:
 #                if self.revision_hash in CUSTOM_PATHS[self.project_name][rel_path_file]['revisions']:
 
         rules = set()
-        file = self.basedir + rel_path_file
-
-        if not os.path.isfile(self.basedir + rel_path_file):
-            found = self.find_file(rel_path_file)
-            if found:
-                print('replacing {} with {}'.format(file, found))
-                file = found
+        file = self.resolve_ruleset(rel_path_file)
+        self.ruleset_files[rel_path_file] = file if os.path.isfile(file) else None
 
         # group expansion for files in the form ruleset>/rulesets/braces.xml</ruleset>
         if not os.path.isfile(file):
             print('no such file {}, trying group expansion'.format(file))
             category = rel_path_file.split('/')[-1].split('.')[0].lower()
-            if category in PMD_OLD_RULESETS.keys():
+            if category in PMD_OLD_RULESETS_SM.keys():
                 groups_expanded = True
-                rules = set()
                 # 1. get rules from category
-                pmd_names = PMD_OLD_RULESETS[category]
-
-                for pmd_name in pmd_names.split(','):
-                    k = pmd_name.strip()
-                    if k in PMD_NAME_TO_SM.keys():
-                        rules.add(PMD_NAME_TO_SM[k])
+                rules = PMD_OLD_RULESETS_SM[category]
             else:
                 print('[{}] file {} ({}), could not find category {}'.format(self.revision_hash, file, rel_path_file, category))
                 if self.project_name in CUSTOM_RULE_PROBLEMS.keys() and rel_path_file in CUSTOM_RULE_PROBLEMS[self.project_name]:
@@ -258,6 +418,15 @@ class PomPom:
 
             return rules, groups_expanded
 
+        # the same ruleset is read for every module of every revision
+        with open(file, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        if digest in RULESET_CACHE.keys():
+            rules, groups_expanded = RULESET_CACHE[digest]
+            if not rules:
+                print('empty pmd rules for file {}'.format(rel_path_file))
+            return rules, groups_expanded
+
         doc = etree.parse(file)
         root = doc.getroot()
 
@@ -292,16 +461,11 @@ class PomPom:
 
             # rule expansion from category
             try:
-                pmd_names = PMD_OLD_RULESETS[category]
+                rules.update(PMD_OLD_RULESETS_SM[category])
             except KeyError as e:
                 print('ruleset {} not found in [{}]'.format(category, ','.join(PMD_OLD_RULESETS.keys())))
                 raise
 
-            for pmd_name in pmd_names.split(','):
-                k = pmd_name.strip()
-                if k in PMD_NAME_TO_SM.keys():
-                    rules.add(PMD_NAME_TO_SM[k])
-
             for exclude in query_ns(rule, 'm:exclude', ns):
                 k = exclude.attrib['name']
                 if k in PMD_NAME_TO_SM.keys() and PMD_NAME_TO_SM[k] in rules:
@@ -311,9 +475,12 @@ class PomPom:
             groups_expanded = True
             print('empty pmd rules for file {}'.format(rel_path_file))
 
+        rules = frozenset(rules)
+        RULESET_CACHE[digest] = (rules, groups_expanded)
         return rules, groups_expanded
 
-    def _replace_parent_in_pom(self, pomfile):
+    def _read_parent(self, pomfile):
+        """Return the document of the POM file, the artifactId and version nodes and the coordinates of its parent."""
         ns = {'m': 'http://maven.apache.org/POM/4.0.0'}
 
         # I really whish I would not have to do this
@@ -336,77 +503,49 @@ class PomPom:
             artifact_id = anode.text
         if vnode is not None:
             version = vnode.text
+        return doc, anode, vnode, (group_id, artifact_id, version, rnode is not None)
 
-        # replacement rules here
-        replacement = []
-        if group_id == 'org.apache.commons' and artifact_id == 'commons':
-            artifact_id = 'commons-parent'
-            replacement.append({'old': 'commons', 'new': artifact_id})
-            anode.text = artifact_id
-
-        if group_id == 'org.apache.commons' and artifact_id == 'commons-sandbox':
-            artifact_id = 'commons-sandbox-parent'
-            replacement.append({'old': 'commons-sandbox', 'new': artifact_id})
-            anode.text = artifact_id
-
-        if group_id == 'org.apache.commons' and artifact_id == 'commons-sandbox-parent' and version == '1.0-SNAPSHOT':
-            new_version = '1'
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
-
-        if group_id == 'org.apache.opennlp' and artifact_id == 'opennlp-reactor':
-            artifact_id = 'opennlp'
-            replacement.append({'old': 'opennlp-reactor', 'new': artifact_id})
-            anode.text = artifact_id
-
-        # not working
-        # if pomfile.endswith('invertedindex/pom.xml') and group_id == 'org.apache.kylin' and artifact_id == 'kylin' and version == '0.7.1-SNAPSHOT':
-        #     new_version = version.replace('-SNAPSHOT', '-incubating-SNAPSHOT')
-        #     replacement.append({'old': version, 'new': new_version})
-        #     vnode.text = new_version
-        #     version = new_version
-
-        # snapshot is probably not available anymore but only if it does not refer to a local pom via relativePath
-        if '-SNAPSHOT' in version and rnode is None:
-            new_version = version.replace('-SNAPSHOT', '')
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
+    def _parent_fixup_key(self, pomfile):
+        """Return the key of the parent of the POM file in the parent fixups, None if it can not be read."""
+        try:
+            _, _, _, coordinates = self._read_parent(pomfile)
+        except (OSError, etree.XMLSyntaxError):
+            return None
+        return fixup_key(*coordinates)
 
-        # mahout has parent pointing to 0.1 but only 0.2 is in maven repository
-        # Failure to find org.apache.mahout:mahout:pom:0.2-SNAPSHOT
-        # if group_id == 'org.apache.wss4j' and artifact_id == 'wss4j-parent'
+    def _parent_resolves(self, pomfile):
+        """Return True if Maven finds the parent of the POM file without a replacement.
 
-        # streams
-        if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.1-SNAPSHOT', '0.1']:
-            new_version = '0.1-incubating'
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
+        That is the case if the POM file at its relativePath (../pom.xml by default) in the checkout has the coordinates of the
+        parent or the parent is in the local Maven repository.
+        """
+        ns = {'m': 'http://maven.apache.org/POM/4.0.0'}
+        doc, _, _, (group_id, artifact_id, version, _) = self._read_parent(pomfile)
+        coordinates = tuple((c or '').strip() for c in (group_id, artifact_id, version))
 
-        if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.2-SNAPSHOT', '0.2']:
-            new_version = '0.2-incubating'
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
+        rnode = doc.find('m:parent/m:relativePath', namespaces=ns)
+        relative_path = '../pom.xml' if rnode is None else (rnode.text or '').strip()
+        if relative_path:
+            candidate = os.path.normpath(os.path.join(os.path.dirname(pomfile), relative_path))
+            if os.path.isdir(candidate):
+                candidate = os.path.join(candidate, 'pom.xml')
+            try:
+                if os.path.isfile(candidate) and pom_coordinates(candidate) == coordinates:
+                    return True
+            except etree.XMLSyntaxError:
+                pass
 
-        if group_id == 'org.apache.streams' and artifact_id == 'streams-master' and version in ['0.3-SNAPSHOT', '0.3']:
-            new_version = '0.3-incubating'
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
+        version_dir = os.path.join(self.local_repository or LOCAL_REPOSITORY, *coordinates[0].split('.'), coordinates[1], coordinates[2])
+        return os.path.isdir(version_dir) and any(f.endswith('.pom') for f in os.listdir(version_dir))
 
-        if group_id == 'org.apache.streams.osgi-components' and artifact_id == 'streams-osgi-components' and version in ['0.1-SNAPSHOT', '0.1']:
-            new_version = '0.1-incubating'
-            replacement.append({'old': version, 'new': new_version})
-            vnode.text = new_version
-            version = new_version
+    def _replace_parent_in_pom(self, pomfile):
+        doc, anode, vnode, (group_id, artifact_id, version, has_relative_path) = self._read_parent(pomfile)
 
-        # 1.0 is invalid only 1 is valid in this case
-        if group_id == 'org.apache.commons' and artifact_id == 'commons-parent' and '.' in version:
-            new_version = version.split('.')[0]
-            replacement.append({'old': version, 'new': new_version})
+        # replacement rules here
+        _, new_artifact_id, new_version, replacement = fix_parent_coordinates(group_id, artifact_id, version, has_relative_path)
+        if new_artifact_id != artifact_id:
+            anode.text = new_artifact_id
+        if new_version != version:
             vnode.text = new_version
 
         if replacement:
@@ -426,9 +565,38 @@ class PomPom:
         if not os.path.isfile(os.path.normpath(self.basedir + '/pom.xml')):
             raise OSError(os.path.normpath(self.basedir + '/pom.xml') + ' not found')
 
+    def _create_effective_pom_fixed(self, key):
+        """Return the output and replacements of one Maven run with the learned parent replacement, None if it did not work."""
+        pomfile = self.basedir + '/pom.xml'
+        with open(pomfile, 'rb') as f:
+            original = f.read()
+
+        replacements = self._replace_parent_in_pom(pomfile)
+        if replacements:
+            r = subprocess.run(self.maven_command, cwd=self.basedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if r.returncode == 0:
+                self.parent_fixups.hit(key)
+                return r.stdout, replacements
+
+        # the usual runs with the unchanged pom.xml
+        self.parent_fixups.miss(key)
+        with open(pomfile, 'wb') as f:
+            f.write(original)
+        return None
+
     def create_effective_pom(self):
+        # the parent of the main pom.xml needed a replacement before, the first run would fail again unless this revision has
+        # the parent in the checkout or in the local repository
+        key = None
+        if self.parent_fixups is not None:
+            key = self._parent_fixup_key(self.basedir + '/pom.xml')
+            if key is not None and self.parent_fixups.lookup(key) is not None and not self._parent_resolves(self.basedir + '/pom.xml'):
+                result = self._create_effective_pom_fixed(key)
+                if result is not None:
+                    return result
+
         # call help:effective-pom to generate the effective pom the project uses
-        r = subprocess.run(['mvn', 'help:effective-pom', '-B', '-U'], cwd=self.basedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        r = subprocess.run(self.maven_command, cwd=self.basedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         replacements = []
         out = r.stdout
 
@@ -437,28 +605,23 @@ class PomPom:
 
             # but only in the main pom.xml
             replacements = self._replace_parent_in_pom(self.basedir + '/pom.xml')
-            r2 = subprocess.run(['mvn', 'help:effective-pom', '-B', '-U'], cwd=self.basedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            r2 = subprocess.run(self.maven_command, cwd=self.basedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             out = r2.stdout
             # if we still error we bail
             if r2.returncode != 0:
                 raise MavenError(r2.stdout.decode('utf-8'))
 
+            if key is not None and replacements:
+                self.parent_fixups.learn(key, self.revision_hash, replacements)
+
         return out, replacements
 
-    def parse_effective_pom(self, file):
-        """
-        Read Pom from passed file (effective pom).
+    def _effective_pom_lines(self, file):
+        """Yield the lines of the XML in the output of mvn help:effective-pom.
 
-        The file can consist of multiple POMs via a top level <projects> in the xml string, those are
-        translated to idents via their groupId and artifactId which then hold a separate state for each
-        pom.
+        We are discarding every line not included in the xml because help:effective-pom outputs more than the xml to stdout and
+        we are ignoring non utf-8 chars because some projects have them in utf-8 encoded xml files.
         """
-        ns = {'m': 'http://maven.apache.org/POM/4.0.0'}
-
-        # I really whish I would not have to do this
-        # a) we are discarding every line not starting included in the xml because help:effective-pom outputs more than the xml to stdout
-        # b) we are ignoring non utf-8 chars because some projects have them in utf-8 encoded xml files
-        data = ''
         in_xml = False
         multi_project = False
         for line in file.decode('utf-8', 'ignore').split('\n'):
@@ -467,153 +630,207 @@ class PomPom:
             if line.strip().startswith('<projects>'):
                 multi_project = True
             if in_xml:
-                data += line
+                yield line
             # closing tag is dependent on multi project pom
             if not multi_project and line.strip().startswith('</project>'):
                 in_xml = False
             if multi_project and line.strip().startswith('</projects>'):
                 in_xml = False
 
-        # with open(file, 'rb') as f:
-        #     for line in f.readlines():
-        #         if line.decode('utf-8', 'ignore').strip().startswith('<'):
-        #             data += line
-
-        doc = etree.fromstring(data.encode('utf-8'))
-
-        for project in doc.xpath('//m:project', namespaces=ns):
-            gid = project.find('m:groupId', namespaces=ns)
-            aid = project.find('m:artifactId', namespaces=ns)
-            ver = project.find('m:version', namespaces=ns)
-
-            if gid is not None:
-                ident = gid.text
-            else:
-                ident = 'unknown'
-
-            if aid is not None:
-                ident += ':' + aid.text
-            else:
-                ident += ':unknown'
-
-            if ver is not None:
-                ident += '-' + ver.text
-            else:
-                ident += '-unknown'
-
-            if ident in self.poms.keys():
-                raise Exception('duplicate project ident: {}'.format(ident))
-
-            # set defaults for this project
-            self.poms[ident] = {'use_pmd': False,
-                                'use_checkstyle': False,
-                                'use_findbugs': False,
-                                'use_spotbugs': False,
-                                'use_sonarcube': False,
-                                'use_errorprone': False,
-                                'custom_rule_files': set(),
-                                'exclude_roots': set(),
-                                'excludes': set(),
-                                'includes': set(),
-                                'include_tests': False,
-                                'exclude_from_failure': set(),
-                                'language': 'java',
-                                'rules': set(),
-                                'minimum_priority': 5,
-                                'source_directory': None,
-                                'test_source_directory': None,
-                                'plugin_build': 0,
-                                'plugin_reporting': 0,
-                                }
-            # we just want to know if it is there
-            if len(project.xpath('//m:plugins/m:plugin[m:artifactId = "maven-checkstyle-plugin"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_checkstyle'] = True
-            if len(project.xpath('//m:plugins/m:plugin[m:artifactId = "findbugs-maven-plugin"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_findbugs'] = True
-            if len(project.xpath('//m:plugins/m:plugin[m:artifactId = "spotbugs-maven-plugin"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_spotbugs'] = True
-            # taken from: https://github.com/apache/wss4j/blob/trunk/pom.xml#L248
-            if len(project.xpath('//m:path[m:groupId = "com.google.errorprone"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_errorprone'] = True
-            
-            if len(project.xpath('//m:dependency[m:groupId = "com.google.errorprone"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_errorprone'] = True
+    def parse_effective_pom(self, file):
+        """
+        Read Pom from passed file (effective pom).
 
-            # detects sonar inclusion for maven-reporting
-            # taken from: https://github.com/apache/helix/blob/master/pom.xml#L814
-            if len(project.xpath('//m:plugins/m:plugin[m:groupId = "org.codehaus.sonar-plugins"]', namespaces=ns)) > 0:
-                self.poms[ident]['use_sonarcube'] = True
+        The file can consist of multiple POMs via a top level <projects> in the xml string, those are
+        translated to idents via their groupId and artifactId which then hold a separate state for each
+        pom.
 
-            for sd in project.xpath('m:build/m:sourceDirectory', namespaces=ns):
-                self.poms[ident]['source_directory'] = self._relative_path(sd.text)
+        The xml is parsed incrementally, every top level project is processed and released as soon as it is complete.
+        The tool detection is document wide (a tool used in one module is used in every module), it is collected in one pass
+        over every module and set when the document is complete.
+        """
+        parser = etree.XMLPullParser(events=('end',), tag=PROJECT_TAG)
+        found = set()
+        idents = []
+        pending_pmd = []
+
+        # the lines are joined without newlines like the whole document was before
+        lines = []
+        xml_lines = self._effective_pom_lines(file)
+        for line in xml_lines:
+            lines.append(line)
+            try:
+                parser.feed(line.encode('utf-8'))
+            except etree.XMLSyntaxError:
+                self._raise_document_error(lines + list(xml_lines))
+                raise
+            self._parse_events(parser, found, idents, pending_pmd)
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            self._raise_document_error(lines)
+            raise
+        self._parse_events(parser, found, idents, pending_pmd)
+
+        for ident in idents:
+            for tool in found:
+                if tool != 'pmd':
+                    self.poms[ident][tool] = True
+
+        # if we find maven plugin in any module every module uses pmd with the default maven plugin rules
+        if 'pmd' in found:
+            for ident in pending_pmd:
+                self.poms[ident]['use_pmd'] = True
+                self.poms[ident]['rules'] = set(DEFAULT_RULES_MAVEN_CLEANED)
+        return self.poms
 
-            for td in project.xpath('m:build/m:testSourceDirectory', namespaces=ns):
-                self.poms[ident]['test_source_directory'] = self._relative_path(td.text)
+    def _raise_document_error(self, lines):
+        """Raise the error of parsing the whole document at once, the incremental parser may report it differently."""
+        etree.fromstring(''.join(lines).encode('utf-8'))
 
-            # early return for not having the plugin
-            if len(project.xpath('//m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns)) == 0:
+    def _parse_events(self, parser, found, idents, pending_pmd):
+        """Process the top level projects the parser completed and release them."""
+        for _, project in parser.read_events():
+            if next(project.iterancestors(PROJECT_TAG), None) is not None:
                 continue
+            used = _tool_usage(project)
+            found.update(used)
+
+            # nested projects are handled like //m:project in document order
+            for p in project.iter(PROJECT_TAG):
+                ident = self._parse_project(p, 'pmd' in used)
+                idents.append(ident)
+                if 'pmd' not in used:
+                    pending_pmd.append(ident)
+
+            project.clear()
+            parent = project.getparent()
+            if parent is not None:
+                parent.remove(project)
+
+    def _parse_project(self, project, use_pmd):
+        """Set the state of one project of the effective POM except for the document wide tool detection and return its ident.
+
+        The PMD configuration is only read if the subtree of the project uses the maven-pmd-plugin, otherwise the project
+        does not configure it itself.
+        """
+        ns = {'m': 'http://maven.apache.org/POM/4.0.0'}
 
-            # if we find maven plugin we use pmd and set the default maven plugin rules
-            self.poms[ident]['use_pmd'] = True
-            self.poms[ident]['rules'] = set(DEFAULT_RULES_MAVEN_CLEANED)
-
-            # how often does the plugin appear in build and reporting sections
-            self.poms[ident]['plugin_build'] = len(project.xpath('m:build/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns))
-            self.poms[ident]['plugin_reporting'] = len(project.xpath('m:reporting/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns))
-
-            for plugin in project.xpath('m:reporting/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:build/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:reporting/m:pluginManagement/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:build/m:pluginManagement/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns):
-                mp = plugin.find('m:configuration/m:minimumPriority', namespaces=ns)
-                lang = plugin.find('m:configuration/m:language', namespaces=ns)
-                sr = plugin.find('m:configuration/m:compileSourceRoots/m:compileSourceRoot', namespaces=ns)
-                tr = plugin.find('m:configuration/m:testSourceRoots/m:testSourceRoot', namespaces=ns)
-                inclt = plugin.find('m:configuration/m:includeTests', namespaces=ns)
-                version = plugin.find('m:version', namespaces=ns)
-
-                if mp is not None:
-                    self.poms[ident]['minimum_priority'] = mp.text
-                if lang is not None:
-                    self.poms[ident]['language'] = lang.text.lower()
-                if sr is not None:
-                    # safety exception for conflicting source_directories if the plugin is defined in reporting and build
-                    if self.poms[ident]['source_directory'] and self.poms[ident]['source_directory'] != sr.text:
-                        raise Exception('duplicate source directory {} in {} this happens if the plugin defines two source directories in build or reporting'.format(self.project_name, self.revision_hash))
-                    self.poms[ident]['source_directory'] = sr.text
-                if tr is not None:
-                    self.poms[ident]['test_source_directory'] = tr.text
-                if inclt is not None and inclt.text.lower() == 'true':
-                    self.poms[ident]['include_tests'] = True
-                if version is not None:
-                    self.poms[ident]['version'] = version.text
-
-                # this is a properties file not rule defs: https://maven.apache.org/plugins/maven-pmd-plugin/examples/violation-exclusions.html
-                # also probably not in reporting but build
-                for efr in plugin.xpath('m:configuration/m:excludeFromFailureFile', namespaces=ns):
-                    self.poms[ident]['exclude_from_failure'].add(efr.text)
-
-                for rs in plugin.xpath('m:configuration/m:rulesets/m:ruleset', namespaces=ns):
-                    self.poms[ident]['custom_rule_files'].add(self._relative_path(rs.text))
-
-                for exclr in plugin.xpath('m:configuration/m:excludeRoots/m:excludeRoot', namespaces=ns):
-                    self.poms[ident]['exclude_roots'].add(self._relative_path(exclr.text))
-
-                for exclf in plugin.xpath('m:configuration/m:excludes/m:exclude', namespaces=ns):
-                    for exfile in [d.strip() for d in exclf.text.split(',')]:
-                        if exfile:
-                            self.poms[ident]['excludes'].add(exfile)
-
-                for inclf in plugin.xpath('m:configuration/m:includes/m:include', namespaces=ns):
-                    self.poms[ident]['includes'].add(inclf.text)
-
-                # remove default maven rules in case of custom defined rules
-                if self.poms[ident]['custom_rule_files']:
-                    self.poms[ident]['rules'] = set()
-
-                custom_files = set()
-                for custom_ruleset in self.poms[ident]['custom_rule_files']:
-                    crules, groups_expanded = self._read_pmd_rules(custom_ruleset)
-                    if not groups_expanded:
-                        custom_files.add(custom_ruleset)
-                    self.poms[ident]['rules'].update(crules)
-                self.poms[ident]['custom_rule_files'] = custom_files
-        return self.poms
+        gid = project.find('m:groupId', namespaces=ns)
+        aid = project.find('m:artifactId', namespaces=ns)
+        ver = project.find('m:version', namespaces=ns)
+
+        if gid is not None:
+            ident = gid.text
+        else:
+            ident = 'unknown'
+
+        if aid is not None:
+            ident += ':' + aid.text
+        else:
+            ident += ':unknown'
+
+        if ver is not None:
+            ident += '-' + ver.text
+        else:
+            ident += '-unknown'
+
+        if ident in self.poms.keys():
+            raise Exception('duplicate project ident: {}'.format(ident))
+
+        # set defaults for this project
+        state = {'use_pmd': False,
+                 'use_checkstyle': False,
+                 'use_findbugs': False,
+                 'use_spotbugs': False,
+                 'use_sonarcube': False,
+                 'use_errorprone': False,
+                 'custom_rule_files': set(),
+                 'exclude_roots': set(),
+                 'excludes': set(),
+                 'includes': set(),
+                 'include_tests': False,
+                 'exclude_from_failure': set(),
+                 'language': 'java',
+                 'rules': set(),
+                 'minimum_priority': 5,
+                 'source_directory': None,
+                 'test_source_directory': None,
+                 'plugin_build': 0,
+                 'plugin_reporting': 0,
+                 }
+        self.poms[ident] = state
+
+        for sd in project.xpath('m:build/m:sourceDirectory', namespaces=ns):
+            state['source_directory'] = self._relative_path(sd.text)
+
+        for td in project.xpath('m:build/m:testSourceDirectory', namespaces=ns):
+            state['test_source_directory'] = self._relative_path(td.text)
+
+        # early return for not having the plugin
+        if not use_pmd:
+            return ident
+
+        # if we find maven plugin we use pmd and set the default maven plugin rules
+        state['use_pmd'] = True
+        state['rules'] = set(DEFAULT_RULES_MAVEN_CLEANED)
+
+        # how often does the plugin appear in build and reporting sections
+        state['plugin_build'] = len(project.xpath('m:build/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns))
+        state['plugin_reporting'] = len(project.xpath('m:reporting/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns))
+
+        for plugin in project.xpath('m:reporting/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:build/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:reporting/m:pluginManagement/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns) + project.xpath('m:build/m:pluginManagement/m:plugins/m:plugin[m:artifactId = "maven-pmd-plugin"]', namespaces=ns):
+            mp = plugin.find('m:configuration/m:minimumPriority', namespaces=ns)
+            lang = plugin.find('m:configuration/m:language', namespaces=ns)
+            sr = plugin.find('m:configuration/m:compileSourceRoots/m:compileSourceRoot', namespaces=ns)
+            tr = plugin.find('m:configuration/m:testSourceRoots/m:testSourceRoot', namespaces=ns)
+            inclt = plugin.find('m:configuration/m:includeTests', namespaces=ns)
+            version = plugin.find('m:version', namespaces=ns)
+
+            if mp is not None:
+                state['minimum_priority'] = mp.text
+            if lang is not None:
+                state['language'] = lang.text.lower()
+            if sr is not None:
+                # safety exception for conflicting source_directories if the plugin is defined in reporting and build
+                if state['source_directory'] and state['source_directory'] != sr.text:
+                    raise Exception('duplicate source directory {} in {} this happens if the plugin defines two source directories in build or reporting'.format(self.project_name, self.revision_hash))
+                state['source_directory'] = sr.text
+            if tr is not None:
+                state['test_source_directory'] = tr.text
+            if inclt is not None and inclt.text.lower() == 'true':
+                state['include_tests'] = True
+            if version is not None:
+                state['version'] = version.text
+
+            # this is a properties file not rule defs: https://maven.apache.org/plugins/maven-pmd-plugin/examples/violation-exclusions.html
+            # also probably not in reporting but build
+            for efr in plugin.xpath('m:configuration/m:excludeFromFailureFile', namespaces=ns):
+                state['exclude_from_failure'].add(efr.text)
+
+            for rs in plugin.xpath('m:configuration/m:rulesets/m:ruleset', namespaces=ns):
+                state['custom_rule_files'].add(self._relative_path(rs.text))
+
+            for exclr in plugin.xpath('m:configuration/m:excludeRoots/m:excludeRoot', namespaces=ns):
+                state['exclude_roots'].add(self._relative_path(exclr.text))
+
+            for exclf in plugin.xpath('m:configuration/m:excludes/m:exclude', namespaces=ns):
+                for exfile in [d.strip() for d in exclf.text.split(',')]:
+                    if exfile:
+                        state['excludes'].add(exfile)
+
+            for inclf in plugin.xpath('m:configuration/m:includes/m:include', namespaces=ns):
+                state['includes'].add(inclf.text)
+
+            # remove default maven rules in case of custom defined rules
+            if state['custom_rule_files']:
+                state['rules'] = set()
+
+            custom_files = set()
+            for custom_ruleset in state['custom_rule_files']:
+                crules, groups_expanded = self._read_pmd_rules(custom_ruleset)
+                if not groups_expanded:
+                    custom_files.add(custom_ruleset)
+                state['rules'].update(crules)
+            state['custom_rule_files'] = custom_files
+        return ident
@@ -0,0 +1,105 @@
+"""Queries over the CodeEntityStates of a commit.
+
+The CodeEntityStates of a commit are referenced by the code_entity_states id list of the commit document. Instead of downloading
+that list and sending it back inside an $in, the queries start from the commit and join the CodeEntityStates on the server.
+For servers where the join is slower the id list can still be sent in batches of $in queries.
+"""
+import re
+
+from pycoshark.mongomodels import Commit, CodeEntityState
+
+
+# 'lookup' joins the CodeEntityStates on the server, 'in' sends the code_entity_states id list in batches
+JOIN_MODE = 'lookup'
+IN_BATCH_SIZE = 10000
+
+
+def get_commit(**kwargs):
+    """Return the commit, the code_entity_states id list is only loaded if the join mode needs it."""
+    qs = Commit.objects
+    if JOIN_MODE == 'lookup':
+        qs = qs.exclude('code_entity_states')
+    return qs.get(**kwargs)
+
+
+def _ces_ids(commit):
+    ids = commit.code_entity_states
+    if not ids:
+        ids = Commit.objects.only('code_entity_states').get(id=commit.id).code_entity_states
+    return ids
+
+
+def _lookup_pipeline(commit, match):
+    return [
+        {'$match': {'_id': commit.id}},
+        {'$project': {'code_entity_states': 1}},
+        {'$unwind': '$code_entity_states'},
+        {'$lookup': {'from': CodeEntityState._get_collection_name(), 'localField': 'code_entity_states', 'foreignField': '_id', 'as': 'ces'}},
+        {'$unwind': '$ces'},
+        {'$replaceRoot': {'newRoot': '$ces'}},
+        {'$match': match},
+    ]
+
+
+def _find_in(commit, match, projection=None):
+    ids = _ces_ids(commit)
+    collection = CodeEntityState._get_collection()
+    for i in range(0, len(ids), IN_BATCH_SIZE):
+        query = dict(match)
+        query['_id'] = {'$in': ids[i:i + IN_BATCH_SIZE]}
+        for doc in collection.find(query, projection):
+            yield doc
+
+
+def find_commit_ces_raw(commit, match, fields=None):
+    """Yield the CodeEntityStates of the commit matching the raw MongoDB filter as dicts, optionally only with the given fields."""
+    projection = None
+    if fields:
+        projection = {f: 1 for f in fields}
+
+    if JOIN_MODE == 'in':
+        yield from _find_in(commit, match, projection)
+        return
+
+    pipeline = _lookup_pipeline(commit, match)
+    if projection:
+        pipeline.append({'$project': projection})
+    yield from Commit.objects().aggregate(*pipeline, allowDiskUse=True)
+
+
+def find_commit_ces(commit, match, fields=None):
+    """Yield the CodeEntityStates of the commit matching the raw MongoDB filter as documents."""
+    for doc in find_commit_ces_raw(commit, match, fields):
+        yield CodeEntityState._from_son(doc)
+
+
+def get_commit_ces(commit, match, fields=None):
+    """Return the single CodeEntityState of the commit matching the filter, raises like CodeEntityState.objects.get."""
+    docs = list(find_commit_ces(commit, match, fields))
+    if not docs:
+        raise CodeEntityState.DoesNotExist('no CodeEntityState matching {}'.format(match))
+    if len(docs) > 1:
+        raise CodeEntityState.MultipleObjectsReturned('{} CodeEntityStates matching {}'.format(len(docs), match))
+    return docs[0]
+
+
+def aggregate_commit_ces(commit, match, stages):
+    """Run the aggregation stages over the CodeEntityStates of the commit matching the filter.
+
+    In 'in' mode the matching ids are collected in batches first, the stages then only run over those ids.
+    """
+    if JOIN_MODE == 'in':
+        ids = [doc['_id'] for doc in _find_in(commit, match, {'_id': 1})]
+        return CodeEntityState.objects().aggregate(*([{'$match': {'_id': {'$in': ids}}}] + stages), allowDiskUse=True)
+
+    return Commit.objects().aggregate(*(_lookup_pipeline(commit, match) + stages), allowDiskUse=True)
+
+
+def startswith(prefix):
+    """Return a filter value matching strings starting with prefix, like the mongoengine __startswith operator."""
+    return {'$regex': '^' + re.escape(prefix)}
+
+
+def endswith(suffix):
+    """Return a filter value matching strings ending with suffix, like the mongoengine __endswith operator."""
+    return {'$regex': re.escape(suffix) + '$'}
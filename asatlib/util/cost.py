@@ -0,0 +1,155 @@
+"""Runtime estimates of the extraction stages per project.
+
+The runtime of a stage grows with one cheap statistic of the project (its units), e.g. the number of buildfile change revisions
+for the effective POM extraction. The seconds per unit of a stage are learned from the timings recorded in previous runs,
+a project that was already extracted is estimated with its last recorded runtime.
+"""
+import json
+import os
+import pickle
+import random
+
+from pycoshark.mongomodels import Commit, Project, VCSSystem
+
+from util.ces_query import get_commit, aggregate_commit_ces
+
+
+TIMINGS_FILE = './data/timings.json'
+
+# number of commits on the revision path sampled for the average number of file CodeEntityStates per commit
+CES_SAMPLE_SIZE = 10
+
+# rough initial seconds per unit until timings of the stage are recorded
+DEFAULT_SECONDS_PER_UNIT = {
+    'repositories': 0.001,
+    'revisions': 0.002,
+    'pmd_states': 15.0,
+    'coarse': 0.00005,
+}
+
+
+def _vcs_system(project_name):
+    project = Project.objects.get(name=project_name)
+    return VCSSystem.objects.get(project_id=project.id)
+
+
+def commit_count(project_name, last_commit=None):
+    return Commit.objects.filter(vcs_system_id=_vcs_system(project_name).id).count()
+
+
+def path_length(project_name, last_commit=None):
+    with open('./data/{}_revisions.pickle'.format(project_name), 'rb') as f:
+        return len(pickle.load(f))
+
+
+def buildfile_change_count(project_name, last_commit=None):
+    with open('./data/{}_buildfile_changes.pickle'.format(project_name), 'rb') as f:
+        return len(pickle.load(f))
+
+
+def ces_per_commit(project_name, last_commit=None):
+    """Return the average number of file CodeEntityStates of a sample of commits on the revision path."""
+    with open('./data/{}_revisions.pickle'.format(project_name), 'rb') as f:
+        revisions = pickle.load(f)
+    sample = random.Random(project_name).sample(revisions, min(CES_SAMPLE_SIZE, len(revisions)))
+    vcs_system = _vcs_system(project_name)
+
+    counts = []
+    for revision_hash in sample:
+        commit = get_commit(vcs_system_id=vcs_system.id, revision_hash=revision_hash)
+        c = aggregate_commit_ces(commit, {'ce_type': 'file'}, [{'$count': 'nr_ces'}])
+        counts.append(next(c, {'nr_ces': 0})['nr_ces'])
+    if not counts:
+        return 0
+    return sum(counts) / len(counts)
+
+
+def coarse_units(project_name, last_commit=None):
+    """Every revision on the path is queried, the queries scale with the CodeEntityStates of the revision."""
+    return path_length(project_name) * ces_per_commit(project_name)
+
+
+# units of the stage for a project
+STAGE_UNITS = {
+    'repositories': commit_count,
+    'revisions': commit_count,
+    'pmd_states': buildfile_change_count,
+    'coarse': coarse_units,
+}
+
+
+class CostEstimator:
+    """Estimates and records the runtime of the projects for one stage."""
+
+    def __init__(self, stage, timings_file=TIMINGS_FILE):
+        self.stage = stage
+        self.timings_file = timings_file
+        self.timings = {}
+        if os.path.exists(timings_file):
+            with open(timings_file, 'r') as f:
+                self.timings = json.load(f)
+        self.units = {}
+
+    def recorded(self):
+        return self.timings.get(self.stage, {})
+
+    def seconds_per_unit(self):
+        """Learned from all recorded timings of the stage, the default if nothing is recorded yet."""
+        recorded = [t for t in self.recorded().values() if t['units']]
+        if not recorded:
+            return DEFAULT_SECONDS_PER_UNIT[self.stage]
+        return sum(t['seconds'] for t in recorded) / sum(t['units'] for t in recorded)
+
+    def project_units(self, project_name, last_commit=None):
+        if project_name not in self.units.keys():
+            try:
+                self.units[project_name] = STAGE_UNITS[self.stage](project_name, last_commit)
+            except Exception as e:
+                print('[{}] no {} cost statistics ({})'.format(project_name, self.stage, e))
+                self.units[project_name] = None
+        return self.units[project_name]
+
+    def estimate(self, projects):
+        """Return estimated seconds per project name, projects without statistics get the mean of the other estimates."""
+        per_unit = self.seconds_per_unit()
+        recorded = self.recorded()
+        estimates = {}
+        for project_name, last_commit in projects:
+            units = self.project_units(project_name, last_commit)
+            if project_name in recorded.keys():
+                estimates[project_name] = recorded[project_name]['seconds']
+            elif units is not None:
+                estimates[project_name] = units * per_unit
+            else:
+                estimates[project_name] = None
+
+        known = [e for e in estimates.values() if e is not None]
+        mean = sum(known) / len(known) if known else 0
+        return {p: mean if e is None else e for p, e in estimates.items()}
+
+    def record(self, results):
+        """Store the runtime of the successful projects for the next runs."""
+        stage = self.timings.setdefault(self.stage, {})
+        for r in results:
+            if r['error']:
+                continue
+            stage[r['project']] = {'seconds': r['seconds'], 'units': self.units.get(r['project'])}
+
+        tmp = self.timings_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.timings, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.timings_file)
+
+
+def longest_first(projects, estimates):
+    """Order the projects by decreasing estimated runtime (longest processing time first)."""
+    return sorted(projects, key=lambda p: estimates[p[0]], reverse=True)
+
+
+def estimated_makespan(projects, estimates, processes):
+    """Return the estimated wall clock seconds if the projects are handed out in the given order to the next free process."""
+    loads = [0.0] * max(1, processes)
+    for project_name, _ in projects:
+        i = loads.index(min(loads))
+        loads[i] += estimates[project_name]
+    return max(loads)
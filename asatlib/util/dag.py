@@ -0,0 +1,103 @@
+import numpy as np
+
+
+NOT_VISITED = -2
+ROOT = -1
+
+
+class CommitDAG:
+    """
+    Compact commit graph in compressed sparse row (CSR) form.
+
+    Node ids are int32 positions in the sorted array of binary revision hashes, so they do not depend on the order the commits are read in.
+    Parents of node i are parent_indices[parent_offsets[i]:parent_offsets[i + 1]] in the order git stores them (first parent first).
+    """
+
+    def __init__(self, commits):
+        """Build the graph from an iterable of (revision_hash, parents) tuples."""
+        commits = list(commits)
+        self.hashes = np.array(sorted({bytes.fromhex(revision_hash) for revision_hash, _ in commits}), dtype='S20')
+        self.missing_parents = []
+
+        n = len(self.hashes)
+        parent_lists = [[] for _ in range(n)]
+        for revision_hash, parents in commits:
+            node = self.node(revision_hash)
+            for p in parents:
+                try:
+                    parent_lists[node].append(self.node(p))
+                except KeyError:
+                    self.missing_parents.append((revision_hash, p))
+
+        counts = np.array([len(pl) for pl in parent_lists], dtype=np.int64)
+        self.parent_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.parent_offsets[1:])
+        self.parent_indices = np.array([p for pl in parent_lists for p in pl], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, revision_hash):
+        try:
+            self.node(revision_hash)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def node(self, revision_hash):
+        """Return the node id of the revision hash, raises KeyError if it is not in the graph."""
+        key = bytes.fromhex(revision_hash)
+        i = int(np.searchsorted(self.hashes, key))
+        if i >= len(self.hashes) or self.hashes[i].ljust(20, b'\x00') != key:
+            raise KeyError(revision_hash)
+        return i
+
+    def revision_hash(self, node):
+        # numpy strips trailing null bytes from fixed width byte strings
+        return self.hashes[node].ljust(20, b'\x00').hex()
+
+    def parents(self, node):
+        return self.parent_indices[self.parent_offsets[node]:self.parent_offsets[node + 1]]
+
+    def bfs_ancestors(self, tip):
+        """
+        Breadth first search from tip along parent edges.
+
+        Returns the predecessor of every node in the BFS tree (ROOT for the tip, NOT_VISITED for nodes that are no ancestors of tip).
+        Parents are expanded in git order, so of several shortest paths the one that follows first parents closest to the tip wins.
+        """
+        pred = np.full(len(self.hashes), NOT_VISITED, dtype=np.int32)
+        pred[tip] = ROOT
+
+        # one level of the BFS at a time, the frontier is kept in the order a FIFO queue would visit the nodes
+        frontier = np.array([tip], dtype=np.int32)
+        while len(frontier):
+            starts = self.parent_offsets[frontier]
+            counts = self.parent_offsets[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # positions of the parent edges of the frontier nodes in queue order, parents in git order
+            edge_starts = np.cumsum(counts) - counts
+            edges = np.arange(total, dtype=np.int64) + np.repeat(starts - edge_starts, counts)
+            parents = self.parent_indices[edges]
+            children = np.repeat(frontier, counts)
+
+            new = pred[parents] == NOT_VISITED
+            parents = parents[new]
+            children = children[new]
+
+            # the first edge reaching a parent wins like in the queue, the new frontier is ordered by that edge
+            _, first = np.unique(parents, return_index=True)
+            first.sort()
+            frontier = parents[first]
+            pred[frontier] = children[first]
+        return pred
+
+    def path_from(self, pred, node):
+        """Return the revision hashes from node to the root of the BFS tree given by pred."""
+        path = []
+        while node != ROOT:
+            path.append(self.revision_hash(node))
+            node = pred[node]
+        return path
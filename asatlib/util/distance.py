@@ -1,50 +1,37 @@
+import hashlib
+from collections import OrderedDict
 
 import numpy as np
 
 
-def levenshtein(prevs, currs):
-    """Levenshtein distance metric implemented with Wagner-Fischer algorithm."""
+# above this number of matrix cells (8MB as uint16) levenshtein switches to the linear space Hirschberg mode
+MAX_MATRIX_CELLS = 4000000
+
+
+def op_string(kind, warning_type):
+    return '{}:{}'.format(kind, warning_type)
+
+
+def op_tuple(kind, warning_type):
+    return kind, warning_type
+
+
+def _trivial_ops(prevs, currs, op=op_string):
     ops = []
 
     # trivial cases
     if not prevs:
         for cur in currs:
-            ops.append('add:{}'.format(cur))
+            ops.append(op('add', cur))
     if not currs:
         for prev in prevs:
-            ops.append('del:{}'.format(prev))
-
-    # 1. initialize matrix with words including 0 word
-    rows = len(prevs) + 1
-    cols = len(currs) + 1
-    matrix = np.zeros((rows, cols))
-
-    matrix[0] = range(cols)
-    matrix[:, 0] = range(rows)
-
-    # 2. fill matrix according to levenshtein rules
-    for row in range(1, rows):
-        for col in range(1, cols):
-            # we skip 0 word with range(1, ) need to subtract again from word sequence
-            prev = prevs[row - 1]
-            curr = currs[col - 1]
-
-            # if char is the same use character use previous diagonal element because nothing has changed
-            if prev == curr:
-                matrix[row, col] = matrix[row - 1, col - 1]
+            ops.append(op('del', prev))
+    return ops
 
-            # else use minval of upper, leftmost and previous diagonal element + 1
-            else:
-                # but we do not necessarily know which one
-                # matrix[row, col - 1] insertions
-                # matrix[row - 1, col] deletion
-                # matrix[row - 1, col - 1] substitution
-                minval = min(matrix[row, col - 1], matrix[row - 1, col], matrix[row - 1, col - 1])
-                matrix[row, col] = minval + 1
-    # print(matrix)
 
-    distance = matrix[rows - 1, cols - 1]
-    # operations by using the matrix again from bottom right to top left
+def _backtrack(matrix, prevs, currs, ops, op=op_string):
+    """Append the operations by using the matrix again from bottom right to top left, return them in order."""
+    rows, cols = matrix.shape
     # https://stackoverflow.com/questions/41149377/extracting-operations-from-damerau-levenshtein
 
     row = rows - 1
@@ -64,25 +51,25 @@ def levenshtein(prevs, currs):
         if row - 1 == 0 and not col -1 == 0: # oberer rand rest ist insert oder keine änderung
             last_traversal = 'left'
             if idx < matrix[row, col]:
-                ops.append('add:{}'.format(currs[col - 1]))
+                ops.append(op('add', currs[col - 1]))
             col -= 1
             continue
         if col - 1 == 0 and not row -1 == 0:  # unterer rand, rest ist delete oder keine änderung
             last_traversal = 'up'
             if idx < matrix[row, col]:
-                ops.append('del:{}'.format(prevs[row - 1]))
+                ops.append(op('del', prevs[row - 1]))
             row -= 1
             continue
         if col - 1 == 0 and row - 1 == 0:  # ende erreicht, letzte änderung basiert auf unserer letzten operation, wenn es keine gab dann ist es eine subst
             if idx < matrix[row, col]:
                 if last_traversal == 'up':
-                    ops.append('del:{}'.format(prevs[row - 1]))
+                    ops.append(op('del', prevs[row - 1]))
                 elif last_traversal == 'left':
-                    ops.append('add:{}'.format(currs[col - 1]))
+                    ops.append(op('add', currs[col - 1]))
                 else:
                     # ops.append('substitution:{}->{}'.format(prevs[row - 1], currs[col - 1]))
-                    ops.append('del:{}'.format(prevs[row - 1]))
-                    ops.append('add:{}'.format(currs[col - 1]))
+                    ops.append(op('del', prevs[row - 1]))
+                    ops.append(op('add', currs[col - 1]))
             col -= 1
             row -= 1
             continue
@@ -91,16 +78,206 @@ def levenshtein(prevs, currs):
         if idx < matrix[row, col]:
             # finden wir die richtung, präferenz deletion, insertion, substitution
             if matrix[row - 1, col] < matrix[row, col]:
-                ops.append('del:{}'.format(prevs[row - 1]))
+                ops.append(op('del', prevs[row - 1]))
                 row -= 1
             elif matrix[row, col - 1] < matrix[row, col]:
-                ops.append('add:{}'.format(currs[col - 1]))
+                ops.append(op('add', currs[col - 1]))
                 col -= 1
             elif matrix[row - 1, col - 1] < matrix[row, col]:
                 # ops.append('substitution:{}->{}'.format(prevs[row - 1], currs[col - 1]))
-                ops.append('del:{}'.format(prevs[row - 1]))
-                ops.append('add:{}'.format(currs[col - 1]))
+                ops.append(op('del', prevs[row - 1]))
+                ops.append(op('add', currs[col - 1]))
                 row -= 1
                 col -= 1
 
-    return distance, list(reversed(ops))
+    return list(reversed(ops))
+
+
+def levenshtein_reference(prevs, currs):
+    """Levenshtein distance metric implemented with Wagner-Fischer algorithm, cell by cell (reference for levenshtein)."""
+    ops = _trivial_ops(prevs, currs)
+
+    # 1. initialize matrix with words including 0 word
+    rows = len(prevs) + 1
+    cols = len(currs) + 1
+    matrix = np.zeros((rows, cols))
+
+    matrix[0] = range(cols)
+    matrix[:, 0] = range(rows)
+
+    # 2. fill matrix according to levenshtein rules
+    for row in range(1, rows):
+        for col in range(1, cols):
+            # we skip 0 word with range(1, ) need to subtract again from word sequence
+            prev = prevs[row - 1]
+            curr = currs[col - 1]
+
+            # if char is the same use character use previous diagonal element because nothing has changed
+            if prev == curr:
+                matrix[row, col] = matrix[row - 1, col - 1]
+
+            # else use minval of upper, leftmost and previous diagonal element + 1
+            else:
+                # but we do not necessarily know which one
+                # matrix[row, col - 1] insertions
+                # matrix[row - 1, col] deletion
+                # matrix[row - 1, col - 1] substitution
+                minval = min(matrix[row, col - 1], matrix[row - 1, col], matrix[row - 1, col - 1])
+                matrix[row, col] = minval + 1
+
+    return matrix[rows - 1, cols - 1], _backtrack(matrix, prevs, currs, ops)
+
+
+def intern_types(prevs, currs):
+    """Return both sequences as int32 arrays with one id per distinct warning type."""
+    ids = {}
+    a = np.array([ids.setdefault(p, len(ids)) for p in prevs], dtype=np.int32)
+    b = np.array([ids.setdefault(c, len(ids)) for c in currs], dtype=np.int32)
+    return a, b
+
+
+def _next_row(row, x, b, offsets):
+    """Return the next Wagner-Fischer row for element x given the previous row.
+
+    The left neighbour dependency is resolved with a running minimum: D[c] = min_k(T[k] + c - k) = c + cummin(T[k] - k).
+    """
+    t = np.empty_like(row)
+    t[0] = row[0] + 1
+    np.minimum(row[:-1] + (b != x), row[1:] + 1, out=t[1:])
+    return np.minimum.accumulate(t - offsets) + offsets
+
+
+def levenshtein_matrix(a, b):
+    """Return the full Wagner-Fischer matrix of two interned sequences, computed one numpy row at a time."""
+    dtype = np.uint16 if max(len(a), len(b)) < np.iinfo(np.uint16).max else np.int32
+    matrix = np.empty((len(a) + 1, len(b) + 1), dtype=dtype)
+    offsets = np.arange(len(b) + 1, dtype=np.int64)
+    row = offsets.copy()
+    matrix[0] = row
+    for i, x in enumerate(a):
+        row = _next_row(row, x, b, offsets)
+        matrix[i + 1] = row
+    return matrix
+
+
+def _last_row(a, b):
+    offsets = np.arange(len(b) + 1, dtype=np.int64)
+    row = offsets.copy()
+    for x in a:
+        row = _next_row(row, x, b, offsets)
+    return row
+
+
+def _hirschberg(a, b, prevs, currs, ops, op):
+    """Append a minimal edit script of a and b, only holding two rows per recursion level."""
+    if not len(a):
+        ops += [op('add', c) for c in currs]
+        return
+    if not len(b):
+        ops += [op('del', p) for p in prevs]
+        return
+    if len(a) == 1 or len(b) == 1:
+        matrix = levenshtein_matrix(a, b)
+        i, j = len(a), len(b)
+        tail = []
+        while i > 0 or j > 0:
+            if i > 0 and j > 0 and a[i - 1] == b[j - 1] and matrix[i, j] == matrix[i - 1, j - 1]:
+                i -= 1
+                j -= 1
+            elif i > 0 and matrix[i, j] == matrix[i - 1, j] + 1:
+                tail.append(op('del', prevs[i - 1]))
+                i -= 1
+            elif j > 0 and matrix[i, j] == matrix[i, j - 1] + 1:
+                tail.append(op('add', currs[j - 1]))
+                j -= 1
+            else:
+                tail.append(op('add', currs[j - 1]))
+                tail.append(op('del', prevs[i - 1]))
+                i -= 1
+                j -= 1
+        ops += reversed(tail)
+        return
+
+    mid = len(a) // 2
+    left = _last_row(a[:mid], b)
+    right = _last_row(a[mid:][::-1], b[::-1])[::-1]
+    k = int(np.argmin(left + right))
+    _hirschberg(a[:mid], b[:k], prevs[:mid], currs[:k], ops, op)
+    _hirschberg(a[mid:], b[k:], prevs[mid:], currs[k:], ops, op)
+
+
+def levenshtein(prevs, currs, linear_space=None, structured=False):
+    """
+    Levenshtein distance metric implemented with Wagner-Fischer algorithm.
+
+    Warning types are interned to integers and the matrix is filled one numpy row at a time, the operations are extracted like in
+    levenshtein_reference. With linear_space (default: only if the matrix would exceed MAX_MATRIX_CELLS) Hirschberg's algorithm is used
+    instead, the distance is the same but of several minimal edit scripts a different one may be returned.
+    With structured the operations are returned as (kind, warning type) tuples instead of 'kind:warning type' strings.
+    """
+    op = op_tuple if structured else op_string
+    a, b = intern_types(prevs, currs)
+
+    if linear_space is None:
+        linear_space = (len(a) + 1) * (len(b) + 1) > MAX_MATRIX_CELLS
+
+    if linear_space:
+        ops = []
+        _hirschberg(a, b, list(prevs), list(currs), ops, op)
+        distance = _last_row(a, b)[-1]
+        return np.float64(distance), ops
+
+    matrix = levenshtein_matrix(a, b)
+    ops = _trivial_ops(prevs, currs, op)
+    return np.float64(matrix[-1, -1]), _backtrack(matrix, prevs, currs, ops, op)
+
+
+class WarningDiffCache:
+    """
+    Memoized levenshtein diff of two warning type sequences.
+
+    The same warning sequences of a file recur across revisions, entries are keyed by a digest of both sequences and the least
+    recently used entries are dropped above max_entries. The operations are kept as tuple of (kind, warning type) tuples.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.diffs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prevs, currs):
+        h = hashlib.blake2b(digest_size=16)
+        h.update('\0'.join(prevs).encode('utf-8'))
+        h.update(b'\1')
+        h.update('\0'.join(currs).encode('utf-8'))
+        return len(prevs), len(currs), h.digest()
+
+    def diff(self, prevs, currs):
+        """Return distance and structured operations of levenshtein(prevs, currs)."""
+        key = self.key(prevs, currs)
+        if key in self.diffs.keys():
+            self.hits += 1
+            self.diffs.move_to_end(key)
+            return self.diffs[key]
+
+        self.misses += 1
+        distance, ops = levenshtein(prevs, currs, structured=True)
+        self.diffs[key] = distance, tuple(ops)
+        if len(self.diffs) > self.max_entries:
+            self.diffs.popitem(last=False)
+        return self.diffs[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return {'diffs': len(self.diffs), 'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate}
+
+    def print_stats(self):
+        print('warning diff cache: {diffs} diffs, {hits} hits, {misses} misses ({hit_rate:.2%} hit rate)'.format(**self.stats()))
+
+
+# shared by all extractors of this process
+WARNING_DIFF_CACHE = WarningDiffCache()
+
@@ -0,0 +1,138 @@
+"""Effective file selection of a POM state: source directories minus the PMD excludes."""
+import re
+import timeit
+
+
+# the published data was extracted with the simplified prefix / suffix matching of split_excludes,
+# True matches the excludes as Ant patterns (** any number of directories, * and ? within one path segment) instead
+ANT_GLOB_EXCLUDES = False
+
+
+def split_excludes(excludes):
+    """Return full, prefix, suffix, suffix only and prefix only patterns of the excludes."""
+    # this is not very secure and will break if we get ** and * in one expression
+    full = []
+    prefix = []
+    suffix = []
+    suffix_only = []
+    prefix_only = []
+    for e in excludes:
+        if e.startswith('**'):
+            suffix_only.append(e.split('**')[-1])
+            continue
+        if e.endswith('*'):
+            prefix_only.append(e.split('*')[-1])
+            continue
+        if '**' in e:
+            prefix.append(e.split('**')[0])
+            suffix.append(e.split('**')[-1])
+            continue
+        if '*' in e:
+            prefix.append(e.split('*')[0])
+            suffix.append(e.split('*')[-1])
+            continue
+        full.append(e)
+    return full, prefix, suffix, suffix_only, prefix_only
+
+
+def is_excluded(long_name, exclude_roots, full, prefix, suffix, suffix_only, prefix_only):
+    """Reference implementation of the exclude test, rebuilt for every revision and file by warnings_coarse before EffectiveMatcher."""
+    if long_name.startswith(tuple(exclude_roots)):
+        # print('ignore {} because of root exclude {}'.format(long_name, exclude_roots))
+        return True
+    if long_name.startswith(tuple(prefix_only)):
+        # print('ignore {} because of prefix only exclude {}'.format(long_name, prefix_only))
+        return True
+    if long_name.endswith(tuple(suffix_only)):
+        # print('ignore {} because of suffix only exclude {}'.format(long_name, suffix_only))
+        return True
+    if long_name in full:
+        # print('ignore {} because of full exclude {}'.format(long_name, full))
+        return True
+    for p, s in zip(prefix, suffix):
+        if long_name.startswith(p) and long_name.endswith(s):
+            # print('ignore {} because of prefix {} - suffix {} exclude'.format(long_name, p, s))
+            # the published data was extracted with a continue of the inner loop here, prefix - suffix excludes do not exclude the file
+            continue
+    return False
+
+
+def ant_glob_regex(pattern):
+    """Translate an Ant style pattern to a regular expression."""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class EffectiveMatcher:
+    """
+    Compiled effective file selection for the source directories, excludes and exclude roots of a POM state.
+
+    Prefixes and suffixes are kept as tuples for str.startswith / str.endswith, full excludes as a set.
+    With ant_globs all excludes are compiled into one regular expression.
+    """
+
+    def __init__(self, source_dirs, excludes, exclude_roots, ant_globs=None):
+        if ant_globs is None:
+            ant_globs = ANT_GLOB_EXCLUDES
+
+        self.source_dirs = tuple(source_dirs)
+        self.exclude_roots = tuple(exclude_roots)
+
+        full, _, _, suffix_only, prefix_only = split_excludes(excludes)
+        self.full = frozenset(full)
+        self.suffix_only = tuple(suffix_only)
+        self.prefix_only = tuple(prefix_only)
+
+        self.pattern = None
+        if ant_globs:
+            self.full = frozenset()
+            self.suffix_only = ()
+            self.prefix_only = ()
+            if excludes:
+                self.pattern = re.compile('|'.join('(?:{})'.format(ant_glob_regex(e)) for e in excludes))
+
+    def is_excluded(self, long_name):
+        if long_name.startswith(self.exclude_roots):
+            return True
+        if self.pattern is not None:
+            return self.pattern.fullmatch(long_name) is not None
+        return long_name.startswith(self.prefix_only) or long_name.endswith(self.suffix_only) or long_name in self.full
+
+    def __call__(self, long_name):
+        """Return True if the file is part of the effective code."""
+        # this only is necessary if we have effective files (only if we can read the pom.xml)
+        return len(self.source_dirs) > 0 and long_name.startswith(self.source_dirs) and not self.is_excluded(long_name)
+
+
+def benchmark(long_names, source_dirs, excludes, exclude_roots, repeat=10):
+    """Compare EffectiveMatcher with the reference implementation on a list of file names, returns both timings and the mismatches."""
+    def reference():
+        patterns = split_excludes(excludes)
+        return [len(source_dirs) > 0 and n.startswith(tuple(source_dirs)) and not is_excluded(n, exclude_roots, *patterns) for n in long_names]
+
+    def compiled():
+        matcher = EffectiveMatcher(source_dirs, excludes, exclude_roots, ant_globs=False)
+        return [matcher(n) for n in long_names]
+
+    t_reference = timeit.timeit(reference, number=repeat) / repeat
+    t_compiled = timeit.timeit(compiled, number=repeat) / repeat
+    mismatches = [n for n, a, b in zip(long_names, reference(), compiled()) if a != b]
+    print('{} files, {} excludes: reference {:.5f}s, compiled {:.5f}s, {} mismatches'.format(len(long_names), len(excludes), t_reference, t_compiled, len(mismatches)))
+    return t_reference, t_compiled, mismatches
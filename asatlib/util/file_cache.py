@@ -0,0 +1,83 @@
+import sys
+from collections import namedtuple
+
+from pycoshark.mongomodels import File
+from pycoshark.utils import java_filename_filter
+
+
+FileInfo = namedtuple('FileInfo', ['id', 'path', 'is_java', 'is_production'])
+
+
+class FileCache:
+    """
+    Maps File ids to interned paths and precomputed flags.
+
+    File documents do not change in the SmartSHARK snapshot so entries never expire. The cache can be filled in bulk for a VCS system,
+    misses are fetched in one query per batch of ids.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.preloaded = set()
+
+    def _add(self, file_id, path):
+        path = sys.intern(path)
+        info = FileInfo(file_id, path, path.lower().endswith('.java'), java_filename_filter(path, production_only=True))
+        self.files[file_id] = info
+        return info
+
+    def preload(self, vcs_system_id):
+        """Fetch all files of the VCS system with one query."""
+        if vcs_system_id in self.preloaded:
+            return
+        self.queries += 1
+        for f in File.objects.filter(vcs_system_id=vcs_system_id).only('id', 'path').as_pymongo():
+            self._add(f['_id'], f['path'])
+        self.preloaded.add(vcs_system_id)
+
+    def get_many(self, file_ids):
+        """Return dict of FileInfo for the file ids, missing ids are fetched together."""
+        ret = {}
+        missing = []
+        for file_id in file_ids:
+            if file_id in self.files.keys():
+                self.hits += 1
+                ret[file_id] = self.files[file_id]
+            else:
+                self.misses += 1
+                missing.append(file_id)
+
+        if missing:
+            self.queries += 1
+            for f in File.objects.filter(id__in=list(set(missing))).only('id', 'path').as_pymongo():
+                ret[f['_id']] = self._add(f['_id'], f['path'])
+
+        for file_id in missing:
+            if file_id not in ret.keys():
+                raise File.DoesNotExist('file {} not found'.format(file_id))
+        return ret
+
+    def get(self, file_id):
+        """Return FileInfo for the file id, raises File.DoesNotExist like File.objects.get."""
+        return self.get_many([file_id])[file_id]
+
+    def get_file_actions(self, file_actions):
+        """Return file actions as list together with a dict of FileInfo for their file and old file ids."""
+        file_actions = list(file_actions)
+        file_ids = [fa.file_id for fa in file_actions] + [fa.old_file_id for fa in file_actions if fa.old_file_id]
+        return file_actions, self.get_many(file_ids)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return {'files': len(self.files), 'hits': self.hits, 'misses': self.misses, 'queries': self.queries, 'hit_rate': hit_rate}
+
+    def print_stats(self):
+        print('file cache: {files} files, {hits} hits, {misses} misses ({hit_rate:.2%} hit rate), {queries} queries'.format(**self.stats()))
+
+
+# shared by all extractors of this process
+FILE_CACHE = FileCache()
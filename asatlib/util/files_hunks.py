@@ -1,17 +1,20 @@
 
 from pycoshark.mongomodels import Project, VCSSystem, Commit, File, CodeEntityState, FileAction, Issue, Hunk
-from pycoshark.utils import jira_is_resolved_and_fixed, java_filename_filter
+from pycoshark.utils import jira_is_resolved_and_fixed
 from util.pmd import PMD_RULES
+from util.file_cache import FILE_CACHE
+from util.ces_query import find_commit_ces, get_commit_ces, get_commit
 
 
 def get_modified_files(commit, parent):
     """Return only modified files that were available in both parent and current commit."""
     modified_files = []
     modified_lines = 0
-    for fa in FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash):
-        f = File.objects.get(id=fa.file_id)
+    file_actions, files = FILE_CACHE.get_file_actions(FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash))
+    for fa in file_actions:
+        f = files[fa.file_id]
 
-        if not java_filename_filter(f.path, production_only=True):
+        if not f.is_production:
             continue
 
         modified_lines += fa.lines_added
@@ -25,11 +28,11 @@ def get_file_warnings(commit, parent, modified_files):
     file_warnings_current = {d['abbrev']: 0 for d in PMD_RULES}
     file_warnings_parent = {d['abbrev']: 0 for d in PMD_RULES}
 
-    for ces_current in CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__in=modified_files):
+    for ces_current in find_commit_ces(commit, {'ce_type': 'file', 'long_name': {'$in': modified_files}}, ['linter']):
         for l in ces_current.linter:
             file_warnings_current[l['l_ty']] += 1
 
-    for ces_parent in CodeEntityState.objects.filter(id__in=parent.code_entity_states, ce_type='file', long_name__in=modified_files):
+    for ces_parent in find_commit_ces(parent, {'ce_type': 'file', 'long_name': {'$in': modified_files}}, ['linter']):
         for l in ces_parent.linter:
             file_warnings_parent[l['l_ty']] += 1
 
@@ -66,14 +69,15 @@ def get_inducing_warnings(commit, parent):
 
     sum_matched_lines = 0
     match_lines = []
-    for fa in FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash).timeout(False):
-        f = File.objects.get(id=fa.file_id)
+    file_actions, files = FILE_CACHE.get_file_actions(FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash).timeout(False))
+    for fa in file_actions:
+        f = files[fa.file_id]
 
-        if not java_filename_filter(f.path, production_only=True):
+        if not f.is_production:
             continue
 
         # get warning that match for this file
-        ces = CodeEntityState.objects.get(id__in=commit.code_entity_states, ce_type='file', long_name=f.path)
+        ces = get_commit_ces(commit, {'ce_type': 'file', 'long_name': f.path}, ['linter'])
 
         # only matched ces with LLoC?
         fixing_linter_warnings = {}
@@ -95,7 +99,7 @@ def get_inducing_warnings(commit, parent):
 
         # get inducing changes
         for ifa in FileAction.objects.filter(induces__match={'change_file_action_id': fa.id}).timeout(False):
-            inducing_file = File.objects.get(id=ifa.file_id)
+            inducing_file = FILE_CACHE.get(ifa.file_id)
 
             for ind in ifa.induces:
                 if ind['change_file_action_id'] != fa.id:
@@ -104,10 +108,10 @@ def get_inducing_warnings(commit, parent):
                     continue
 
                 # inducing commit for CES
-                ic = Commit.objects.get(id=ifa.commit_id)
+                ic = get_commit(id=ifa.commit_id)
 
                 # get warning that match for this file
-                ces = CodeEntityState.objects.get(id__in=ic.code_entity_states, ce_type='file', long_name=inducing_file.path)
+                ces = get_commit_ces(ic, {'ce_type': 'file', 'long_name': inducing_file.path}, ['linter'])
 
                 inducing_linter_warnings = {}
                 for lw in ces.linter:
@@ -143,9 +147,10 @@ def get_inducing_warnings(commit, parent):
 
 def get_file_ids(commit, parent):
     file_ids = []
-    for fa in FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash):
-        f = File.objects.get(id=fa.file_id)
-        if not java_filename_filter(f.path, production_only=True):
+    file_actions, files = FILE_CACHE.get_file_actions(FileAction.objects.filter(commit_id=commit.id, mode='M', parent_revision_hash=parent.revision_hash))
+    for fa in file_actions:
+        f = files[fa.file_id]
+        if not f.is_production:
             continue
         file_ids.append(f.id)
     return file_ids
@@ -157,14 +162,14 @@ def get_subfile_metrics(commit, parent):
     subfile_metrics_current = {}
     subfile_metrics_parent = {}
 
-    for ces_current_subfile in CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type__in=['method', 'class'], file_id__in=file_ids):
+    for ces_current_subfile in find_commit_ces(commit, {'ce_type': {'$in': ['method', 'class']}, 'file_id': {'$in': file_ids}}, ['metrics']):
         for metric, value in ces_current_subfile.metrics.items():
             if metric not in subfile_metrics_current.keys():
                 subfile_metrics_current[metric] = []
             subfile_metrics_current[metric].append(value)
     subfile_sums_current = {k: sum(v) for k, v in subfile_metrics_current.items()}
 
-    for ces_parent_subfile in CodeEntityState.objects.filter(id__in=parent.code_entity_states, ce_type__in=['method', 'class'], file_id__in=file_ids):
+    for ces_parent_subfile in find_commit_ces(parent, {'ce_type': {'$in': ['method', 'class']}, 'file_id': {'$in': file_ids}}, ['metrics']):
         for metric, value in ces_parent_subfile.metrics.items():
             if metric not in subfile_metrics_parent.keys():
                 subfile_metrics_parent[metric] = []
@@ -179,13 +184,13 @@ def get_file_metrics(commit, parent, modified_files):
     file_metrics_current = {}
     file_metrics_parent = {}
 
-    for ces_current in CodeEntityState.objects.filter(id__in=commit.code_entity_states, ce_type='file', long_name__in=modified_files):
+    for ces_current in find_commit_ces(commit, {'ce_type': 'file', 'long_name': {'$in': modified_files}}, ['metrics']):
         for metric, value in ces_current.metrics.items():
             if metric not in file_metrics_current.keys():
                 file_metrics_current[metric] = []
             file_metrics_current[metric].append(value)
 
-    for ces_parent in CodeEntityState.objects.filter(id__in=parent.code_entity_states, ce_type='file', long_name__in=modified_files):
+    for ces_parent in find_commit_ces(parent, {'ce_type': 'file', 'long_name': {'$in': modified_files}}, ['metrics']):
         for metric, value in ces_parent.metrics.items():
             if metric not in file_metrics_parent.keys():
                 file_metrics_parent[metric] = []
@@ -200,6 +205,7 @@ def get_file_metrics(commit, parent, modified_files):
 def extract_project_fixed_asats(project_name):
     p = Project.objects.get(name=project_name)
     vcs = VCSSystem.objects.get(project_id=p.id)
+    FILE_CACHE.preload(vcs.id)
 
     deltas = []
     for c in Commit.objects.filter(vcs_system_id=vcs.id, fixed_issue_ids__0__exists=True).only('id', 'message', 'parents', 'revision_hash', 'fixed_issue_ids', 'committer_date').timeout(False):
@@ -214,14 +220,14 @@ def extract_project_fixed_asats(project_name):
 
         for parent in c.parents:
             delt = {'commit': c.revision_hash, 'parent': parent, 'date': c.committer_date, 'project': project_name, 'num_parents': len(c.parents), 'message': c.message}
-            p = Commit.objects.get(vcs_system_id=vcs.id, revision_hash=parent)
+            p = get_commit(vcs_system_id=vcs.id, revision_hash=parent)
 
             modified_files, modified_lines = get_modified_files(c, p)
 
             delt['num_files'] = len(modified_files)
             delt['num_lines'] = modified_lines
 
-            fc = Commit.objects.get(id=c.id)
+            fc = get_commit(id=c.id)
             current_file, parent_file = get_file_warnings(fc, p, modified_files)
 
             fixing, inducing, number_matched_lines, matched_lines = get_inducing_warnings(fc, p)
@@ -237,12 +243,14 @@ def extract_project_fixed_asats(project_name):
                 delt['inducing_' + metric] = inducing[metric]
 
             deltas.append(delt)
+    FILE_CACHE.print_stats()
     return deltas
 
 
 def extract_project_all_deltas(project_name, get_categories):
     p = Project.objects.get(name=project_name)
     vcs = VCSSystem.objects.get(project_id=p.id)
+    FILE_CACHE.preload(vcs.id)
 
     deltas = []
     for c in Commit.objects.filter(vcs_system_id=vcs.id).only('id', 'parents', 'revision_hash', 'committer_date', 'message').timeout(False):
@@ -259,8 +267,8 @@ def extract_project_all_deltas(project_name, get_categories):
             # add keywords vector
             delt.update(**get_categories(c.message))
 
-            p = Commit.objects.get(vcs_system_id=vcs.id, revision_hash=parent)
-            fc = Commit.objects.get(id=c.id)  # need full commit here for code entity states
+            p = get_commit(vcs_system_id=vcs.id, revision_hash=parent)
+            fc = get_commit(id=c.id)  # need full commit here for code entity states (if the join mode sends them)
 
             modified_files, modified_lines = get_modified_files(c, p)
 
@@ -289,4 +297,5 @@ def extract_project_all_deltas(project_name, get_categories):
                 delt[metric] = current_metric[metric] - parent_metric[metric]
 
             deltas.append(delt)
+    FILE_CACHE.print_stats()
     return deltas
@@ -0,0 +1,95 @@
+import subprocess
+
+
+class GitError(Exception):
+
+    def __init__(self, args, output):
+        self.command = args
+        self.output = output
+        super().__init__('git {} error: {}'.format(' '.join(args), output.strip()))
+
+
+def git_lines(repo_path, args):
+    """Yield stdout lines of the git command while it is running, raises GitError if git fails."""
+    with subprocess.Popen(['git'] + args, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as p:
+        for line in p.stdout:
+            yield line.decode('utf-8', 'ignore').rstrip('\n')
+        err = p.stderr.read()
+        if p.wait() != 0:
+            raise GitError(args, err.decode('utf-8', 'ignore'))
+
+
+def git_tokens(repo_path, args, chunk_size=1 << 16):
+    """Yield NUL separated stdout tokens of the git command (for -z output) while it is running, raises GitError if git fails."""
+    with subprocess.Popen(['git'] + args, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as p:
+        rest = b''
+        for chunk in iter(lambda: p.stdout.read(chunk_size), b''):
+            tokens = (rest + chunk).split(b'\0')
+            rest = tokens.pop()
+            for token in tokens:
+                yield token.decode('utf-8', 'ignore')
+        if rest:
+            yield rest.decode('utf-8', 'ignore')
+        err = p.stderr.read()
+        if p.wait() != 0:
+            raise GitError(args, err.decode('utf-8', 'ignore'))
+
+
+def git_output(repo_path, args):
+    """Return stdout of the git command, raises GitError if git fails."""
+    r = subprocess.run(['git'] + args, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if r.returncode != 0:
+        raise GitError(args, r.stderr.decode('utf-8', 'ignore'))
+    return r.stdout.decode('utf-8', 'ignore')
+
+
+def rev_list_parents(repo_path):
+    """Return (revision_hash, committer timestamp, parents) for every commit reachable from any ref of the repository."""
+    commits = []
+    for line in git_lines(repo_path, ['rev-list', '--all', '--parents', '--timestamp']):
+        if not line:
+            continue
+        timestamp, revision_hash, *parents = line.split(' ')
+        commits.append((revision_hash, int(timestamp), parents))
+    return commits
+
+
+def get_head(repo_path):
+    """Return revision of origin/HEAD, the main branch of the remote repo, or HEAD if the checkout has no remote."""
+    for ref in ['refs/remotes/origin/HEAD', 'HEAD']:
+        try:
+            return git_output(repo_path, ['rev-parse', '--verify', '--quiet', ref + '^{commit}']).strip()
+        except GitError:
+            continue
+    raise GitError(['rev-parse', 'HEAD'], 'no head found in {}'.format(repo_path))
+
+
+def log_name_status(repo_path, tip):
+    """
+    Yield (revision_hash, file changes) for every commit reachable from tip from one git log stream.
+
+    File changes are (status, path, old_path) tuples, old_path is None unless the file was renamed or copied.
+    Merge commits are diffed against each of their parents (-m) and therefore yielded once per parent.
+    """
+    revision_hash = None
+    changes = []
+    tokens = git_tokens(repo_path, ['log', '-m', '--name-status', '--find-renames', '-z', '--format=%x01%H', tip])
+    for token in tokens:
+        token = token.lstrip('\n')
+        if not token:
+            continue
+        if token.startswith('\x01'):
+            if revision_hash:
+                yield revision_hash, changes
+            revision_hash = token[1:]
+            changes = []
+            continue
+
+        status = token
+        if status[0] in 'RC':
+            old_path = next(tokens)
+            changes.append((status[0], next(tokens), old_path))
+        else:
+            changes.append((status[0], next(tokens), None))
+    if revision_hash:
+        yield revision_hash, changes
@@ -0,0 +1,193 @@
+"""Writes only the buildfiles of a revision into a scratch directory instead of checking out the whole working tree.
+
+The buildfiles are the POM files (pom.xml and the custom POM names), the Maven configuration in .mvn and the XML files outside of
+test directories (possible ruleset files). The blobs are read from one long running git cat-file --batch process and only the
+buildfiles that differ from the previous revision are written, the directories of the tree are created so that Maven and the
+profile activation see the same layout (without the other files). Directories are removed when their last file is deleted like
+git checkout does.
+
+A profile can be activated by the existence of any file (<activation><file>), if a POM of the revision has such an activation
+every file of the revision is written instead.
+"""
+import os
+import re
+import shutil
+import subprocess
+
+from util.buildfile import CUSTOM_POM_NAMES
+from util.git import git_tokens, GitError
+
+
+MATERIALIZE_DIR = '../materialized'
+
+# XML files in these directories are test data, not rulesets
+EXCLUDED_DIRECTORIES = ['src/test/', 'src/it/']
+
+FILE_ACTIVATION = re.compile(rb'<activation\b(?:(?!</activation>).)*?<file\b', re.DOTALL)
+
+GITLINK_MODE = '160000'
+
+
+def scratch_path(name, base=MATERIALIZE_DIR):
+    return os.path.abspath(os.path.join(base, name))
+
+
+class BuildfileTree:
+    """Scratch directory with the buildfiles of the last revision passed to checkout."""
+
+    def __init__(self, repo_path, path, project_name):
+        self.repo_path = repo_path
+        self.path = path
+        self.names = {'pom.xml'}
+        self.names.update(CUSTOM_POM_NAMES.get(project_name, {}).keys())
+
+        self.revision = None
+        self.blobs = {}  # path -> blob hash of the written files
+        self.stats = {}  # path -> (mtime, size) after writing, a buildfile changed by us is written again (e.g. parent replacements)
+        self.directories = {}  # directory -> number of files of the revision below it
+        self.activations = {}  # POM blob hash -> True if it has a file activation
+        self.process = None
+        self.written = 0
+        self.removed = 0
+        self.full_revisions = 0
+
+        # leftovers of an earlier run are not tracked
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def is_buildfile(self, path):
+        name = path.split('/')[-1]
+        if name in self.names or path.startswith('.mvn/') or '/.mvn/' in path:
+            return True
+        return name.endswith('.xml') and not any(path.startswith(d) or '/' + d in path for d in EXCLUDED_DIRECTORIES)
+
+    def read_blob(self, blob):
+        if self.process is None:
+            self.process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.repo_path, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.process.stdin.write(blob.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode('ascii').split()
+        if len(header) != 3:
+            raise GitError(['cat-file', '--batch'], '{} {}'.format(blob, ' '.join(header[1:])))
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return data
+
+    def _ancestors(self, path):
+        directory = os.path.dirname(path)
+        while directory:
+            yield directory
+            directory = os.path.dirname(directory)
+
+    def _add_file(self, directories, path):
+        for directory in self._ancestors(path):
+            directories[directory] = directories.get(directory, 0) + 1
+
+    def _remove_file(self, directories, path):
+        for directory in self._ancestors(path):
+            directories[directory] -= 1
+            if not directories[directory]:
+                del directories[directory]
+
+    def _tree(self, revision, everything=False):
+        """Return path -> blob hash of the buildfiles (or all files) in the tree of the revision and the directories of the tree."""
+        files = {}
+        directories = {}
+        for token in git_tokens(self.repo_path, ['ls-tree', '-r', '-z', '--full-tree', revision]):
+            meta, path = token.split('\t', 1)
+            mode, kind, blob = meta.split(' ')
+            if kind != 'blob':
+                continue
+            self._add_file(directories, path)
+            if everything or self.is_buildfile(path):
+                files[path] = blob
+        return files, directories
+
+    def _changed_tree(self, revision):
+        """Return the buildfiles and directories of the revision from the difference to the previous revision."""
+        files = {path: blob for path, blob in self.blobs.items() if self.is_buildfile(path)}
+        directories = dict(self.directories)
+        tokens = git_tokens(self.repo_path, ['diff-tree', '-r', '-z', '--no-renames', self.revision, revision])
+        for meta in tokens:
+            path = next(tokens)
+            old_mode, new_mode, _, new_blob, status = meta.lstrip(':').split(' ')
+            was_file = status != 'A' and old_mode != GITLINK_MODE
+            is_file = status != 'D' and new_mode != GITLINK_MODE
+            if was_file and not is_file:
+                self._remove_file(directories, path)
+            if is_file and not was_file:
+                self._add_file(directories, path)
+
+            if not is_file:
+                files.pop(path, None)
+            elif self.is_buildfile(path):
+                files[path] = new_blob
+        return files, directories
+
+    def _has_file_activation(self, files):
+        """Return True if one of the POM files activates a profile by the existence of a file."""
+        for path, blob in files.items():
+            if path.split('/')[-1] not in self.names:
+                continue
+            if blob not in self.activations.keys():
+                self.activations[blob] = FILE_ACTIVATION.search(self.read_blob(blob)) is not None
+            if self.activations[blob]:
+                return True
+        return False
+
+    def _stat(self, file):
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def checkout(self, revision):
+        """Update the scratch directory to the buildfiles of the revision, raises GitError if the revision is not found."""
+        files, directories = self._tree(revision) if self.revision is None else self._changed_tree(revision)
+        if self._has_file_activation(files):
+            files, directories = self._tree(revision, everything=True)
+            self.full_revisions += 1
+
+        for path in list(self.blobs.keys()):
+            if path not in files.keys():
+                file = os.path.join(self.path, path)
+                if os.path.isfile(file):
+                    os.remove(file)
+                del self.blobs[path]
+                del self.stats[path]
+                self.removed += 1
+
+        # deepest first, directories that still have untracked files (e.g. Maven output) are kept like git checkout does
+        for directory in sorted(self.directories.keys() - directories.keys(), key=lambda d: d.count('/'), reverse=True):
+            try:
+                os.rmdir(os.path.join(self.path, directory))
+            except OSError:
+                pass
+        for directory in directories.keys() - self.directories.keys():
+            os.makedirs(os.path.join(self.path, directory), exist_ok=True)
+        self.directories = directories
+
+        for path, blob in files.items():
+            file = os.path.join(self.path, path)
+            if self.blobs.get(path) == blob and self.stats.get(path) == self._stat(file):
+                continue
+            with open(file, 'wb') as f:
+                f.write(self.read_blob(blob))
+            self.blobs[path] = blob
+            self.stats[path] = self._stat(file)
+            self.written += 1
+        self.revision = revision
@@ -0,0 +1,77 @@
+"""Project local Maven repositories for creating the effective POMs offline.
+
+The repository of a project is seeded once with network access: mvn help:effective-pom runs for every distinct set of POM files
+of the buildfile change revisions and downloads the parent POMs, imported POMs, build extensions and the help plugin into it.
+Afterwards Maven runs with -o against the repository, without update checks and without network.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import timeit
+
+from util.buildfile import PomPom, MavenError
+from util.pom_cache import buildfile_blobs
+
+
+MAVEN_REPOSITORY_DIR = '../maven_repositories'
+
+SEED_FILE = 'seeded.json'
+
+
+def project_repository(project_name, base=MAVEN_REPOSITORY_DIR):
+    return os.path.abspath(os.path.join(base, project_name))
+
+
+def is_seeded(project_name, base=MAVEN_REPOSITORY_DIR):
+    return os.path.isfile(os.path.join(project_repository(project_name, base), SEED_FILE))
+
+
+def seed_digest(project_name, base=MAVEN_REPOSITORY_DIR):
+    """Return the sha1 of the seed file of the project, it changes with every seeding, None if the repository is not seeded."""
+    try:
+        with open(os.path.join(project_repository(project_name, base), SEED_FILE), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def seed_repository(path, project_name, revisions, base=MAVEN_REPOSITORY_DIR):
+    """Download everything the effective POMs of the revisions need into the local repository of the project.
+
+    Revisions with the same POM files as an already seeded revision are skipped. Revisions that fail online fail offline, too,
+    they are listed in the seed file.
+    """
+    local_repository = project_repository(project_name, base)
+    os.makedirs(local_repository, exist_ok=True)
+
+    start = timeit.default_timer()
+    seen = set()
+    failed = []
+    for (revision_hash, buildfiles) in revisions:
+        r = subprocess.run(['git', 'checkout', revision_hash, '-f'], cwd=path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if r.returncode != 0:
+            raise OSError('checkout of {} failed: {}'.format(revision_hash, r.stderr.decode('utf-8', 'ignore')))
+
+        p = PomPom(path, project_name, revision_hash, local_repository=local_repository)
+        try:
+            p.preflight_check()
+        except OSError:
+            continue
+
+        key = (os.path.relpath(p.basedir, path), tuple(buildfile_blobs(path, revision_hash, project_name)))
+        if key in seen:
+            continue
+        seen.add(key)
+
+        try:
+            p.create_effective_pom()
+        except MavenError as e:
+            print('[{}] seeding failed ({}) "{}"'.format(revision_hash, e.type, e.line))
+            failed.append({'revision': revision_hash, 'error_type': e.type, 'line': e.line})
+
+    seconds = timeit.default_timer() - start
+    with open(os.path.join(local_repository, SEED_FILE), 'w') as f:
+        json.dump({'revisions': len(revisions), 'distinct_buildfiles': len(seen), 'failed': failed, 'seconds': seconds}, f, indent=2)
+    print('[{}] seeded {} with {} of {} revisions in {:.5f}s'.format(project_name, local_repository, len(seen), len(revisions), seconds))
+    return local_repository
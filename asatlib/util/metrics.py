@@ -2,6 +2,9 @@
 from bson.objectid import ObjectId
 from pycoshark.mongomodels import CodeEntityState
 
+from util import summaries
+from util.ces_query import find_commit_ces, get_commit_ces, aggregate_commit_ces
+
 
 def hunk_lines(hunk):
     """Return lists of added/removed lines for the given Hunk object."""
@@ -27,6 +30,9 @@ def hunk_lines(hunk):
 
 
 def get_warning_list(ces_ids):
+    if summaries.USE_SUMMARIES:
+        return summaries.summary_warning_list(ces_ids)
+
     ret = []
     c = CodeEntityState.objects().aggregate(*[
             {'$match': {'_id': {'$in': ces_ids}, 'ce_type': 'file'}},
@@ -57,6 +63,9 @@ def get_warning_list(ces_ids):
 
 
 def get_file_metrics(ces_ids):
+    if summaries.USE_SUMMARIES:
+        return summaries.summary_file_metrics(ces_ids)
+
     ret = {}
     c = CodeEntityState.objects().aggregate(*[
         {'$match': {'_id': {'$in': ces_ids}, 'ce_type': 'file'}},
@@ -83,7 +92,7 @@ def find_narrow_ces(commit, file_id, line):
     """Find the smalles CodeEntityState that corresponds to the changed line, i.e., smalles method containing that line."""
     smallest_size = float('inf')
     smallest_ces = None
-    for ces in CodeEntityState.objects.filter(id__in=commit.code_entity_states, file_id=file_id, ce_type='method', start_line__lte=line, end_line__gte=line):
+    for ces in find_commit_ces(commit, {'file_id': ObjectId(file_id), 'ce_type': 'method', 'start_line': {'$lte': line}, 'end_line': {'$gte': line}}):
         if ces.end_line - ces.start_line < smallest_size:
             smallest_ces = ces
             smallest_size = ces.end_line - ces.start_line
@@ -97,7 +106,7 @@ def get_warnings(commit, file_path):
     pos_in_file = 1
 
     try:
-        ces = CodeEntityState.objects.get(id__in=commit.code_entity_states, ce_type='file', long_name=file_path)
+        ces = get_commit_ces(commit, {'ce_type': 'file', 'long_name': file_path}, ['linter'])
         linter = ces.linter
     except CodeEntityState.DoesNotExist:
         pass
@@ -119,8 +128,7 @@ def get_warnings(commit, file_path):
 def get_metrics(previous_commit, current_commit, previous_file, current_file):
     """Return metrics delta between two commits and given files."""
     ret = {}
-    cparent = CodeEntityState.objects().aggregate(*[
-        {'$match': {'_id': {'$in': previous_commit.code_entity_states}, 'ce_type': 'method', 'file_id': ObjectId(previous_file.id)}},
+    cparent = aggregate_commit_ces(previous_commit, {'ce_type': 'method', 'file_id': ObjectId(previous_file.id)}, [
         {'$project': {'metrics.LLOC': 1,
                       'metrics.MIMS': 1,
                       'metrics.McCC': 1}},
@@ -134,8 +142,7 @@ def get_metrics(previous_commit, current_commit, previous_file, current_file):
                     'method_mccc_avg': {'$avg': '$metrics.McCC'}}}
     ])
 
-    ccurrent = CodeEntityState.objects().aggregate(*[
-        {'$match': {'_id': {'$in': current_commit.code_entity_states}, 'ce_type': 'method', 'file_id': ObjectId(current_file.id)}},
+    ccurrent = aggregate_commit_ces(current_commit, {'ce_type': 'method', 'file_id': ObjectId(current_file.id)}, [
         {'$project': {'metrics.LLOC': 1,
                       'metrics.MIMS': 1,
                       'metrics.McCC': 1}},
@@ -0,0 +1,108 @@
+"""Persistent table of the parent POM replacements that made mvn help:effective-pom work.
+
+create_effective_pom only replaces the parent of the main pom.xml after Maven failed. The table remembers the parent coordinates
+(groupId, artifactId, version, relativePath present) for which the replacement succeeded, later revisions with the same parent
+get the replacement before the first Maven run and skip the run that would fail. The key does not say whether the parent resolves
+in a revision, the replacement is only applied if the parent is neither at its relativePath in the checkout nor in the local
+Maven repository.
+"""
+import fcntl
+import json
+import os
+import threading
+
+
+FIXUP_FILE = './data/parent_fixups.json'
+
+
+def fixup_key(group_id, artifact_id, version, has_relative_path):
+    return '{}:{}:{}:{}'.format(group_id, artifact_id, version, 'relativePath' if has_relative_path else '-')
+
+
+class ParentFixups:
+    """Learned parent replacements, the hits of this process are added to the table file by save."""
+
+    def __init__(self, fixup_file=FIXUP_FILE):
+        self.fixup_file = fixup_file
+        self.table = {}
+        self.learned = {}
+        self.hits = {}
+        self.unsaved_hits = {}
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Read the table file and start counting the hits for a new project."""
+        self.table = {}
+        if os.path.exists(self.fixup_file):
+            with open(self.fixup_file, 'r') as f:
+                self.table = json.load(f)
+        self.learned = {}
+        self.hits = {}
+        self.unsaved_hits = {}
+        self.failed = 0
+
+    def lookup(self, key):
+        """Return the learned replacements for the parent coordinates, None if the parent did not need a replacement before."""
+        entry = self.table.get(key)
+        if entry is None:
+            return None
+        return entry['replacements']
+
+    def hit(self, key):
+        with self.lock:
+            self.hits[key] = self.hits.get(key, 0) + 1
+            self.unsaved_hits[key] = self.unsaved_hits.get(key, 0) + 1
+
+    def miss(self, key):
+        """The learned replacement did not work for this revision, the usual two runs follow."""
+        with self.lock:
+            self.failed += 1
+
+    def learn(self, key, revision_hash, replacements):
+        with self.lock:
+            if key not in self.table.keys():
+                entry = {'replacements': replacements, 'revision': revision_hash, 'hits': 0}
+                self.table[key] = entry
+                self.learned[key] = entry
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        # a hit saves the failing run, a miss costs one run more
+        return {'hits': hits, 'saved': hits - self.failed, 'failed': self.failed, 'learned': len(self.learned), 'known': len(self.table)}
+
+    def print_stats(self):
+        print('parent fixups: {hits} hits, {failed} failed, {saved} maven invocations saved, {learned} learned ({known} known)'.format(**self.stats()))
+
+    def save(self):
+        """Merge the learned replacements and hits of this process into the table file.
+
+        The projects of a process pool save concurrently, an exclusive lock on a lock file next to the table file keeps their
+        read, merge and replace sequences apart.
+        """
+        with self.lock, open(self.fixup_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            table = {}
+            if os.path.exists(self.fixup_file):
+                with open(self.fixup_file, 'r') as f:
+                    table = json.load(f)
+            for key, entry in self.learned.items():
+                table.setdefault(key, entry)
+            for key, hits in self.unsaved_hits.items():
+                if key in table.keys():
+                    table[key]['hits'] += hits
+
+            tmp = self.fixup_file + '.{}.tmp'.format(os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(table, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.fixup_file)
+
+            self.table = table
+            self.learned = {}
+            self.unsaved_hits = {}
+
+
+def print_run_stats(stats):
+    """Print the sum of the stats of all projects of a run."""
+    total = {k: sum(s[k] for s in stats) for k in ['hits', 'saved', 'failed', 'learned']}
+    print('parent fixups of {} projects: {hits} hits, {failed} failed, {saved} maven invocations saved, {learned} learned'.format(len(stats), **total))
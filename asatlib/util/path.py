@@ -5,23 +5,38 @@ import networkx as nx
 
 from pycoshark.mongomodels import Commit, Branch
 
+from util.dag import CommitDAG, NOT_VISITED
+from util.git import rev_list_parents, get_head
+
+
+def get_commit_parents(vcs_id):
+    """Return (id, revision_hash, parents) for all commits of this VCS from one projected cursor."""
+    commits = []
+    for c in Commit.objects.filter(vcs_system_id=vcs_id).only('id', 'revision_hash', 'parents').timeout(False).as_pymongo():
+        commits.append((c['_id'], c['revision_hash'], c.get('parents', [])))
+    return commits
+
+
+def get_vcs_graph(vcs_id, commits=None):
+    """Return NetworkX digraph structure from commits of this VCS.
+
+    Nodes and edges are added in cursor order, parents are resolved against the set of known revision hashes instead of one query per edge.
+    """
+    if commits is None:
+        commits = get_commit_parents(vcs_id)
 
-def get_vcs_graph(vcs_id):
-    """Return NetworkX digraph structure from commits of this VCS."""
     g = nx.DiGraph()
     # first we add all nodes to the graph
-    for c in Commit.objects.only('id', 'revision_hash').timeout(False).filter(vcs_system_id=vcs_id):
-        g.add_node(c.revision_hash)
+    for _, revision_hash, _ in commits:
+        g.add_node(revision_hash)
 
     # after that we draw all edges
-    for c in Commit.objects.only('id', 'parents', 'revision_hash').timeout(False).filter(vcs_system_id=vcs_id):
-        for p in c.parents:
-            try:
-                p1 = Commit.objects.only('id', 'revision_hash').timeout(False).get(vcs_system_id=vcs_id, revision_hash=p)
-                g.add_edge(p1.revision_hash, c.revision_hash)
-            except Commit.DoesNotExist:
-                print("parent of a commit is missing (commit id: {} - revision_hash: {})".format(c.id, p))
-                pass
+    for commit_id, revision_hash, parents in commits:
+        for p in parents:
+            if p not in g:
+                print("parent of a commit is missing (commit id: {} - revision_hash: {})".format(commit_id, p))
+                continue
+            g.add_edge(p, revision_hash)
     return g
 
 
@@ -33,30 +48,56 @@ def get_main_branch_tip(vcs_id):
 
 
 def get_orphan_commits(vcs_id):
-    """Return a list of firts commit candidates, orphan commits ordered by date."""
-    return Commit.objects.filter(vcs_system_id=vcs_id, parents__size=0).order_by('committer_date').only('revision_hash', 'committer_date')
+    """Return a list of firts commit candidates, orphan commits ordered by date (revision hash breaks ties)."""
+    return Commit.objects.filter(vcs_system_id=vcs_id, parents__size=0).order_by('committer_date', 'revision_hash').only('revision_hash', 'committer_date')
+
+
+def build_commit_dag(commits):
+    """Return the compact CommitDAG from (revision_hash, parents) tuples, missing parents are reported."""
+    dag = CommitDAG(commits)
+    for revision_hash, p in dag.missing_parents:
+        print("parent of a commit is missing (revision_hash: {} - parent: {})".format(revision_hash, p))
+    return dag
+
+
+def shortest_commit_path(dag, tip, orphans):
+    """Return the path from the first orphan in orphans that is an ancestor of tip to tip.
+
+    One BFS from the tip along the parent edges yields every ancestor of the tip together with its shortest path to the tip.
+    Parents are expanded in git order which keeps the path deterministic, of multiple shortest paths the one following first parents closest to the tip is chosen.
+    """
+    pred = dag.bfs_ancestors(dag.node(tip))
+
+    # get first commit without parents that has a path to main branch tip, by our ordering this is also the earliest
+    for orphan in orphans:
+        node = dag.node(orphan)
+        if pred[node] != NOT_VISITED:
+            return dag.path_from(pred, node)
+    return None
 
 
 def get_commit_path(vcs_id, last_commit=None):
     """Return a list of commits, the path from the origin/master to the oldest orphan commit."""
-    g = get_vcs_graph(vcs_id)
+    dag = build_commit_dag((revision_hash, parents) for _, revision_hash, parents in get_commit_parents(vcs_id))
     bt = last_commit
     if not bt:
         bt = get_main_branch_tip(vcs_id)
-    path = None
+    return shortest_commit_path(dag, bt, (c.revision_hash for c in get_orphan_commits(vcs_id)))
 
-    # get first commit without parents that has a path to main branch tip, by our ordering this is also the earliest
-    for c in get_orphan_commits(vcs_id):
-        if nx.has_path(g, c.revision_hash, bt):
-            # paths = sorted(nx.all_shortest_paths(g, c.revision_hash, bt))
-            # print('found {} paths from {} to {} ({})'.format(len(paths), c.revision_hash, bt, c.committer_date))
-            # keep it deterministic, shortest_path returns one of the shortest path depending on the graph structure in memory
-            # path = nx.shortest_path(g, c.revision_hash, bt)
-            # path = paths[0]
-            # path = sorted(nx.all_shortest_paths(g, c.revision_hash, bt))[0]
-            path = nx.shortest_path(g, c.revision_hash, bt)
-            break
-    return path
+
+def get_commit_path_git(repo_path, last_commit=None):
+    """Return a list of commits, the path from the origin/master to the oldest orphan commit, read from the local git repository instead of the MongoDB.
+
+    The whole parent graph is read from one git rev-list stream, orphans are ordered by committer date and revision hash like in get_orphan_commits.
+    """
+    commits = rev_list_parents(repo_path)
+    dag = build_commit_dag((revision_hash, parents) for revision_hash, _, parents in commits)
+
+    bt = last_commit
+    if not bt:
+        bt = get_head(repo_path)
+    orphans = sorted((timestamp, revision_hash) for revision_hash, timestamp, parents in commits if not parents)
+    return shortest_commit_path(dag, bt, (revision_hash for _, revision_hash in orphans))
 
 
 def chunk_path(vcs_id, commits, window_size_days=119):
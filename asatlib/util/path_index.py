@@ -0,0 +1,46 @@
+"""Index of the files of a revision for the suffix lookups of PomPom.find_file.
+
+The index holds the files tracked in the tree of the revision, untracked files of the checkout are not found. The paths are
+sorted in a deterministic top down order (files of a directory before its subdirectories, names sorted). If several files end
+with a suffix the first one in this order is returned, the os.walk lookup this replaces returned the first one in filesystem order,
+which is unsorted and may differ. The reversed paths are sorted, so the files ending with a suffix are one range of the reversed
+paths found by bisection.
+"""
+import bisect
+
+from util.git import git_tokens
+
+
+def walk_key(path):
+    """Sort key of a relative path, files of a directory sorted by name before its subdirectories sorted by name."""
+    components = path.split('/')
+    return [(1, c) for c in components[:-1]] + [(0, components[-1])]
+
+
+class PathIndex:
+    """Files of a checkout by suffix, prefix is the path of the checkout ending with a slash."""
+
+    def __init__(self, prefix, paths):
+        self.files = [prefix + p for p in sorted(paths, key=walk_key)]
+        reversed_files = sorted((f[::-1], i) for i, f in enumerate(self.files))
+        self.reversed = [r for r, _ in reversed_files]
+        self.ranks = [i for _, i in reversed_files]
+
+    @classmethod
+    def from_git(cls, prefix, repo_path, revision_hash):
+        """Index of the files in the tree of the revision."""
+        return cls(prefix, git_tokens(repo_path, ['ls-tree', '-r', '-z', '--name-only', '--full-tree', revision_hash]))
+
+    def find(self, basedir, needle):
+        """Return the first file below basedir (in walk_key order) whose path ends with needle, None if there is none."""
+        key = needle[::-1]
+        lo = bisect.bisect_left(self.reversed, key)
+        hi = bisect.bisect_left(self.reversed, key + '\U0010ffff', lo)
+
+        first = None
+        for rank in self.ranks[lo:hi]:
+            if (first is None or rank < first) and self.files[rank].startswith(basedir):
+                first = rank
+        if first is None:
+            return None
+        return self.files[first]
@@ -727,4 +727,7 @@ DEFAULT_RULES_MAVEN_CLEANED = ['PMD_AUHCIP', 'PMD_CRS', 'PMD_UnI', 'PMD_ULV', 'P
 PMD_CATEGORY = {'PMD_ABSALIL': 'basic', 'PMD_ADLIBDC': 'basic', 'PMD_AMUO': 'basic', 'PMD_ATG': 'basic', 'PMD_AUHCIP': 'basic', 'PMD_AUOV': 'basic', 'PMD_BII': 'basic', 'PMD_BI': 'basic', 'PMD_BNC': 'basic', 'PMD_CRS': 'basic', 'PMD_CSR': 'basic', 'PMD_CCEWTA': 'basic', 'PMD_CIS': 'basic', 'PMD_DCTR': 'basic', 'PMD_DUFTFLI': 'basic', 'PMD_DCL': 'basic', 'PMD_ECB': 'empty', 'PMD_EFB': 'empty', 'PMD_EIS': 'empty', 'PMD_EmSB': 'empty', 'PMD_ESNIL': 'empty', 'PMD_ESI': 'empty', 'PMD_ESS': 'empty', 'PMD_ESB': 'empty', 'PMD_ETB': 'empty', 'PMD_EWS': 'empty', 'PMD_EO': 'basic', 'PMD_FLSBWL': 'basic', 'PMD_JI': 'basic', 'PMD_MNC': 'basic', 'PMD_OBEAH': 'basic', 'PMD_RFFB': 'basic', 'PMD_UIS': 'basic', 'PMD_UCT': 'unnecessary', 'PMD_UNCIE': 'unnecessary', 'PMD_UOOI': 'unnecessary', 'PMD_UOM': 'unnecessary', 'PMD_FLMUB': 'braces', 'PMD_IESMUB': 'braces', 'PMD_ISMUB': 'braces', 'PMD_WLMUB': 'braces', 'PMD_CTCNSE': 'clone', 'PMD_PCI': 'clone', 'PMD_AIO': 'controversial', 'PMD_AAA': 'controversial', 'PMD_APMP': 'controversial', 'PMD_AUNC': 'controversial', 'PMD_DP': 'controversial', 'PMD_DNCGCE': 'controversial', 'PMD_DIS': 'controversial', 'PMD_ODPL': 'controversial', 'PMD_SOE': 'controversial', 'PMD_UC': 'controversial', 'PMD_ACWAM': 'design', 'PMD_AbCWAM': 'design', 'PMD_ATNFS': 'design', 'PMD_ACI': 'design', 'PMD_AICICC': 'design', 'PMD_APFIFC': 'design', 'PMD_APMIFCNE': 'design', 'PMD_ARP': 'design', 'PMD_ASAML': 'design', 'PMD_BC': 'design', 'PMD_CWOPCSBF': 'design', 'PMD_ClR': 'design', 'PMD_CCOM': 'design', 'PMD_DLNLISS': 'design', 'PMD_EMIACSBA': 'design', 'PMD_EN': 'design', 'PMD_FDSBASOC': 'design', 'PMD_FFCBS': 'design', 'PMD_IO': 'design', 'PMD_IF': 'design', 'PMD_ITGC': 'design', 'PMD_LI': 'design', 'PMD_MBIS': 'design', 'PMD_MSMINIC': 'design', 'PMD_NCLISS': 'design', 'PMD_NSI': 'design', 'PMD_NTSS': 'design', 'PMD_OTAC': 'design', 'PMD_PLFICIC': 'design', 'PMD_PLFIC': 'design', 'PMD_PST': 'design', 'PMD_REARTN': 'design', 'PMD_SDFNL': 'design', 'PMD_SBE': 'design', 'PMD_SBR': 'design', 'PMD_SC': 'design', 'PMD_SF': 'design', 'PMD_SSSHD': 'design', 'PMD_TFBFASS': 'design', 'PMD_UEC': 'design', 'PMD_UEM': 'design', 'PMD_ULBR': 'design', 'PMD_USDF': 'design', 'PMD_UCIE': 'design', 'PMD_ULWCC': 'design', 'PMD_UNAION': 'design', 'PMD_UV': 'design', 'PMD_ACF': 'finalizers', 'PMD_EF': 'finalizers', 'PMD_FDNCSF': 'finalizers', 'PMD_FOCSF': 'finalizers', 'PMD_FO': 'finalizers', 'PMD_FSBP': 'finalizers', 'PMD_DIJL': 'imports', 'PMD_DI': 'imports', 'PMD_IFSP': 'imports', 'PMD_TMSI': 'imports', 'PMD_UFQN': 'imports', 'PMD_DNCSE': 'j2ee', 'PMD_LHNC': 'j2ee', 'PMD_LISNC': 'j2ee', 'PMD_MDBASBNC': 'j2ee', 'PMD_RINC': 'j2ee', 'PMD_RSINC': 'j2ee', 'PMD_SEJBFSBF': 'j2ee', 'PMD_JUASIM': 'junit', 'PMD_JUS': 'junit', 'PMD_JUSS': 'junit', 'PMD_JUTCTMA': 'junit', 'PMD_JUTSIA': 'junit', 'PMD_SBA': 'junit', 'PMD_TCWTC': 'junit', 'PMD_UBA': 'junit', 'PMD_UAEIOAT': 'junit', 'PMD_UANIOAT': 'junit', 'PMD_UASIOAT': 'junit', 'PMD_UATIOAE': 'junit', 'PMD_GDL': 'logging-jakarta-commons', 'PMD_GLS': 'logging-jakarta-commons', 'PMD_PL': 'logging-jakarta-commons', 'PMD_UCEL': 'logging-jakarta-commons', 'PMD_APST': 'logging-java', 'PMD_GLSJU': 'logging-java', 'PMD_LINSF': 'logging-java', 'PMD_MTOL': 'logging-java', 'PMD_SP': 'logging-java', 'PMD_MSVUID': 'javabeans', 'PMD_ADS': 'naming', 'PMD_AFNMMN': 'naming', 'PMD_AFNMTN': 'naming', 'PMD_BGMN': 'naming', 'PMD_CNC': 'naming', 'PMD_GN': 'naming', 'PMD_MeNC': 'naming', 'PMD_MWSNAEC': 'naming', 'PMD_NP': 'naming', 'PMD_PC': 'naming', 'PMD_SCN': 'naming', 'PMD_SMN': 'naming', 'PMD_SCFN': 'naming', 'PMD_SEMN': 'naming', 'PMD_SHMN': 'naming', 'PMD_VNC': 'naming', 'PMD_AES': 'optimizations', 'PMD_AAL': 'optimizations', 'PMD_RFI': 'optimizations', 'PMD_UWOC': 'optimizations', 'PMD_UALIOV': 'optimizations', 'PMD_UAAL': 'optimizations', 'PMD_USBFSA': 'optimizations', 'PMD_AISD': 'sunsecure', 'PMD_MRIA': 'sunsecure', 'PMD_ACGE': 'strictexception', 'PMD_ACNPE': 'strictexception', 'PMD_ACT': 'strictexception', 'PMD_ALEI': 'strictexception', 'PMD_ARE': 'strictexception', 'PMD_ATNIOSE': 'strictexception', 'PMD_ATNPE': 'strictexception', 'PMD_ATRET': 'strictexception', 'PMD_DNEJLE': 'strictexception', 'PMD_DNTEIF': 'strictexception', 'PMD_EAFC': 'strictexception', 'PMD_ADL': 'strings', 'PMD_ASBF': 'strings', 'PMD_CASR': 'strings', 'PMD_CLA': 'strings', 'PMD_ISB': 'strings', 'PMD_SBIWC': 'strings', 'PMD_StI': 'strings', 'PMD_STS': 'strings', 'PMD_UCC': 'strings', 'PMD_UETCS': 'strings', 'PMD_ClMMIC': 'typeresolution', 'PMD_LoC': 'typeresolution', 'PMD_SiDTE': 'typeresolution', 'PMD_UnI': 'typeresolution', 'PMD_ULV': 'unusedcode', 'PMD_UPF': 'unusedcode', 'PMD_UPM': 'unusedcode'}
 
 # mapping of pmd name to sourcemeter name
-PMD_NAME_TO_SM = {v['pmd_name']: k for k, v in PMD_RULES_SINCE.items()}
\ No newline at end of file
+PMD_NAME_TO_SM = {v['pmd_name']: k for k, v in PMD_RULES_SINCE.items()}
+# sourcemeter names of the rules of the old rulesets by category, expanded once
+PMD_OLD_RULESETS_SM = {category: frozenset(PMD_NAME_TO_SM[k.strip()] for k in pmd_names.split(',') if k.strip() in PMD_NAME_TO_SM.keys())
+                       for category, pmd_names in PMD_OLD_RULESETS.items()}
@@ -0,0 +1,138 @@
+"""Persistent cache of effective POM results keyed by the buildfiles of the checkout.
+
+Many buildfile change revisions have the same POM files (reverts, changes of other files in the same commit, re-runs).
+The key is a fingerprint of the blob hashes of all POM files in the tree of the revision together with the main POM file
+of the checkout (it may be copied from a custom POM name). The ruleset files read while parsing are stored with the entry
+and have to be unchanged for a hit. An entry holds the parsed states or the output of the MavenError, errors that can be
+caused by the network (timeouts, parents or plugins that could not be downloaded) are only stored for offline runs.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+from util.buildfile import CUSTOM_POM_NAMES
+from util.git import git_output
+
+
+CACHE_DIR = './data/effective_pom_cache'
+
+# increase if the parsing of the effective POM changes, older entries are not used anymore
+CACHE_VERSION = 1
+
+# MavenError types that only depend on the buildfiles of the revision
+DETERMINISTIC_ERROR_TYPES = {'parse', 'malformed', 'child'}
+
+
+def _file_digest(path):
+    if path is None or not os.path.isfile(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def buildfile_blobs(checkout_path, revision_hash, project_name):
+    """Return sorted (path, blob hash) of the POM files (pom.xml, custom POM names, .mvn configuration) in the tree of the revision."""
+    names = {'pom.xml'}
+    names.update(CUSTOM_POM_NAMES.get(project_name, {}).keys())
+
+    blobs = []
+    for line in git_output(checkout_path, ['ls-tree', '-r', '--full-tree', revision_hash]).split('\n'):
+        if not line:
+            continue
+        meta, path = line.split('\t', 1)
+        if path.split('/')[-1] in names or path.startswith('.mvn/') or '/.mvn/' in path:
+            blobs.append((path, meta.split(' ')[2]))
+    return sorted(blobs)
+
+
+class EffectivePomCache:
+    """On disk cache of effective POM results, one pickle file per fingerprint."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start counting the hits for a new project."""
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def fingerprint(self, checkout_path, pom, variant=None, repo_path=None):
+        """Return the key of the PomPom after its preflight check in the checkout of the revision.
+
+        variant separates entries that are created differently, e.g., by Maven or by the pom_resolver.
+        repo_path is the git repository of the revision if the checkout is not one (materialized buildfiles).
+        """
+        key = {
+            'version': CACHE_VERSION,
+            'project': pom.project_name,
+            'basedir': os.path.relpath(pom.basedir, checkout_path),
+            'pom': _file_digest(os.path.normpath(pom.basedir + '/pom.xml')),
+            'blobs': buildfile_blobs(repo_path or checkout_path, pom.revision_hash, pom.project_name),
+        }
+        if variant is not None:
+            key['variant'] = variant
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pickle')
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key, pom):
+        """Return the cached entry if the ruleset files the entry was parsed with are unchanged in the checkout of the PomPom."""
+        path = self._path(key)
+        if not os.path.isfile(path):
+            self._count('misses')
+            return None
+
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+
+        for rel_path_file, digest in entry['rulesets'].items():
+            if _file_digest(pom.resolve_ruleset(rel_path_file, verbose=False)) != digest:
+                self._count('stale')
+                return None
+
+        self._count('hits')
+        return entry
+
+    def put(self, key, pom, states=None, replacements=None, maven_error=None):
+        """Store the parsed states and replacements or the output of the MavenError.
+
+        Online a MavenError is only stored if its type is in DETERMINISTIC_ERROR_TYPES, the next run may not fail.
+        """
+        if maven_error is not None and not pom.offline and maven_error.type not in DETERMINISTIC_ERROR_TYPES:
+            return
+
+        entry = {'rulesets': {rel_path_file: _file_digest(file) for rel_path_file, file in pom.ruleset_files.items()}}
+        if maven_error is not None:
+            entry['maven_error'] = maven_error.output
+        else:
+            entry['states'] = states
+            entry['replacements'] = replacements
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp, path)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        hit_rate = self.hits / lookups if lookups else 0
+        return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'hit_rate': hit_rate}
+
+    def print_stats(self):
+        print('effective pom cache: {hits} hits, {misses} misses, {stale} stale rulesets ({hit_rate:.2%} hit rate)'.format(**self.stats()))
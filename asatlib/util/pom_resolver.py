@@ -0,0 +1,744 @@
+"""In process effective POM for the subset of the model parse_effective_pom reads.
+
+The effective POM is assembled like Maven does it: active profiles are injected into every POM of the parent lineage, the lineage
+is merged from the top (properties, dependencies, build and reporting plugins with their configuration), expressions are
+interpolated, build directories are aligned to the basedir and the pluginManagement is injected into the build plugins.
+Modules are resolved recursively and sorted like the Maven reactor. The output has the format of mvn help:effective-pom.
+
+Parent POMs outside of the repository are only read from the local Maven repository. Everything that is not supported,
+e.g., a missing parent, version ranges or an unknown profile activation, raises ResolutionError so that Maven can be used instead.
+Lifecycle plugins Maven adds to every build and elements parse_effective_pom does not read are not part of the output.
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from lxml import etree
+
+from util.buildfile import fix_parent_coordinates, LOCAL_REPOSITORY
+
+
+NS = 'http://maven.apache.org/POM/4.0.0'
+NSMAP = {'m': NS}
+
+# used for jdk profile activation and ${java.version}
+JDK_VERSION = '1.8.0'
+OS_FAMILIES = {'unix'}
+OS_NAME = 'linux'
+OS_ARCH = 'amd64'
+
+DEFAULT_PLUGIN_GROUP = 'org.apache.maven.plugins'
+
+# build directories Maven aligns to the basedir
+BUILD_DIRECTORIES = ['directory', 'outputDirectory', 'testOutputDirectory', 'sourceDirectory', 'testSourceDirectory', 'scriptSourceDirectory']
+
+# defaults of the Maven super POM
+SUPER_BUILD = {
+    'directory': '${project.basedir}/target',
+    'outputDirectory': '${project.build.directory}/classes',
+    'testOutputDirectory': '${project.build.directory}/test-classes',
+    'sourceDirectory': '${project.basedir}/src/main/java',
+    'scriptSourceDirectory': '${project.basedir}/src/main/scripts',
+    'testSourceDirectory': '${project.basedir}/src/test/java',
+}
+
+# elements of the project in the order of the output, everything else is dropped
+OUTPUT_ELEMENTS = ['modelVersion', 'parent', 'groupId', 'artifactId', 'version', 'packaging', 'name', 'modules', 'properties',
+                   'dependencyManagement', 'dependencies', 'build', 'reporting', 'profiles']
+
+EXPRESSION = re.compile(r'\$\{([^}]+)\}')
+
+
+class ResolutionError(Exception):
+    pass
+
+
+def _tag(name):
+    return '{{{}}}{}'.format(NS, name)
+
+
+def _local(element):
+    return etree.QName(element).localname
+
+
+def _child(element, name):
+    if element is None:
+        return None
+    return element.find(_tag(name))
+
+
+def _children(element, name):
+    if element is None:
+        return []
+    return element.findall(_tag(name))
+
+
+def _text(element, path, default=None):
+    if element is None:
+        return default
+    found = element.find(path, namespaces=NSMAP)
+    if found is None or found.text is None:
+        return default
+    return found.text.strip()
+
+
+def _elements(element):
+    return [c for c in element if isinstance(c.tag, str)]
+
+
+def _set_child(element, name, child):
+    """Replace the child with the given name or append it."""
+    old = _child(element, name)
+    if old is not None:
+        element.replace(old, child)
+    else:
+        element.append(child)
+
+
+# parsed POM files by sha1 of their content, the least recently used are dropped above RAW_POM_CACHE_SIZE
+RAW_POM_CACHE_SIZE = 2000
+_RAW_POMS = OrderedDict()
+# the worktrees of a project read POMs from multiple threads
+_RAW_POMS_LOCK = threading.Lock()
+
+
+def read_pom(path):
+    """Return a copy of the POM file as element with comments removed and all elements in the POM namespace."""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        raise ResolutionError('{} not found'.format(path))
+
+    digest = hashlib.sha1(content).digest()
+    with _RAW_POMS_LOCK:
+        root = _RAW_POMS.get(digest)
+        if root is not None:
+            _RAW_POMS.move_to_end(digest)
+    if root is None:
+        # same decoding as _replace_parent_in_pom
+        data = content.decode('utf-8', 'ignore')
+        try:
+            parser = etree.XMLParser(remove_comments=True, remove_pis=True)
+            root = etree.fromstring(data.encode('utf-8'), parser)
+        except etree.XMLSyntaxError as e:
+            raise ResolutionError('non-parseable POM {}: {}'.format(path, e))
+
+        for element in root.iter():
+            if isinstance(element.tag, str):
+                element.tag = _tag(_local(element))
+        etree.cleanup_namespaces(root)
+        with _RAW_POMS_LOCK:
+            _RAW_POMS[digest] = root
+            if len(_RAW_POMS) > RAW_POM_CACHE_SIZE:
+                _RAW_POMS.popitem(last=False)
+    return copy.deepcopy(root)
+
+
+def merge_dom(dominant, recessive):
+    """Merge plugin configuration like Xpp3Dom.mergeXpp3Dom, dominant is modified and returned."""
+    if recessive is None:
+        return dominant
+    if dominant is None:
+        return copy.deepcopy(recessive)
+    if dominant.get('combine.self') == 'override':
+        return dominant
+
+    if not (dominant.text or '').strip() and (recessive.text or '').strip():
+        dominant.text = recessive.text
+    for k, v in recessive.attrib.items():
+        if k not in dominant.attrib.keys():
+            dominant.set(k, v)
+
+    recessive_children = _elements(recessive)
+    if dominant.get('combine.children') == 'append':
+        for child in recessive_children:
+            dominant.append(copy.deepcopy(child))
+        return dominant
+
+    # children with the same name are merged by position, the others are appended
+    common = {}
+    for child in recessive_children:
+        same = [c for c in _elements(dominant) if c.tag == child.tag]
+        if same and child.tag not in common.keys():
+            common[child.tag] = iter(same)
+    for child in recessive_children:
+        if child.tag not in common.keys():
+            dominant.append(copy.deepcopy(child))
+        else:
+            match = next(common[child.tag], None)
+            if match is not None:
+                merge_dom(match, child)
+    return dominant
+
+
+def plugin_key(plugin):
+    return '{}:{}'.format(_text(plugin, 'm:groupId', DEFAULT_PLUGIN_GROUP), _text(plugin, 'm:artifactId', ''))
+
+
+def dependency_key(dependency):
+    return ':'.join([_text(dependency, 'm:groupId', ''), _text(dependency, 'm:artifactId', ''), _text(dependency, 'm:type', 'jar'), _text(dependency, 'm:classifier', '')])
+
+
+def _merge_keyed(target, source, key, merge, source_dominant, inheritance):
+    """Merge two lists of keyed elements like the Maven model merger, returns the new list.
+
+    Source elements without a counterpart in target are kept before the next common element or at the end.
+    """
+    master = {}
+    for element in target:
+        master[key(element)] = element
+
+    predecessors = {}
+    pending = []
+    for element in source:
+        if inheritance and _text(element, 'm:inherited', 'true') == 'false':
+            continue
+        k = key(element)
+        if k in master.keys():
+            if source_dominant:
+                master[k] = merge(copy.deepcopy(element), master[k])
+            else:
+                master[k] = merge(master[k], element)
+            if pending:
+                predecessors[k] = pending
+                pending = []
+        else:
+            pending.append(copy.deepcopy(element))
+
+    result = []
+    for k, element in master.items():
+        result += predecessors.get(k, [])
+        result.append(element)
+    return result + pending
+
+
+def _execution_key(execution):
+    return _text(execution, 'm:id', 'default')
+
+
+def merge_plugin(dominant, recessive):
+    """Merge recessive into the dominant plugin (version, configuration, dependencies, executions, report sets)."""
+    for name in ['version', 'extensions', 'inherited']:
+        if _child(dominant, name) is None and _child(recessive, name) is not None:
+            dominant.append(copy.deepcopy(_child(recessive, name)))
+
+    configuration = merge_dom(_child(dominant, 'configuration'), _child(recessive, 'configuration'))
+    if configuration is not None:
+        _set_child(dominant, 'configuration', configuration)
+
+    for container, item, key, merge in [('dependencies', 'dependency', dependency_key, _keep_first), ('executions', 'execution', _execution_key, _merge_execution),
+                                        ('reportSets', 'reportSet', _execution_key, _merge_execution)]:
+        source = _children(_child(recessive, container), item)
+        if not source:
+            continue
+        merged = _merge_keyed(_children(_child(dominant, container), item), source, key, merge, False, True)
+        new = etree.Element(_tag(container))
+        for element in merged:
+            new.append(element)
+        _set_child(dominant, container, new)
+    return dominant
+
+
+def _merge_execution(dominant, recessive):
+    for name in ['phase', 'inherited']:
+        if _child(dominant, name) is None and _child(recessive, name) is not None:
+            dominant.append(copy.deepcopy(_child(recessive, name)))
+
+    goals = _child(dominant, 'goals')
+    recessive_goals = _child(recessive, 'goals')
+    if recessive_goals is not None:
+        if goals is None:
+            goals = etree.SubElement(dominant, _tag('goals'))
+        existing = {g.text for g in _children(goals, 'goal')}
+        for goal in _children(recessive_goals, 'goal'):
+            if goal.text not in existing:
+                goals.append(copy.deepcopy(goal))
+
+    configuration = merge_dom(_child(dominant, 'configuration'), _child(recessive, 'configuration'))
+    if configuration is not None:
+        _set_child(dominant, 'configuration', configuration)
+    return dominant
+
+
+def _merge_list(target_parent, source_parent, container, item, key, merge, source_dominant, inheritance):
+    """Merge the keyed items of source_parent/container into target_parent/container."""
+    source = _children(_child(source_parent, container), item)
+    if not source:
+        return
+    target = _children(_child(target_parent, container), item)
+    merged = _merge_keyed(target, source, key, merge, source_dominant, inheritance)
+
+    new = etree.Element(_tag(container))
+    for element in merged:
+        new.append(element)
+    _set_child(target_parent, container, new)
+
+
+def _keep_first(dominant, recessive):
+    return dominant
+
+
+def _ensure(element, name):
+    child = _child(element, name)
+    if child is None:
+        child = etree.SubElement(element, _tag(name))
+    return child
+
+
+def _merge_plugin_containers(target, source, source_dominant, inheritance):
+    """Merge plugins and pluginManagement of a build or reporting element."""
+    _merge_list(target, source, 'plugins', 'plugin', plugin_key, merge_plugin, source_dominant, inheritance)
+    management = _child(source, 'pluginManagement')
+    if management is not None:
+        _merge_list(_ensure(target, 'pluginManagement'), management, 'plugins', 'plugin', plugin_key, merge_plugin, source_dominant, inheritance)
+
+
+def merge_model(target, source, source_dominant, inheritance):
+    """Merge the parent model (inheritance) or a profile (source_dominant) into the target model."""
+    if inheritance:
+        for name in ['groupId', 'version']:
+            if _child(target, name) is None and _child(source, name) is not None:
+                target.append(copy.deepcopy(_child(source, name)))
+
+    properties = _child(source, 'properties')
+    if properties is not None:
+        target_properties = _ensure(target, 'properties')
+        existing = {p.tag: p for p in _elements(target_properties)}
+        for p in _elements(properties):
+            if p.tag not in existing.keys():
+                target_properties.append(copy.deepcopy(p))
+            elif source_dominant:
+                target_properties.replace(existing[p.tag], copy.deepcopy(p))
+
+    _merge_list(target, source, 'dependencies', 'dependency', dependency_key, _keep_first, source_dominant, False)
+    management = _child(source, 'dependencyManagement')
+    if management is not None:
+        _merge_list(_ensure(target, 'dependencyManagement'), management, 'dependencies', 'dependency', dependency_key, _keep_first,
+                    source_dominant, False)
+
+    if not inheritance:
+        modules = _child(source, 'modules')
+        if modules is not None:
+            target_modules = _ensure(target, 'modules')
+            existing = {m.text for m in _children(target_modules, 'module')}
+            for m in _children(modules, 'module'):
+                if m.text not in existing:
+                    target_modules.append(copy.deepcopy(m))
+
+    build = _child(source, 'build')
+    if build is not None:
+        target_build = _ensure(target, 'build')
+        for name in BUILD_DIRECTORIES + ['finalName', 'defaultGoal', 'resources', 'testResources', 'filters']:
+            if _child(build, name) is None:
+                continue
+            if _child(target_build, name) is None:
+                target_build.append(copy.deepcopy(_child(build, name)))
+            elif source_dominant:
+                _set_child(target_build, name, copy.deepcopy(_child(build, name)))
+        _merge_list(target_build, build, 'extensions', 'extension', dependency_key, _keep_first, source_dominant, False)
+        _merge_plugin_containers(target_build, build, source_dominant, inheritance)
+
+    reporting = _child(source, 'reporting')
+    if reporting is not None:
+        target_reporting = _ensure(target, 'reporting')
+        for name in ['outputDirectory', 'excludeDefaults']:
+            if _child(reporting, name) is not None and _child(target_reporting, name) is None:
+                target_reporting.append(copy.deepcopy(_child(reporting, name)))
+        _merge_list(target_reporting, reporting, 'plugins', 'plugin', plugin_key, merge_plugin, source_dominant, inheritance)
+
+
+def _version_tuple(version):
+    return tuple(int(x) for x in re.findall(r'\d+', version))
+
+
+def _jdk_active(spec):
+    spec = spec.strip()
+    if spec.startswith('!'):
+        return not _jdk_active(spec[1:])
+    if not spec.startswith(('[', '(')):
+        return JDK_VERSION.startswith(spec)
+
+    # version ranges, e.g. [1.8,) or (,1.7]
+    current = _version_tuple(JDK_VERSION)
+    for part in re.findall(r'[\[(][^\])]*[\])]', spec):
+        lower, _, upper = part[1:-1].partition(',')
+        if ',' not in part:
+            upper = lower
+        ok = True
+        if lower.strip():
+            low = _version_tuple(lower)
+            ok = ok and (current[:len(low)] >= low if part[0] == '[' else current[:len(low)] > low)
+        if upper.strip():
+            up = _version_tuple(upper)
+            ok = ok and (current[:len(up)] <= up if part[-1] == ']' else current[:len(up)] < up)
+        if ok:
+            return True
+    return False
+
+
+def _os_active(os_element):
+    for name in ['family', 'name', 'arch', 'version']:
+        value = _text(os_element, 'm:' + name)
+        if value is None:
+            continue
+        negate = value.startswith('!')
+        value = value.lstrip('!').lower()
+        if name == 'family':
+            result = value in OS_FAMILIES
+        elif name == 'name':
+            result = value == OS_NAME
+        elif name == 'arch':
+            result = value == OS_ARCH
+        else:
+            raise ResolutionError('os version activation is not supported')
+        if result == negate:
+            return False
+    return True
+
+
+def profile_active(profile, basedir, system_properties):
+    """Return True if all conditions of the profile activation are met, None if it has no conditions."""
+    activation = _child(profile, 'activation')
+    if activation is None:
+        return None
+
+    conditions = []
+    jdk = _text(activation, 'm:jdk')
+    if jdk is not None:
+        conditions.append(_jdk_active(jdk))
+
+    os_element = _child(activation, 'os')
+    if os_element is not None:
+        conditions.append(_os_active(os_element))
+
+    prop = _child(activation, 'property')
+    if prop is not None:
+        name = _text(prop, 'm:name', '')
+        value = _text(prop, 'm:value')
+        negate = name.startswith('!')
+        actual = system_properties.get(name.lstrip('!'))
+        if value is None:
+            result = actual is not None
+        elif value.startswith('!'):
+            result = actual != value[1:]
+        else:
+            result = actual == value
+        conditions.append(result != negate)
+
+    file_element = _child(activation, 'file')
+    if file_element is not None:
+        for name, should_exist in [('exists', True), ('missing', False)]:
+            path = _text(file_element, 'm:' + name)
+            if path is None:
+                continue
+            path = path.replace('${basedir}', basedir).replace('${project.basedir}', basedir)
+            if '${' in path:
+                raise ResolutionError('file activation with expression {}'.format(path))
+            if not os.path.isabs(path):
+                path = os.path.join(basedir, path)
+            conditions.append(os.path.exists(path) == should_exist)
+
+    if not conditions:
+        return None
+    return all(conditions)
+
+
+def inject_profiles(raw, basedir, system_properties):
+    """Inject the active profiles of the POM (activeByDefault profiles only if no other profile is active)."""
+    profiles = _children(_child(raw, 'profiles'), 'profile')
+    active = [p for p in profiles if profile_active(p, basedir, system_properties)]
+    if not active:
+        active = [p for p in profiles if _text(p, 'm:activation/m:activeByDefault', 'false') == 'true']
+    for profile in active:
+        merge_model(raw, profile, True, False)
+
+
+def system_properties():
+    props = {'java.version': JDK_VERSION, 'java.specification.version': '.'.join(JDK_VERSION.split('.')[:2]),
+             'os.name': OS_NAME, 'os.arch': OS_ARCH, 'file.separator': '/', 'path.separator': ':', 'line.separator': '\n',
+             'user.home': os.path.expanduser('~'), 'user.dir': os.getcwd()}
+    for k, v in os.environ.items():
+        props['env.' + k] = v
+    return props
+
+
+class Interpolator:
+    """Replace ${...} expressions like the Maven model interpolator, unresolved expressions are kept."""
+
+    def __init__(self, model, basedir, system_properties):
+        self.model = model
+        self.basedir = basedir
+        self.system_properties = system_properties
+        self.properties = {_local(p): p.text or '' for p in _elements(_child(model, 'properties'))} if _child(model, 'properties') is not None else {}
+        self.aligned = {}
+
+    def _model_value(self, path):
+        if path in ['basedir']:
+            return self.basedir
+        if path.startswith('build.') and path[len('build.'):] in self.aligned.keys():
+            return self.aligned[path[len('build.'):]]
+        element = self.model
+        for name in path.split('.'):
+            element = _child(element, name)
+            if element is None:
+                return None
+        if _elements(element):
+            return None
+        return element.text or ''
+
+    def value(self, expression):
+        if expression in ['basedir', 'project.basedir', 'pom.basedir']:
+            return self.basedir
+        if expression in ['project.baseUri', 'pom.baseUri']:
+            return 'file://' + self.basedir + '/'
+        for prefix in ['project.', 'pom.']:
+            if expression.startswith(prefix):
+                return self._model_value(expression[len(prefix):])
+        if expression in self.properties.keys():
+            return self.properties[expression]
+        if expression in self.system_properties.keys():
+            return self.system_properties[expression]
+        # deprecated unprefixed model expressions, e.g. ${version}
+        return self._model_value(expression)
+
+    def interpolate(self, text, seen=()):
+        def replace(match):
+            expression = match.group(1)
+            if expression in seen:
+                return match.group(0)
+            value = self.value(expression)
+            if value is None:
+                return match.group(0)
+            return self.interpolate(value, seen + (expression,))
+        return EXPRESSION.sub(replace, text)
+
+    def align_build_directories(self):
+        build = _ensure(self.model, 'build')
+        for name in BUILD_DIRECTORIES:
+            element = _child(build, name)
+            if element is None:
+                element = etree.SubElement(build, _tag(name))
+                element.text = SUPER_BUILD[name]
+        # directory first, the other defaults refer to it
+        for name in BUILD_DIRECTORIES:
+            element = _child(build, name)
+            value = self.interpolate((element.text or '').strip())
+            if not os.path.isabs(value):
+                value = os.path.join(self.basedir, value)
+            element.text = value
+            self.aligned[name] = value
+
+    def apply(self, element):
+        for e in element.iter():
+            if not isinstance(e.tag, str):
+                continue
+            if e.text and '${' in e.text:
+                e.text = self.interpolate(e.text)
+            for k, v in e.attrib.items():
+                if '${' in v:
+                    e.set(k, self.interpolate(v))
+
+
+class Resolver:
+    """Effective POMs of the POM files of one checkout."""
+
+    def __init__(self, local_repository=LOCAL_REPOSITORY):
+        self.local_repository = local_repository
+        self.system_properties = system_properties()
+        # the POM file whose parent may be fixed like create_effective_pom does it, its modules see the fixed parent, too
+        self.main_pom = None
+
+    def repository_pom(self, group_id, artifact_id, version):
+        if not version or any(c in version for c in '[(,'):
+            raise ResolutionError('parent version {} is not supported'.format(version))
+        path = os.path.join(self.local_repository, *group_id.split('.'), artifact_id, version, '{}-{}.pom'.format(artifact_id, version))
+        if not os.path.isfile(path):
+            raise ResolutionError('parent {}:{}:{} not in local repository'.format(group_id, artifact_id, version))
+        return path
+
+    def _coordinates(self, raw):
+        group_id = _text(raw, 'm:groupId') or _text(raw, 'm:parent/m:groupId')
+        version = _text(raw, 'm:version') or _text(raw, 'm:parent/m:version')
+        return group_id, _text(raw, 'm:artifactId'), version
+
+    def parent_pom(self, raw, pom_path, fix_parent=False):
+        """Return path of the parent POM of raw and the replacements that were needed to find it."""
+        parent = _child(raw, 'parent')
+        group_id, artifact_id, version = _text(parent, 'm:groupId', ''), _text(parent, 'm:artifactId', ''), _text(parent, 'm:version', '')
+
+        relative = _text(parent, 'm:relativePath', '../pom.xml')
+        if relative:
+            candidate = os.path.normpath(os.path.join(os.path.dirname(pom_path), relative))
+            if os.path.isdir(candidate):
+                candidate = os.path.join(candidate, 'pom.xml')
+            if os.path.isfile(candidate):
+                if self._coordinates(read_pom(candidate)) == (group_id, artifact_id, version):
+                    return candidate, []
+
+        try:
+            return self.repository_pom(group_id, artifact_id, version), []
+        except ResolutionError:
+            if not fix_parent:
+                raise
+
+        # same replacements create_effective_pom writes into the main pom.xml before the second Maven run
+        _, new_artifact_id, new_version, replacements = fix_parent_coordinates(group_id, artifact_id, version, _child(parent, 'relativePath') is not None)
+        if not replacements:
+            raise ResolutionError('parent {}:{}:{} not in local repository'.format(group_id, artifact_id, version))
+        _child(parent, 'artifactId').text = new_artifact_id
+        if new_version != version:
+            _child(parent, 'version').text = new_version
+        return self.repository_pom(group_id, new_artifact_id, new_version), replacements
+
+    def lineage(self, pom_path):
+        """Return the raw models of the POM and its parents with injected profiles and the replacements of the parent."""
+        models = []
+        replacements = []
+        seen = set()
+        path = pom_path
+        while True:
+            if path in seen:
+                raise ResolutionError('parent cycle at {}'.format(path))
+            seen.add(path)
+
+            raw = read_pom(path)
+            basedir = os.path.dirname(path)
+            parent_path = None
+            if _child(raw, 'parent') is not None:
+                parent_path, r = self.parent_pom(raw, path, fix_parent=path == self.main_pom)
+                replacements += r
+            inject_profiles(raw, basedir, self.system_properties)
+            models.append(raw)
+            if parent_path is None:
+                return models, replacements
+            path = parent_path
+
+    def effective_model(self, pom_path):
+        """Return the effective model of the POM file and the replacements of its parent."""
+        basedir = os.path.dirname(pom_path)
+        raw_profiles = _child(read_pom(pom_path), 'profiles')
+        models, replacements = self.lineage(pom_path)
+
+        model = models[0]
+        for parent in models[1:]:
+            merge_model(model, parent, False, True)
+
+        interpolator = Interpolator(model, basedir, self.system_properties)
+        interpolator.align_build_directories()
+        interpolator.apply(model)
+
+        # plugin management injection
+        build = _child(model, 'build')
+        managed = {plugin_key(p): p for p in _children(_child(_child(build, 'pluginManagement'), 'plugins'), 'plugin')}
+        for plugin in _children(_child(build, 'plugins'), 'plugin'):
+            if plugin_key(plugin) in managed.keys():
+                merge_plugin(plugin, managed[plugin_key(plugin)])
+
+        # profiles are not inherited, the effective POM lists the profiles of the POM itself
+        if _child(model, 'profiles') is not None:
+            model.remove(_child(model, 'profiles'))
+        if raw_profiles is not None:
+            interpolator.apply(raw_profiles)
+            model.append(raw_profiles)
+        return model, replacements
+
+    def reactor(self, pom_path, fix_parent=False):
+        """Return the effective models of the POM and its modules in reactor order and the replacements of the main POM."""
+        collected = []
+        replacements = []
+        seen = set()
+
+        def collect(path, main):
+            if path in seen:
+                return
+            seen.add(path)
+            model, r = self.effective_model(path)
+            collected.append(model)
+            if main:
+                replacements.extend(r)
+            for module in _children(_child(model, 'modules'), 'module'):
+                module_path = os.path.normpath(os.path.join(os.path.dirname(path), (module.text or '').strip()))
+                if os.path.isdir(module_path):
+                    module_path = os.path.join(module_path, 'pom.xml')
+                if not os.path.isfile(module_path):
+                    raise ResolutionError('child module {} of {} does not exist'.format(module_path, path))
+                collect(module_path, False)
+
+        self.main_pom = os.path.normpath(pom_path) if fix_parent else None
+        collect(os.path.normpath(pom_path), True)
+        return sort_reactor(collected), replacements
+
+
+def _ga(element):
+    return '{}:{}'.format(_text(element, 'm:groupId', ''), _text(element, 'm:artifactId', ''))
+
+
+def sort_reactor(models):
+    """Order the models like the Maven ProjectSorter, projects after the reactor projects they depend on."""
+    index = {_ga(m): i for i, m in enumerate(models)}
+    edges = []
+    for m in models:
+        deps = []
+        parent = _child(m, 'parent')
+        if parent is not None:
+            deps.append(_ga(parent))
+        deps += [_ga(d) for d in _children(_child(m, 'dependencies'), 'dependency')]
+        build = _child(m, 'build')
+        for plugin in _children(_child(build, 'plugins'), 'plugin'):
+            deps.append('{}:{}'.format(_text(plugin, 'm:groupId', DEFAULT_PLUGIN_GROUP), _text(plugin, 'm:artifactId', '')))
+            deps += [_ga(d) for d in _children(_child(plugin, 'dependencies'), 'dependency')]
+        deps += [_ga(e) for e in _children(_child(build, 'extensions'), 'extension')]
+        edges.append([index[d] for d in deps if d in index.keys() and index[d] != index[_ga(m)]])
+
+    order = []
+    state = [0] * len(models)
+
+    def visit(i):
+        if state[i] == 2:
+            return
+        if state[i] == 1:
+            raise ResolutionError('cycle in reactor at {}'.format(_ga(models[i])))
+        state[i] = 1
+        for j in edges[i]:
+            visit(j)
+        state[i] = 2
+        order.append(models[i])
+
+    for i in range(len(models)):
+        visit(i)
+    return order
+
+
+def _output_project(model):
+    project = etree.Element(_tag('project'), nsmap={None: NS, 'xsi': 'http://www.w3.org/2001/XMLSchema-instance'})
+    project.set('{http://www.w3.org/2001/XMLSchema-instance}schemaLocation', 'http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd')
+    for name in OUTPUT_ELEMENTS:
+        element = _child(model, name)
+        if element is not None:
+            project.append(element)
+    return project
+
+
+def effective_pom_output(models):
+    """Return the effective POMs in the output format of mvn help:effective-pom."""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>']
+    if len(models) == 1:
+        lines.append(etree.tostring(_output_project(models[0]), pretty_print=True, encoding='unicode'))
+    else:
+        lines.append('<projects>')
+        for model in models:
+            lines.append(etree.tostring(_output_project(model), pretty_print=True, encoding='unicode'))
+        lines.append('</projects>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def create_effective_pom(basedir, local_repository=LOCAL_REPOSITORY):
+    """Return effective POM output and replacements like PomPom.create_effective_pom, raises ResolutionError if it is not supported."""
+    basedir = os.path.realpath(basedir)
+    resolver = Resolver(local_repository)
+    models, replacements = resolver.reactor(os.path.join(basedir, 'pom.xml'), fix_parent=True)
+    return effective_pom_output(models), replacements
@@ -0,0 +1,60 @@
+"""Projects of the study, shared by the extraction scripts."""
+
+# (project name, last commit of the commit path or None for origin/HEAD)
+PROJECTS = [
+    ('commons-bcel', None),
+    ('commons-vfs', None),
+    ('commons-jcs', None),
+    ('commons-beanutils', None),
+    ('commons-codec', None),
+    ('commons-collections', None),
+    ('commons-compress', None),
+    ('commons-configuration', None),
+    ('commons-dbcp', None),
+    ('commons-digester', None),
+    ('commons-imaging', None),
+    ('commons-io', None),
+    ('commons-jexl', None),
+    ('commons-lang', None),
+    ('commons-math', 'c4218b83851c8dba1f275e3095913d9636aa5000'),
+    ('commons-net', None),
+    ('commons-rdf', None),
+    ('commons-scxml', None),
+    ('commons-validator', None),
+    ('falcon', None),
+    ('jspwiki', None),
+    ('kylin', None),
+    ('mahout', None),
+    ('pdfbox', None),
+    ('ranger', None),
+    ('struts', None),
+    ('systemml', None),
+    ('tez', None),
+    ('tika', None),
+    ('wss4j', None),
+    ('eagle', None),
+    ('cayenne', None),
+    ('opennlp', None),
+    ('calcite', None),
+    ('zeppelin', None),
+    ('flume', None),
+    ('parquet-mr', None),
+    ('storm', None),
+    ('lens', None),
+    ('knox', None),
+    ('giraph', None),
+    ('gora', None),
+    ('helix', None),
+    ('archiva', None),
+    ('santuario-java', None),
+    ('phoenix', None),
+    ('manifoldcf', None),
+    ('httpcomponents-client', None),
+    ('httpcomponents-core', None),
+    ('streams', None),
+    ('mina-sshd', None),
+    ('roller', None),
+    ('jena', None),
+    ('nifi', None),
+]
+
@@ -0,0 +1,119 @@
+"""Run the per project extraction of a script for all projects, optionally in a process pool.
+
+Projects are independent of each other. Every project runs in a fresh worker process with its own MongoDB connection,
+a failing project is reported together with the timings at the end instead of aborting the other projects.
+"""
+import datetime
+import multiprocessing
+import timeit
+import traceback
+
+from mongoengine import connect, disconnect
+
+from util.cost import CostEstimator, longest_first, estimated_makespan
+
+
+_WORKER = {}
+
+
+def _init_connection(connection):
+    if connection is not None:
+        # the client of the parent process must not be shared after the fork
+        disconnect()
+        connect(**connection)
+
+
+def _init_worker(func, connection):
+    _WORKER['func'] = func
+    _init_connection(connection)
+
+
+def _run_project(project):
+    project_name, last_commit = project
+    start = timeit.default_timer()
+    result = {'project': project_name, 'seconds': None, 'error': None, 'traceback': None, 'value': None}
+    try:
+        result['value'] = _WORKER['func'](project_name, last_commit)
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+        print('[{}] failed: {}'.format(project_name, result['error']))
+    result['seconds'] = timeit.default_timer() - start
+    return result
+
+
+def run_projects(func, projects, processes=1, connection=None, stage=None):
+    """
+    Call func(project_name, last_commit) for every project and return per project timings, failures and return values.
+
+    With processes > 1 the projects are distributed over a process pool, func has to be a module level function then.
+    connection are the mongoengine connect arguments used to open a new connection in each worker.
+    With a stage (see util.cost.STAGE_UNITS) and processes > 1 the runtime of every project is estimated before, the pool gets
+    the longest projects first and the timings are recorded for the next estimates. One process keeps the order of the projects.
+    """
+    estimator = None
+    if stage is not None and processes > 1:
+        estimator = CostEstimator(stage)
+        estimates = estimator.estimate(projects)
+        projects = longest_first(projects, estimates)
+        print_estimates(stage, projects, estimates, processes)
+
+    start = timeit.default_timer()
+    results = []
+    if processes <= 1:
+        _init_worker(func, None)
+        for project in projects:
+            results.append(_run_project(project))
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(func, connection), maxtasksperchild=1) as pool:
+            for result in pool.imap_unordered(_run_project, projects):
+                results.append(result)
+
+    if estimator is not None:
+        estimator.record(results)
+
+    print_summary(results, timeit.default_timer() - start)
+    return results
+
+
+def print_estimates(stage, projects, estimates, processes):
+    eta = datetime.timedelta(seconds=round(estimated_makespan(projects, estimates, processes)))
+    print('estimated runtime of {} for {} projects with {} processes: {}'.format(stage, len(projects), processes, eta))
+    for project_name, _ in projects:
+        print('{:<25} {:>14}'.format(project_name, str(datetime.timedelta(seconds=round(estimates[project_name])))))
+
+
+def print_summary(results, elapsed):
+    failed = [r for r in results if r['error']]
+    print('finished {} projects in {:.5f}s, {} failed'.format(len(results), elapsed, len(failed)))
+    for r in sorted(results, key=lambda r: r['seconds'], reverse=True):
+        print('{:<25} {:>12.5f}s {}'.format(r['project'], r['seconds'], r['error'] or 'OK'))
+    for r in failed:
+        print('--- {} ---'.format(r['project']))
+        print(r['traceback'])
+
+
+def ordered_map(func, items, processes=1, connection=None):
+    """
+    Return [func(item) for item in items], computed in a process pool with its own MongoDB connection per process.
+
+    func has to be a module level function. Inside a worker of run_projects (pool processes can not have children)
+    or with one process the items are processed in this process.
+    """
+    if processes <= 1 or multiprocessing.current_process().daemon:
+        return [func(item) for item in items]
+    with multiprocessing.Pool(processes, initializer=_init_connection, initargs=(connection,)) as pool:
+        return pool.map(func, items, chunksize=1)
+
+
+def split_contiguous(items, parts):
+    """Split the list into at most parts contiguous parts of nearly the same size."""
+    parts = max(1, min(parts, len(items)))
+    size, rest = divmod(len(items), parts)
+    ret = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < rest else 0)
+        ret.append(items[start:end])
+        start = end
+    return ret
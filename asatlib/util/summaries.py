@@ -0,0 +1,134 @@
+"""Materialized per file CodeEntityState warning and metric summaries.
+
+A file CodeEntityState always yields the same warning histogram and metrics, instead of unwinding its linter array for every revision
+the summary is built once into a side collection keyed by the CodeEntityState id.
+"""
+import timeit
+
+from pymongo import ReplaceOne
+
+from pycoshark.mongomodels import CodeEntityState
+
+
+# keyed by the CodeEntityState _id, the _id index serves the $in lookups
+SUMMARY_COLLECTION = 'code_entity_state_file_summary'
+PROGRESS_COLLECTION = 'code_entity_state_file_summary_progress'
+
+# read warnings and metrics from the summary collection instead of the CodeEntityStates, set after build_summaries
+USE_SUMMARIES = False
+
+# per file CES: long_name, LOC, LLOC, McCC and the warnings grouped by type
+SUMMARY_STAGES = [
+    {'$project': {'long_name': 1, 'metrics.LOC': 1, 'metrics.LLOC': 1, 'metrics.McCC': 1, 'linter.l_ty': 1}},
+    {'$unwind': {'path': '$linter', 'preserveNullAndEmptyArrays': True}},
+    {'$group': {'_id': {'ces': '$_id', 'type': '$linter.l_ty'},
+                'long_name': {'$first': '$long_name'},
+                'metrics': {'$first': '$metrics'},
+                'sum': {'$sum': {'$cond': [{'$eq': [{'$type': '$linter'}, 'missing']}, 0, 1]}}}},
+    {'$group': {'_id': '$_id.ces',
+                'long_name': {'$first': '$long_name'},
+                'metrics': {'$first': '$metrics'},
+                'warnings': {'$push': {'type': '$_id.type', 'sum': '$sum'}}}},
+    {'$addFields': {'metrics': {'$ifNull': ['$metrics', {}]},
+                    'warnings': {'$filter': {'input': '$warnings', 'as': 'w', 'cond': {'$gt': ['$$w.sum', 0]}}}}},
+]
+
+
+def _db():
+    return CodeEntityState._get_db()
+
+
+def summary_collection():
+    return _db()[SUMMARY_COLLECTION]
+
+
+def _supports_merge():
+    return tuple(_db().client.server_info()['versionArray'][:2]) >= (4, 2)
+
+
+def build_summaries(batch_size=50000):
+    """
+    Build the summary collection for all file CodeEntityStates.
+
+    The file CodeEntityStates are processed in batches in _id order, each batch is written with $merge (or bulk upserts before MongoDB 4.2)
+    and the last finished _id is stored in the progress collection. Running it again continues after the last finished batch.
+    """
+    ces = CodeEntityState._get_collection()
+    progress = _db()[PROGRESS_COLLECTION]
+    use_merge = _supports_merge()
+
+    state = progress.find_one({'_id': SUMMARY_COLLECTION}) or {'last_id': None, 'done': 0}
+    total = ces.count_documents({'ce_type': 'file'})
+    print('building {}: {} of {} file CodeEntityStates done'.format(SUMMARY_COLLECTION, state['done'], total))
+
+    start = timeit.default_timer()
+    while True:
+        query = {'ce_type': 'file'}
+        if state['last_id'] is not None:
+            query['_id'] = {'$gt': state['last_id']}
+
+        # upper bound of this batch
+        last = list(ces.find(query, {'_id': 1}).sort('_id', 1).skip(batch_size - 1).limit(1))
+        if not last:
+            last = list(ces.find(query, {'_id': 1}).sort('_id', -1).limit(1))
+        if not last:
+            break
+        last_id = last[0]['_id']
+        query.setdefault('_id', {})['$lte'] = last_id
+
+        pipeline = [{'$match': query}] + SUMMARY_STAGES
+        if use_merge:
+            pipeline.append({'$merge': {'into': SUMMARY_COLLECTION, 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}})
+            ces.aggregate(pipeline, allowDiskUse=True)
+            done = ces.count_documents(query)
+        else:
+            ops = [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in ces.aggregate(pipeline, allowDiskUse=True)]
+            if ops:
+                summary_collection().bulk_write(ops, ordered=False)
+            done = len(ops)
+
+        state = {'last_id': last_id, 'done': state['done'] + done}
+        progress.replace_one({'_id': SUMMARY_COLLECTION}, state, upsert=True)
+
+        elapsed = timeit.default_timer() - start
+        print('building {}: {} of {} file CodeEntityStates done ({:.1f}s)'.format(SUMMARY_COLLECTION, state['done'], total, elapsed))
+    return state['done']
+
+
+def get_summaries(ces_ids, batch_size=50000):
+    """Return the summaries of the given file CodeEntityStates from the summary collection."""
+    summaries = []
+    for i in range(0, len(ces_ids), batch_size):
+        summaries += list(summary_collection().find({'_id': {'$in': ces_ids[i:i + batch_size]}}))
+    return summaries
+
+
+def summary_warning_list(ces_ids):
+    """Same as util.metrics.get_warning_list but read from the summary collection."""
+    c = summary_collection().aggregate([
+        {'$match': {'_id': {'$in': ces_ids}}},
+        {'$unwind': '$warnings'},
+        {'$group': {'_id': '$warnings.type', 'sum': {'$sum': '$warnings.sum'}}},
+    ])
+    return [{'type': w['_id'], 'sum': w['sum']} for w in c]
+
+
+def summary_file_metrics(ces_ids):
+    """Same as util.metrics.get_file_metrics but read from the summary collection."""
+    ret = {}
+    c = summary_collection().aggregate([
+        {'$match': {'_id': {'$in': ces_ids}}},
+        {'$group': {'_id': 'null',
+                    'file_loc_sum': {'$sum': '$metrics.LOC'},
+                    'file_loc_avg': {'$avg': '$metrics.LOC'},
+                    'file_lloc_sum': {'$sum': '$metrics.LLOC'},
+                    'file_lloc_avg': {'$avg': '$metrics.LLOC'},
+                    'file_mccc_sum': {'$sum': '$metrics.McCC'},
+                    'file_mccc_avg': {'$avg': '$metrics.McCC'}}}
+    ])
+    try:
+        ret = c.next()
+    except StopIteration:
+        pass
+
+    return ret
@@ -0,0 +1,39 @@
+"""Additional git worktrees of a repository, they share the object store of the repository but have their own checkout."""
+import os
+import re
+
+from util.git import git_output
+
+
+WORKTREE_DIR = '../worktrees'
+
+
+def ensure_worktrees(repo_path, name, count, base=WORKTREE_DIR):
+    """Return paths of count worktrees of the repository, missing worktrees are added with a detached HEAD."""
+    git_output(repo_path, ['worktree', 'prune'])
+    paths = []
+    for i in range(count):
+        path = os.path.abspath(os.path.join(base, '{}.{}'.format(name, i)))
+        if not os.path.isdir(path):
+            os.makedirs(base, exist_ok=True)
+            git_output(repo_path, ['worktree', 'add', '--detach', '--force', path, 'HEAD'])
+        paths.append(path)
+    return paths
+
+
+def worktree_repository(name, index, base=WORKTREE_DIR):
+    """Return the local Maven repository of one worktree, concurrent Maven runs must not download into the same repository."""
+    return os.path.abspath(os.path.join(base, 'maven_repositories', '{}.{}'.format(name, index)))
+
+
+class PathRewrite:
+    """Replaces the absolute path of a worktree in tool output with the absolute path of the repository itself."""
+
+    def __init__(self, worktree_path, repo_path):
+        self.new = os.path.realpath(repo_path).encode('utf-8')
+        old = os.path.realpath(worktree_path).encode('utf-8')
+        # only whole path components, worktree .1 must not match worktree .10
+        self.pattern = re.compile(re.escape(old) + rb'(?![^/<>"\s])')
+
+    def __call__(self, output):
+        return self.pattern.sub(lambda m: self.new, output)